@@ -0,0 +1,143 @@
+"""
+准入控制（过载保护）
+
+写入接口和报表接口各有并发上限和有界的等待队列：超过上限的请求排队，队列已满或排队超时直接返回 503 和 Retry-After，
+不再在事件循环上无限堆积直到 nginx 超时。报表接口上限小、排队时间短，过载时快速失败，扫码写入始终有处理能力。
+其他接口（产品详情、参考数据、/metrics 等）不受限制。
+
+环境变量（<类别> 为 WRITE 或 REPORT）：
+    ADMISSION_ENABLED             为 0 时关闭，默认开启
+    ADMISSION_<类别>_LIMIT        同时处理的请求数，默认写入 64、报表 8
+    ADMISSION_<类别>_QUEUE        最多排队的请求数，默认写入 512、报表 16
+    ADMISSION_<类别>_TIMEOUT_MS   最长排队毫秒数，默认写入 10000、报表 1000
+    ADMISSION_RETRY_AFTER         503 响应的 Retry-After 秒数，默认 2
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+import metrics
+from database import env_int, env_float
+from responses import FastJSONResponse
+
+ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+RETRY_AFTER = max(1, env_int("ADMISSION_RETRY_AFTER", 2))
+BUSY_DETAIL = "服务繁忙，请稍后重试"
+
+REJECTED = metrics.register(metrics.Counter(
+    "admission_rejected_total", "准入控制拒绝的请求数", ("limiter", "reason")
+))
+WAIT = metrics.register(metrics.Histogram("admission_wait_seconds", "请求排队等待的时间", ("limiter",)))
+
+
+class Limiter:
+    """
+    并发上限 + 有界等待队列（先到先得），只在事件循环线程中使用
+    """
+
+    def __init__(self, name, limit, queue_size, timeout):
+        self.name = name
+        self.limit = max(1, limit)
+        self.queue_size = max(0, queue_size)
+        self.timeout = max(0.0, timeout)
+        self.active = 0
+        self._waiters = deque()
+
+    async def acquire(self):
+        """
+        取得处理名额返回 True；队列已满或排队超时返回 False
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return True
+        if len(self._waiters) >= self.queue_size:
+            REJECTED.inc(self.name, "queue_full")
+            return False
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            # release 把名额直接交给排在最前面的请求，active 不变
+            await asyncio.wait_for(future, self.timeout)
+            return True
+        except asyncio.TimeoutError:
+            self._discard(future)
+            REJECTED.inc(self.name, "timeout")
+            return False
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已拿到名额时客户端断开，名额交还
+                self.release()
+            else:
+                self._discard(future)
+            raise
+
+    def _discard(self, future):
+        try:
+            self._waiters.remove(future)
+        except ValueError:
+            pass
+
+    def release(self):
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            f"{self.name}_active": self.active,
+            f"{self.name}_waiting": len(self._waiters),
+            f"{self.name}_limit": self.limit,
+            f"{self.name}_queue_size": self.queue_size,
+        }
+
+
+def _limiter(name, limit, queue_size, timeout_ms):
+    prefix = f"ADMISSION_{name.upper()}"
+    return Limiter(
+        name,
+        env_int(f"{prefix}_LIMIT", limit),
+        env_int(f"{prefix}_QUEUE", queue_size),
+        env_float(f"{prefix}_TIMEOUT_MS", timeout_ms) / 1000,
+    )
+
+
+WRITE = _limiter("write", 64, 512, 10000)
+REPORT = _limiter("report", 8, 16, 1000)
+
+
+def stats():
+    return {**WRITE.stats(), **REPORT.stats()}
+
+
+class AdmissionMiddleware:
+    """
+    ASGI 中间件：按请求路径选用 Limiter，未列出的路径直接放行
+
+    流式响应在响应体发送完之前一直占用名额
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = dict(limits)
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limits.get(scope["path"]) if ENABLED and scope["type"] == "http" else None
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        if not await limiter.acquire():
+            response = FastJSONResponse(
+                {"detail": BUSY_DETAIL}, status_code=503, headers={"Retry-After": str(RETRY_AFTER)}
+            )
+            await response(scope, receive, send)
+            return
+        WAIT.observe(time.perf_counter() - start, limiter.name)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
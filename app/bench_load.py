@@ -0,0 +1,380 @@
+"""
+压测驱动
+
+按设定的并发数对各接口施加混合负载，输出吞吐量和 p50/p95/p99 延迟（JSON，便于不同版本对比）。
+数据先用 bench_seed.py 生成，--products / --employees / --seed 与生成时一致。
+
+负载组合（--mix）：
+    mixed   扫码查询+录入、批量录入、今日计数轮询、月度报表、基础数据，按现场比例混合
+    scan    连续扫码：同一员工连续查询并录入 1-5 个产品
+    batch   批量录入
+    report  月度产品 / 交易报表
+    poll    今日计数和基础数据轮询（带 If-None-Match）
+
+响应 4xx 为业务校验拒绝（如5分钟间隔），单独计数；5xx 和连接异常计为错误。
+录入会写入测试库，新产品编码以 B<运行标识> 开头。
+
+用法:
+    cd app
+    python3 bench_load.py --base-url http://127.0.0.1:8000 --mix mixed --concurrency 1,8,32 --duration 30 \\
+        --output bench-results.json
+    python3 bench_load.py --in-process ...      # 不启动服务，直接在本进程内调用应用
+    python3 bench_load.py --compare old.json new.json
+
+需要 httpx（pip install httpx）。
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from bench_seed import employee_names, product_code
+from processes import PROCESSES
+from timeutil import SHANGHAI_TZ
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+PROCESS_TYPES = [p.type for p in PROCESSES]
+PROCESS_NAMES = [p.name for p in PROCESSES]
+
+MIXES = {
+    "mixed": {"scan": 40, "detail": 20, "batch": 5, "today_count": 20, "monthly_products": 4,
+              "monthly_transactions": 4, "reference": 6, "delete": 1},
+    "scan": {"scan": 70, "detail": 30},
+    "batch": {"batch": 100},
+    "report": {"monthly_products": 50, "monthly_transactions": 50},
+    "poll": {"today_count": 80, "reference": 20},
+}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.errors = defaultdict(int)
+
+    def add(self, endpoint, status, seconds):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    def error(self, endpoint):
+        self.errors[endpoint] += 1
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    total = 0
+    for endpoint in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = sorted(recorder.latencies[endpoint])
+        statuses = recorder.statuses[endpoint]
+        total += len(values)
+        endpoints[endpoint] = {
+            "requests": len(values),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": _ms(percentile(values, 50)),
+            "p95_ms": _ms(percentile(values, 95)),
+            "p99_ms": _ms(percentile(values, 99)),
+            "max_ms": _ms(values[-1] if values else None),
+            "rejected": sum(n for status, n in statuses.items() if 400 <= status < 500),
+            "errors": recorder.errors[endpoint] + sum(n for status, n in statuses.items() if status >= 500),
+            "status": {str(status): n for status, n in sorted(statuses.items())},
+        }
+    return {
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "endpoints": endpoints,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class Workload:
+    """
+    各操作共用的状态：员工、产品编码范围、本次运行写入的产品、各员工的 ETag
+    """
+
+    def __init__(self, client, recorder, employees, products, rng):
+        self.client = client
+        self.recorder = recorder
+        self.employees = employees
+        self.products = products
+        self.rng = rng
+        self.run_id = uuid.uuid4().hex[:6]
+        self.new_codes = 0
+        self.written = []   # (产品编码, 工序类型, 员工)
+        self.etags = {}
+
+    async def request(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.error(endpoint)
+            return None
+        self.recorder.add(endpoint, response.status_code, time.perf_counter() - start)
+        return response
+
+    def new_code(self):
+        self.new_codes += 1
+        return f"B{self.run_id}{self.new_codes:07d}"
+
+    def existing_code(self):
+        return product_code(self.rng.randrange(self.products)) if self.products else self.new_code()
+
+    async def detail(self):
+        await self.request("getProductDetails", "GET", "/api/getProductDetails",
+                           params={"productCode": self.existing_code()})
+
+    async def scan(self):
+        employee = self.rng.choice(self.employees)
+        index = self.rng.randrange(len(PROCESS_TYPES))
+        for _ in range(self.rng.randint(1, 5)):
+            code = self.new_code() if self.rng.random() < 0.3 else self.existing_code()
+            await self.request("getProductDetails", "GET", "/api/getProductDetails", params={"productCode": code})
+            response = await self.request("updateProductProcess", "POST", "/api/updateProductProcess", json={
+                "productCode": code,
+                "processType": PROCESS_TYPES[index],
+                "employeeName": employee,
+                "timeField": f"{PROCESS_NAMES[index]}时间",
+                "employeeField": f"{PROCESS_NAMES[index]}员工",
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+            })
+            if response is not None and response.status_code == 200:
+                self.written.append((code, index, employee))
+
+    async def batch(self):
+        index = self.rng.randrange(1, len(PROCESS_TYPES))
+        await self.request("batchUpdateProductProcess", "POST", "/api/batchUpdateProductProcess", json={
+            "productCodes": [self.new_code() for _ in range(self.rng.randint(10, 30))],
+            "processType": PROCESS_TYPES[index],
+            "employeeName": self.rng.choice(self.employees),
+        })
+
+    async def delete(self):
+        if not self.written:
+            return
+        code, index, employee = self.written.pop(self.rng.randrange(len(self.written)))
+        await self.request("deleteProductProcess", "POST", "/api/deleteProductProcess", json={
+            "productCode": code,
+            "processType": PROCESS_TYPES[index],
+            "employeeName": employee,
+            "timeField": f"{PROCESS_NAMES[index]}时间",
+            "employeeField": f"{PROCESS_NAMES[index]}员工",
+        })
+
+    async def _polled(self, endpoint, path, params=None):
+        key = (path, tuple(sorted((params or {}).items())))
+        headers = {"If-None-Match": self.etags[key]} if key in self.etags else {}
+        response = await self.request(endpoint, "GET", path, params=params, headers=headers)
+        if response is not None and "etag" in response.headers:
+            self.etags[key] = response.headers["etag"]
+
+    async def today_count(self):
+        await self._polled("getUserTodayProcessCount", "/api/getUserTodayProcessCount",
+                           {"employeeName": self.rng.choice(self.employees)})
+
+    async def reference(self):
+        path = self.rng.choice(["/api/modelSeries", "/api/seriesProcesses"])
+        await self._polled(path.rsplit("/", 1)[1], path)
+
+    def _month_params(self):
+        now = datetime.now(SHANGHAI_TZ)
+        return {
+            "employeeName": self.rng.choice(self.employees),
+            "startDate": now.replace(day=1, hour=0, minute=0, second=0, microsecond=0).isoformat(),
+            "endDate": now.isoformat(),
+        }
+
+    async def monthly_products(self):
+        await self.request("getUserMonthlyProducts", "GET", "/api/getUserMonthlyProducts",
+                           params=self._month_params())
+
+    async def monthly_transactions(self):
+        await self.request("getUserMonthlyTransactions", "GET", "/api/getUserMonthlyTransactions",
+                           params=self._month_params())
+
+
+class Lifespan:
+    """
+    --in-process 时按 ASGI lifespan 协议执行应用的 startup / shutdown
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.to_app = asyncio.Queue()
+        self.from_app = asyncio.Queue()
+        self.task = None
+
+    async def _event(self, kind):
+        await self.to_app.put({"type": f"lifespan.{kind}"})
+        message = await self.from_app.get()
+        if message["type"] != f"lifespan.{kind}.complete":
+            raise RuntimeError(f"应用 {kind} 失败: {message.get('message')}")
+
+    async def __aenter__(self):
+        scope = {"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}
+        self.task = asyncio.create_task(self.app(scope, self.to_app.get, self.from_app.put))
+        await self._event("startup")
+
+    async def __aexit__(self, *exc):
+        await self._event("shutdown")
+        await self.task
+
+
+async def run_all(args, mixes, levels, employees, app=None):
+    if app is not None:
+        async with Lifespan(app):
+            return await _run_all(args, mixes, levels, employees, app)
+    return await _run_all(args, mixes, levels, employees)
+
+
+async def _run_all(args, mixes, levels, employees, app=None):
+    results = []
+    for mix in mixes:
+        for concurrency in levels:
+            run = await run_level(args, mix, concurrency, employees, app)
+            results.append(run)
+            print_table([run])
+    return results
+
+
+async def run_level(args, mix, concurrency, employees, app=None):
+    weights = MIXES[mix]
+    names = list(weights)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if app is not None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+    else:
+        client = httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60)
+
+    async def worker(workload, deadline):
+        ops = [getattr(workload, name) for name in names]
+        op_weights = [weights[name] for name in names]
+        while time.perf_counter() < deadline:
+            await workload.rng.choices(ops, op_weights)[0]()
+
+    async with client:
+        if args.warmup > 0:
+            warm = Workload(client, Recorder(), employees, args.products, random.Random(args.seed))
+            deadline = time.perf_counter() + args.warmup
+            await asyncio.gather(*(worker(warm, deadline) for _ in range(concurrency)))
+        recorder = Recorder()
+        workloads = [
+            Workload(client, recorder, employees, args.products, random.Random(args.seed * 1000 + i))
+            for i in range(concurrency)
+        ]
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(worker(w, deadline) for w in workloads))
+        elapsed = time.perf_counter() - start
+    return {"mix": mix, "concurrency": concurrency, "duration_s": round(elapsed, 3), **summarize(recorder, elapsed)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _fmt(ms):
+    return "-" if ms is None else f"{ms:.1f}"
+
+
+def print_table(results):
+    print(f"{'mix':<8}{'并发':>6} {'接口':<29}{'请求数':>8}{'rps':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'拒绝':>6}{'错误':>6}")
+    for run in results:
+        for name, e in run["endpoints"].items():
+            print(f"{run['mix']:<8}{run['concurrency']:>6} {name:<29}{e['requests']:>8}{e['throughput_rps']:>10.1f}"
+                  f"{_fmt(e['p50_ms']):>9}{_fmt(e['p95_ms']):>9}{_fmt(e['p99_ms']):>9}{e['rejected']:>6}{e['errors']:>6}")
+        print(f"{run['mix']:<8}{run['concurrency']:>6} {'(合计)':<29}{run['requests']:>8}{run['throughput_rps']:>10.1f}")
+
+
+def compare(old_path, new_path):
+    """
+    按 (mix, 并发, 接口) 对比两次结果的吞吐量和 p95
+    """
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["mix"], r["concurrency"]): r for r in json.load(f)["runs"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["runs"]
+    print(f"{'mix':<8}{'并发':>6} {'接口':<29}{'rps 旧':>10}{'rps 新':>10}{'p95 旧':>10}{'p95 新':>10}{'p95变化':>9}")
+    for run in new:
+        before = old.get((run["mix"], run["concurrency"]))
+        if before is None:
+            continue
+        for name, e in run["endpoints"].items():
+            b = before["endpoints"].get(name)
+            if b is None or not b["p95_ms"] or e["p95_ms"] is None:
+                continue
+            change = (e["p95_ms"] - b["p95_ms"]) / b["p95_ms"]
+            print(f"{run['mix']:<8}{run['concurrency']:>6} {name:<29}{b['throughput_rps']:>10.1f}"
+                  f"{e['throughput_rps']:>10.1f}{b['p95_ms']:>10.1f}{e['p95_ms']:>10.1f}{change:>9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="接口压测")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000", help="服务地址")
+    parser.add_argument("--in-process", action="store_true", help="不经过网络，直接调用 main.app")
+    parser.add_argument("--mix", default="mixed", help="负载组合，逗号分隔：" + ",".join(MIXES))
+    parser.add_argument("--concurrency", default="1,8,32", help="并发数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=30, help="每个并发级别的持续秒数")
+    parser.add_argument("--warmup", type=float, default=3, help="每个并发级别正式计时前的预热秒数")
+    parser.add_argument("--products", type=int, default=500000, help="bench_seed.py 生成的产品数")
+    parser.add_argument("--employees", type=int, default=200, help="bench_seed.py 生成的员工数")
+    parser.add_argument("--seed", type=int, default=1, help="与 bench_seed.py 相同的随机种子")
+    parser.add_argument("--output", help="结果写入的JSON文件")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="对比两次结果")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if httpx is None:
+        raise SystemExit("需要 httpx：pip install httpx")
+    mixes = [m.strip() for m in args.mix.split(",") if m.strip()]
+    unknown = [m for m in mixes if m not in MIXES]
+    if unknown:
+        raise SystemExit(f"未知负载组合: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    employees = employee_names(args.employees, args.seed)
+    app = None
+    if args.in_process:
+        from main import app
+
+    results = asyncio.run(run_all(args, mixes, levels, employees, app))
+
+    report = {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "target": "in-process" if args.in_process else args.base_url,
+        "params": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "runs": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""
+压测数据生成
+
+向本地测试库写入合成的 products 数据（默认 50 万台电机、200 名员工、六道工序），
+时间列混用生产中出现过的各种格式。同样的参数和种子生成的数据完全相同，bench_load.py 据此选取员工和产品编码。
+
+只用于测试库：products 已有数据时需加 --reset，会清空 products 及计数、事件、员工名等派生表。
+表不存在时按生产结构创建（时间列为文本），写入后执行 migrate.py 中未执行的迁移并重建计数。
+
+用法:
+    cd app
+    python3 bench_seed.py --products 500000 --employees 200 --reset
+"""
+import argparse
+import csv
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from database import get_connection
+from migrate import migrate
+from process_events import rebuild_counters
+from processes import PROCESS_COLUMNS, PRODUCT_FIELDS
+from timeutil import SHANGHAI_TZ
+
+SURNAMES = "王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈"
+GIVEN = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华辉鑫宇浩凯健俊帆斌飞建国志文"
+MODELS = [
+    ("YE3-132M-4", "YE3中型"), ("YE3-160L-6", "YE3中型"), ("YE3-80M2-2", "YE3小型"),
+    ("YE4-200L-4", "YE4大型"), ("YE4-225S-4", "YE4大型"), ("YVF2-112M-4", "变频"),
+]
+EXCEPTION_MODELS = ["YVF2-112M-4"]
+SERIES_PROCESSES = {
+    "YE3中型": "绕线,嵌线,接线,压装,车止口,浸漆",
+    "YE3小型": "绕线,嵌线,接线,压装,浸漆",
+    "YE4大型": "绕线,嵌线,接线,压装,车止口,浸漆",
+    "变频": "绕线,嵌线,接线,压装,车止口,浸漆",
+}
+
+# (权重, 格式化函数)：ISO 带时区占多数，其余为历史数据和手工录入中出现过的格式
+TIME_FORMATS = [
+    (50, lambda t: t.astimezone(timezone.utc).isoformat()),
+    (15, lambda t: t.isoformat()),
+    (10, lambda t: t.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")),
+    (10, lambda t: t.strftime("%Y-%m-%d %H:%M:%S")),
+    (6, lambda t: t.strftime("%Y/%m/%d %H:%M:%S")),
+    (5, lambda t: t.replace(tzinfo=None).isoformat(timespec="seconds")),
+    (2, lambda t: t.strftime("%Y-%m-%d")),
+    (2, lambda t: t.strftime("%d/%m/%Y")),
+]
+
+COPY_BATCH = 50000
+
+
+def employee_names(n, seed=1):
+    """
+    生成 n 个不重复的员工姓名；部分为其他姓名加一个字，覆盖员工名模糊匹配的情况
+    """
+    rng = random.Random(seed)
+    names = []
+    seen = set()
+    while len(names) < n:
+        if names and rng.random() < 0.1:
+            name = rng.choice(names) + rng.choice(GIVEN)
+        else:
+            name = rng.choice(SURNAMES) + "".join(rng.choice(GIVEN) for _ in range(rng.choice((1, 2))))
+        if name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+
+def product_code(i):
+    return f"M{i:09d}"
+
+
+def _product_row(i, rng, employees, formats, weights, start, span):
+    model, _ = rng.choice(MODELS)
+    row = {"产品编码": product_code(i), "产品型号": model}
+    # 按工序顺序推进，约三成在制品停在中间工序
+    done = len(PROCESS_COLUMNS) if rng.random() < 0.7 else rng.randint(0, len(PROCESS_COLUMNS) - 1)
+    t = start + timedelta(seconds=rng.random() * span)
+    for index, (_, emp_col, time_col) in enumerate(PROCESS_COLUMNS):
+        if index < done:
+            t += timedelta(minutes=rng.randint(5, 600))
+            row[emp_col] = rng.choice(employees)
+            row[time_col] = rng.choices(formats, weights)[0](t)
+        else:
+            row[emp_col] = row[time_col] = None
+    return row
+
+
+def create_tables(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS products (id serial PRIMARY KEY, "
+        + ", ".join(f'"{col}" varchar(64)' for col in PRODUCT_FIELDS)
+        + ")"
+    )
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_products_code ON products ("产品编码")')
+    cursor.execute('CREATE TABLE IF NOT EXISTS exception (id serial PRIMARY KEY, "产品型号" varchar(64))')
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS model_series (id serial PRIMARY KEY, "产品型号" varchar(64), "工艺分类" varchar(64))'
+    )
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS series_processes (id serial PRIMARY KEY, "工艺分类" varchar(64), "工序流程" text)'
+    )
+    cursor.execute("CREATE TABLE IF NOT EXISTS month_range (id serial PRIMARY KEY, month_start date, month_end date)")
+
+
+def reset_tables(cursor):
+    derived = []
+    for table in ["process_events", "employee_daily_process_counts", "employee_last_activity",
+                  "employee_data_versions", "employee_names"]:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL AS migrated", (table,))
+        if cursor.fetchone()["migrated"]:
+            derived.append(table)
+    cursor.execute("TRUNCATE " + ", ".join(["products", "exception", "model_series", "series_processes",
+                                            "month_range"] + derived))
+
+
+def seed_reference(cursor, end):
+    for model, series in MODELS:
+        cursor.execute('INSERT INTO model_series ("产品型号", "工艺分类") VALUES (%s, %s)', (model, series))
+    for series, flow in SERIES_PROCESSES.items():
+        cursor.execute('INSERT INTO series_processes ("工艺分类", "工序流程") VALUES (%s, %s)', (series, flow))
+    for model in EXCEPTION_MODELS:
+        cursor.execute('INSERT INTO exception ("产品型号") VALUES (%s)', (model,))
+    month_start = end.date().replace(day=1)
+    month_end = (month_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    cursor.execute("INSERT INTO month_range (month_start, month_end) VALUES (%s, %s)", (month_start, month_end))
+
+
+def drop_indexes(cursor):
+    """
+    删除 products 上的索引（主键除外）并返回其定义；时间表达式索引会让 COPY 慢一个数量级
+    """
+    cursor.execute("""
+        SELECT i.indexname, i.indexdef FROM pg_indexes i
+        WHERE i.tablename = 'products' AND i.schemaname = current_schema()
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)
+    """)
+    indexes = cursor.fetchall()
+    for index in indexes:
+        cursor.execute(f'DROP INDEX "{index["indexname"]}"')
+    return [index["indexdef"] for index in indexes]
+
+
+def copy_products(cursor, count, employees, seed, start, span):
+    rng = random.Random(seed)
+    weights = [w for w, _ in TIME_FORMATS]
+    formats = [f for _, f in TIME_FORMATS]
+    columns = ", ".join(f'"{col}"' for col in PRODUCT_FIELDS)
+    for offset in range(0, count, COPY_BATCH):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for i in range(offset, min(offset + COPY_BATCH, count)):
+            row = _product_row(i, rng, employees, formats, weights, start, span)
+            writer.writerow(["" if row[col] is None else row[col] for col in PRODUCT_FIELDS])
+        buffer.seek(0)
+        # 空字段按 NULL 写入
+        cursor.copy_expert(f"COPY products ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+        print(f"已写入 {min(offset + COPY_BATCH, count)} / {count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成压测数据")
+    parser.add_argument("--products", type=int, default=500000, help="产品数")
+    parser.add_argument("--employees", type=int, default=200, help="员工数")
+    parser.add_argument("--days", type=int, default=90, help="数据覆盖截至今天的天数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--reset", action="store_true", help="清空已有数据")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    employees = employee_names(args.employees, args.seed)
+    end = datetime.now(SHANGHAI_TZ)
+    # 各工序依次推进，最后一道工序最多比首道晚60小时，起点提前留出余量，时间都不晚于当前
+    span = args.days * 86400
+    start = end - timedelta(seconds=span) - timedelta(minutes=600 * len(PROCESS_COLUMNS))
+
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        create_tables(cursor)
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM products) AS has_rows")
+        if cursor.fetchone()["has_rows"]:
+            if not args.reset:
+                print("products 已有数据，确认是测试库后加 --reset 重新生成")
+                return
+            reset_tables(cursor)
+        seed_reference(cursor, end)
+        indexes = drop_indexes(cursor)
+        copy_products(cursor, args.products, employees, args.seed, start, span)
+        print(f"重建 {len(indexes)} 个索引")
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        conn.commit()
+
+    # 建索引、函数等；已执行过的迁移不会重复执行
+    migrate()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # 与 migrations/004 的初始化相同
+        cursor.execute("""
+            INSERT INTO employee_last_activity (employee, process, last_time)
+            SELECT "绕线员工", '绕线', max(product_time_instant("绕线时间"::text))
+            FROM products
+            WHERE "绕线员工" IS NOT NULL AND "绕线时间" IS NOT NULL
+            GROUP BY "绕线员工"
+            ON CONFLICT (employee, process) DO UPDATE SET last_time = EXCLUDED.last_time
+        """)
+        cursor.execute("ANALYZE products")
+        conn.commit()
+    rebuild_counters()
+    print(f"完成：{args.products} 个产品，{len(employees)} 名员工，耗时 {time.monotonic() - started:.1f} 秒")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+响应编码基准测试（不需要数据库）
+
+用合成数据对比月度接口改造前后的响应大小和编码耗时：
+- 改造前：SELECT * 的完整行（含 id 和时间列迁移期间的 *_legacy 列），dict(row) 复制后
+  经 jsonable_encoder + json.dumps 编码；交易记录逐行重建字典
+- 改造后：只查询 PRODUCT_FIELDS / 接口字段，行直接用 FastJSONResponse 的 dumps 编码
+
+用法:
+    cd app
+    python3 bench_serialization.py [--rows 5000] [--repeat 20]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+
+from processes import PROCESS_COLUMNS, PRODUCT_FIELDS
+from responses import dumps
+from timeutil import SHANGHAI_TZ
+
+
+def default_dumps(content):
+    # FastAPI 默认 JSONResponse 的编码方式
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def synthetic_products(n, seed=1):
+    """
+    完整的 products 行：时间列已是 timestamptz，另有 id 和尚未删除的 *_legacy 文本列
+    """
+    rng = random.Random(seed)
+    base = datetime(2025, 3, 1, tzinfo=SHANGHAI_TZ)
+    rows = []
+    for i in range(n):
+        row = {"id": i + 1, "产品编码": f"P{i:08d}", "产品型号": rng.choice(["YE3-132M-4", "YE3-160L-6", None])}
+        for _, emp_col, time_col in PROCESS_COLUMNS:
+            if rng.random() < 0.7:
+                t = base + timedelta(seconds=rng.randint(0, 31 * 86400))
+                row[emp_col] = rng.choice(["张三", "李四", "王五"])
+                row[time_col] = t.astimezone(timezone.utc)
+                row[time_col + "_legacy"] = t.isoformat()
+            else:
+                row[emp_col] = row[time_col] = row[time_col + "_legacy"] = None
+        rows.append(row)
+    return rows
+
+
+def before_products(rows):
+    return default_dumps({"data": [dict(row) for row in rows], "client_info": {"is_ios": False}})
+
+
+def after_products(rows):
+    return dumps({"data": rows, "client_info": {"is_ios": False}})
+
+
+def before_transactions(rows):
+    return default_dumps({"data": [
+        {"process": row["process"], "productCode": row["产品编码"], "model": row["产品型号"], "time": row["time"]}
+        for row in rows
+    ]})
+
+
+def after_transactions(rows):
+    return dumps({"data": rows})
+
+
+def transaction_rows(products, aliased):
+    code_key, model_key = ("productCode", "model") if aliased else ("产品编码", "产品型号")
+    return [
+        {"process": process, code_key: p["产品编码"], model_key: p["产品型号"], "time": p[time_col]}
+        for p in products
+        for process, _, time_col in PROCESS_COLUMNS
+        if p[time_col] is not None
+    ]
+
+
+def measure(func, rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = func(rows)
+        timings.append(time.perf_counter() - start)
+    return len(body), statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="响应编码基准测试")
+    parser.add_argument("--rows", type=int, default=5000, help="合成产品行数")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数，取中位数")
+    args = parser.parse_args()
+
+    full = synthetic_products(args.rows)
+    projected = [{col: row[col] for col in PRODUCT_FIELDS} for row in full]
+    cases = [
+        ("getUserMonthlyProducts", before_products, full, after_products, projected),
+        ("getUserMonthlyTransactions", before_transactions, transaction_rows(full, False),
+         after_transactions, transaction_rows(full, True)),
+    ]
+    print(f"{'接口':<28}{'':>6}{'字节':>12}{'编码ms':>10}")
+    for name, before, before_rows, after, after_rows in cases:
+        # 两种编码的内容必须一致（改造后只少了未使用的列）
+        expected = json.loads(before(before_rows))
+        if name == "getUserMonthlyProducts":
+            expected["data"] = [{col: row[col] for col in PRODUCT_FIELDS} for row in expected["data"]]
+        assert json.loads(after(after_rows)) == expected
+        b_size, b_ms = measure(before, before_rows, args.repeat)
+        a_size, a_ms = measure(after, after_rows, args.repeat)
+        print(f"{name:<28}{'改造前':>6}{b_size:>12}{b_ms:>10.2f}")
+        print(f"{'':<28}{'改造后':>6}{a_size:>12}{a_ms:>10.2f}")
+        print(f"{'':<28}{'变化':>6}{(a_size - b_size) / b_size:>12.1%}{b_ms / a_ms:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
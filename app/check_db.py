@@ -1,15 +1,15 @@
-from database import get_db_connection
+from database import get_connection
 from datetime import datetime, timedelta
 import sys
 sys.path.append('.')  # 确保能导入当前目录模块
 from main import is_in_time_range, is_date_in_range, is_employee_match
 
 def check_records():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 查询方辉的记录
-    cursor.execute("""
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        
+        # 查询方辉的记录
+        cursor.execute("""
         SELECT * FROM products 
         WHERE "绕线员工" LIKE '%方辉%' 
            OR "嵌线员工" LIKE '%方辉%' 
@@ -19,7 +19,7 @@ def check_records():
         LIMIT 5
     """)
     
-    products = cursor.fetchall()
+        products = cursor.fetchall()
     print(f'找到 {len(products)} 条方辉的记录:')
     
     # 构建测试用的日期范围 - 确保范围足够大以包含所有记录
@@ -56,9 +56,6 @@ def check_records():
         if p.get('绕线时间'):
             print(f"  原始绕线时间: {p.get('绕线时间')}")
             print(f"  原始绕线时间类型: {type(p.get('绕线时间'))}")
-    
-    # 关闭连接
-    conn.close()
 
 if __name__ == "__main__":
     check_records() 
\ No newline at end of file
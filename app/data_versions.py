@@ -0,0 +1,72 @@
+"""
+员工数据版本号
+
+每次写入工序事件时，相关员工和产品行上署名的员工的版本号在同一事务中加一（见 process_events.record_events），
+重建计数表时所有员工的版本号加一。
+报表按员工名宽松匹配（employee_matches），匹配到的员工版本号之和与员工数共同作为数据版本：
+版本号只增不减、行不删除，任一匹配员工的数据变化都会改变结果。
+"""
+from database import get_connection
+
+
+def bump(cursor, employees):
+    """
+    在当前事务中把这些员工的版本号加一，不提交
+    """
+    employees = sorted({e for e in employees if e})
+    if not employees:
+        return
+    # 固定顺序加锁，避免并发事务互相等待造成死锁
+    cursor.execute(
+        """
+        INSERT INTO employee_data_versions (employee, version)
+        SELECT e, 1 FROM unnest(%s::text[]) AS e
+        ON CONFLICT (employee) DO UPDATE SET version = employee_data_versions.version + 1
+        """,
+        (employees,)
+    )
+
+
+def bump_all(cursor, employees):
+    """
+    在当前事务中把所有员工的版本号加一，并为 employees 中还没有版本号的员工建行，不提交
+    """
+    # 与 bump 相同按员工名顺序加锁
+    cursor.execute("SELECT employee FROM employee_data_versions ORDER BY employee FOR UPDATE")
+    cursor.execute("UPDATE employee_data_versions SET version = version + 1")
+    employees = sorted({e for e in employees if e})
+    if employees:
+        cursor.execute(
+            """
+            INSERT INTO employee_data_versions (employee, version)
+            SELECT e, 1 FROM unnest(%s::text[]) AS e
+            ON CONFLICT (employee) DO NOTHING
+            """,
+            (employees,)
+        )
+
+
+def fetch_version(employee_name):
+    """
+    与员工名匹配的所有员工的数据版本，返回 "员工数.版本号之和"
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT count(*) AS n, coalesce(sum(version), 0) AS v FROM employee_data_versions "
+            "WHERE employee_matches(employee, %s)",
+            (employee_name.replace(" ", "").strip(),)
+        )
+        row = cursor.fetchone()
+        return f"{row['n']}.{row['v']}"
+
+
+def fetch_total_version():
+    """
+    所有员工的数据版本，用于全员汇总接口的 ETag
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT count(*) AS n, coalesce(sum(version), 0) AS v FROM employee_data_versions")
+        row = cursor.fetchone()
+        return f"{row['n']}.{row['v']}"
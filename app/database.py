@@ -1,25 +1,351 @@
 import os
-import socket
+import time
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions
 from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
 
-def get_db_connection():
-    # 确定当前环境和配置文件路径
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    default_env_path = os.path.join(current_dir, '.env')
-    
-    # 加载默认环境配置
-    load_dotenv(default_env_path)
-    
+import metrics
+
+# 启动时只加载一次环境配置，不再在每次请求时重复读取.env
+current_dir = os.path.dirname(os.path.abspath(__file__))
+load_dotenv(os.path.join(current_dir, '.env'))
+
+
+def env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# 插入新产品编码前的事务级咨询锁：按产品编码的哈希分桶，键为 (NEW_CODE_LOCK, 桶号)，
+# 扫码、批量录入和生产计划导入都按桶号顺序加锁，一个事务最多持有 NEW_CODE_BUCKETS 个锁
+NEW_CODE_LOCK = 0x636F6465  # "code"
+NEW_CODE_BUCKETS = 1024
+
+
+def new_code_bucket(expr):
+    """
+    产品编码 SQL 表达式 expr 所在锁桶的 SQL 表达式
+    """
+    return f"(hashtext({expr}) & {NEW_CODE_BUCKETS - 1})"
+
+
+# 慢语句回调：(阈值秒数, fn(cursor, query, vars, 耗时秒数))，由 set_slow_query_hook 设置
+_slow_query_hook = None
+
+
+def set_slow_query_hook(threshold, fn):
+    """
+    执行耗时达到 threshold 秒的语句在执行后调用 fn；fn 为 None 时取消
+    """
+    global _slow_query_hook
+    _slow_query_hook = (threshold, fn) if fn is not None else None
+
+
+class CountingCursor(RealDictCursor):
+    """
+    统计取回的行数，计入当前数据库操作的指标；执行较慢的语句交给慢语句回调
+    """
+
+    def execute(self, query, vars=None):
+        hook = _slow_query_hook
+        if hook is None:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= hook[0]:
+                hook[1](self, query, vars, elapsed)
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            metrics.count_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        metrics.count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        metrics.count_rows(len(rows))
+        return rows
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+
+class ConnectionPool:
+    """
+    线程安全的PostgreSQL连接池
+
+    - 取出连接时做健康检查（空闲过久的连接先执行 SELECT 1）
+    - 连接超过最大存活时间后在归还时回收
+    - 连接数达到上限时排队等待，超时抛出 PoolTimeout
+    """
+
+    def __init__(self, minconn, maxconn, max_age=1800, acquire_timeout=10,
+                 check_idle=30, **connect_kwargs):
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.max_age = max_age
+        self.acquire_timeout = acquire_timeout
+        self.check_idle = check_idle
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, 归还时间)]
+        self._created = {}       # id(conn) -> 创建时间
+        self._in_use = 0
+        self._waiters = 0
+        self._closed = False
+        # 统计信息
+        self._acquired_total = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+        self._recycled = 0
+        self._broken = 0
+        for _ in range(self.minconn):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+
+    def _connect(self):
+        conn = psycopg2.connect(cursor_factory=CountingCursor, **self._connect_kwargs)
+        self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        self._created.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _expired(self, conn):
+        created = self._created.get(id(conn))
+        return created is None or time.monotonic() - created > self.max_age
+
+    def _healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self, timeout=None):
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        while True:
+            conn, idle_since = self._reserve(deadline, timeout)
+            if conn is None:
+                # 在锁外建立新连接，不阻塞其他线程归还/取用
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                break
+            # 健康检查同样在锁外进行
+            if self._expired(conn):
+                self._discard(conn)
+                self._release_slot(recycled=True)
+            elif not self._healthy(conn, idle_since):
+                self._discard(conn)
+                self._release_slot(broken=True)
+            else:
+                break
+        with self._cond:
+            self._record_wait(start)
+        return conn
+
+    def _reserve(self, deadline, timeout):
+        """
+        占用一个连接名额：有空闲连接则取出，否则在未达上限时返回 (None, None) 由调用方新建
+        """
+        with self._cond:
+            if self._closed:
+                raise PoolTimeout("连接池已关闭")
+            while True:
+                if self._idle:
+                    self._in_use += 1
+                    return self._idle.pop()
+                if self._in_use < self.maxconn:
+                    self._in_use += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"等待数据库连接超时({timeout}秒)")
+                self._waiters += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiters -= 1
+
+    def _release_slot(self, recycled=False, broken=False):
+        with self._cond:
+            self._in_use -= 1
+            self._recycled += recycled
+            self._broken += broken
+            self._cond.notify()
+
+    def _record_wait(self, start):
+        waited = time.monotonic() - start
+        self._acquired_total += 1
+        self._wait_total += waited
+        if waited > self._wait_max:
+            self._wait_max = waited
+        metrics.POOL_ACQUIRE.observe(waited)
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                # 未提交的事务一律回滚，保证归还的连接干净
+                if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if self._closed:
+                self._discard(conn)
+            elif discard or conn.closed:
+                self._broken += 1
+                self._discard(conn)
+            elif self._expired(conn):
+                self._recycled += 1
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._discard(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        """
+        返回连接池统计信息
+        """
+        with self._cond:
+            acquired = self._acquired_total
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "acquired_total": acquired,
+                "wait_time_total": round(self._wait_total, 6),
+                "wait_time_avg": round(self._wait_total / acquired, 6) if acquired else 0.0,
+                "wait_time_max": round(self._wait_max, 6),
+                "timeouts": self._timeouts,
+                "recycled": self._recycled,
+                "broken": self._broken,
+            }
+
+
+def connect_kwargs():
     # 无论内网还是公网，都使用相同的数据库连接配置
-    conn = psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        database=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-        cursor_factory=RealDictCursor,
-        connect_timeout=5  # 5秒超时
-    )
-    return conn
+    return {
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+        "database": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "connect_timeout": 5,  # 5秒超时
+    }
+
+
+def new_connection():
+    """
+    建立一个不属于连接池的独立连接（用于 LISTEN 等长期占用的场景），由调用方负责关闭
+    """
+    return psycopg2.connect(cursor_factory=CountingCursor, **connect_kwargs())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    获取全局连接池，首次调用时按配置创建
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    minconn=env_int("DB_POOL_MIN", 1),
+                    maxconn=env_int("DB_POOL_MAX", 10),
+                    max_age=env_float("DB_POOL_MAX_AGE", 1800),
+                    acquire_timeout=env_float("DB_POOL_TIMEOUT", 10),
+                    check_idle=env_float("DB_POOL_CHECK_IDLE", 30),
+                    **connect_kwargs()
+                )
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+@contextmanager
+def get_connection():
+    """
+    从连接池借出连接，退出with块时无论成功或异常都归还
+
+    用法:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            ...
+            conn.commit()
+    """
+    pool = get_pool()
+    conn = pool.getconn()
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        # 连接级错误，连接不再复用
+        discard = True
+        raise
+    finally:
+        pool.putconn(conn, discard=discard)
@@ -0,0 +1,48 @@
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from database import env_int
+import metrics
+
+
+# 读写分开的有界线程池：报表类慢查询只会占满读线程池，扫码写入始终有独立线程可用
+# 两个线程池大小之和不应超过 DB_POOL_MAX，否则线程会在连接池上排队
+# 任务在调用方的 contextvars 上下文中执行，日志能带上请求字段；每个任务按函数名记录耗时和取回行数
+READ_WORKERS = max(1, env_int("DB_READ_WORKERS", 4))
+WRITE_WORKERS = max(1, env_int("DB_WRITE_WORKERS", 4))
+
+_read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="db-read")
+_write_executor = ThreadPoolExecutor(max_workers=WRITE_WORKERS, thread_name_prefix="db-write")
+
+
+def _query_name(func):
+    return getattr(func, "__qualname__", type(func).__name__).lstrip("_")
+
+
+async def run_read(func, *args, **kwargs):
+    """
+    在读线程池中执行阻塞的数据库读操作
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _read_executor, contextvars.copy_context().run,
+        functools.partial(metrics.timed_call, _query_name(func), func, *args, **kwargs)
+    )
+
+
+async def run_write(func, *args, **kwargs):
+    """
+    在写线程池中执行阻塞的数据库写操作
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _write_executor, contextvars.copy_context().run,
+        functools.partial(metrics.timed_call, _query_name(func), func, *args, **kwargs)
+    )
+
+
+def shutdown_executors(wait=True):
+    _read_executor.shutdown(wait=wait)
+    _write_executor.shutdown(wait=wait)
@@ -0,0 +1,62 @@
+"""
+员工名匹配与自动补全
+
+products 中出现过的员工名保存在 employee_names 维表中（migrations/006，由触发器维护）。
+报表先在维表中找出匹配的原始员工名，再按员工列的索引查询 products；匹配规则仍是 employee_matches：
+去掉空格后双向包含。
+"""
+from database import get_connection
+
+
+def clean(name):
+    # 与 main.is_employee_match / SQL employee_clean 一致
+    return name.replace(" ", "").strip()
+
+
+def resolve(cursor, employee_name):
+    """
+    返回 (names, listed)：
+    names 为与员工名宽松匹配的原始员工名（employee_matches）；
+    listed 为包含 strip 后查询名的原始员工名，对应原来六列 LIKE '%名%' 的预筛选
+    """
+    if not employee_name:
+        return [], []
+    cursor.execute(
+        """
+        SELECT name, employee_matches(name, %(name)s) AS matched, name LIKE %(like)s AS listed
+        FROM employee_names
+        WHERE employee_matches(name, %(name)s) OR name LIKE %(like)s
+        """,
+        {"name": clean(employee_name), "like": f"%{employee_name.strip()}%"}
+    )
+    rows = cursor.fetchall()
+    return [r["name"] for r in rows if r["matched"]], [r["name"] for r in rows if r["listed"]]
+
+
+def _like_pattern(text):
+    return "%" + text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def search(query, limit=10):
+    """
+    自动补全：去掉空格后包含输入的员工，完全相同的在前，其次是以输入开头的，再按名字长度排序
+
+    返回 [{"name": 去掉空格后的名字, "aliases": [库中的原始写法]}]
+    """
+    query = clean(query)
+    if not query:
+        return []
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT clean AS name, array_agg(name ORDER BY name) AS aliases
+            FROM employee_names
+            WHERE clean LIKE %(pattern)s AND clean <> ''
+            GROUP BY clean
+            ORDER BY clean = %(query)s DESC, starts_with(clean, %(query)s) DESC, length(clean), clean
+            LIMIT %(limit)s
+            """,
+            {"pattern": _like_pattern(query), "query": query, "limit": limit}
+        )
+        return cursor.fetchall()
@@ -0,0 +1,145 @@
+"""
+员工最近一次绕线时间，用于5分钟间隔校验
+
+employee_last_activity 表（见 migrations/004）按 (员工, 工序) 保存最近一次时间：
+- 绕线录入时在同一事务中先锁住该员工的行，再校验、写入产品并更新时间，
+  同一员工的并发扫码（包括不同worker进程）依次执行，不会同时通过校验
+- 内存中记住本进程提交过的最近时间，仍在5分钟内的扫码直接拒绝，不访问数据库；
+  内存值只会比数据库旧，放行时一律以数据库为准
+- 删除绕线记录后从 products 重新计算，并 NOTIFY employee_activity_changed 让各进程丢弃内存值
+
+与原校验一致，只有带时区的时间参与间隔判断。
+"""
+import threading
+from datetime import datetime, timezone
+
+from timeutil import normalize_timestamp
+
+WIRING = "绕线"
+CHANNEL = "employee_activity_changed"
+INTERVAL_SECONDS = 300
+
+_recent = {}  # 员工 -> 本进程已提交的最近绕线时间
+_recent_lock = threading.Lock()
+
+
+def _aware(value):
+    parsed = normalize_timestamp(value)
+    if parsed is None or parsed.tzinfo is None:
+        return None
+    return parsed
+
+
+def within_interval(last_time):
+    """
+    判断最近一次绕线时间距当前是否小于5分钟，日期格式异常不拦截
+    """
+    last_time = _aware(last_time)
+    if last_time is None:
+        return False
+    return abs((datetime.now(timezone.utc) - last_time).total_seconds()) < INTERVAL_SECONDS
+
+
+def later(current, value):
+    """
+    与 set_last_wiring 相同的取值规则：只取带时区的时间，只增不减
+    """
+    value = _aware(value)
+    if value is None:
+        return current
+    current_aware = _aware(current)
+    return value if current_aware is None or value > current_aware else current
+
+
+def recently_wired(employee):
+    """
+    内存快速判断：本进程记录的最近绕线仍在5分钟内
+    """
+    return within_interval(_recent.get(employee))
+
+
+def remember(employee, value):
+    """
+    事务提交后记录到内存
+    """
+    value = _aware(value)
+    if value is None:
+        return
+    with _recent_lock:
+        current = _recent.get(employee)
+        if current is None or value > current:
+            _recent[employee] = value
+
+
+def forget(employee=None):
+    """
+    丢弃内存值；employee 为 None 时全部丢弃（监听连接重连时）
+    """
+    with _recent_lock:
+        if employee is None:
+            _recent.clear()
+        else:
+            _recent.pop(employee, None)
+
+
+def lock_last_wiring(cursor, employee):
+    """
+    锁住员工的绕线行并返回最近时间，行锁持有到事务结束
+
+    须在锁 products 行之前调用，保持固定加锁顺序
+    """
+    cursor.execute(
+        "INSERT INTO employee_last_activity (employee, process, last_time) VALUES (%s, %s, NULL) "
+        "ON CONFLICT (employee, process) DO NOTHING",
+        (employee, WIRING)
+    )
+    cursor.execute(
+        "SELECT last_time FROM employee_last_activity WHERE employee = %s AND process = %s FOR UPDATE",
+        (employee, WIRING)
+    )
+    return cursor.fetchone()["last_time"]
+
+
+def read_last_wiring(cursor, employee):
+    """
+    只读查询最近绕线时间（非绕线工序的校验，不加锁）
+    """
+    cursor.execute(
+        "SELECT last_time FROM employee_last_activity WHERE employee = %s AND process = %s",
+        (employee, WIRING)
+    )
+    row = cursor.fetchone()
+    return row["last_time"] if row else None
+
+
+def set_last_wiring(cursor, employee, value):
+    """
+    在当前事务中更新最近绕线时间（只增不减），不提交
+    """
+    value = _aware(value)
+    if value is None:
+        return
+    cursor.execute(
+        "INSERT INTO employee_last_activity (employee, process, last_time) VALUES (%s, %s, %s) "
+        "ON CONFLICT (employee, process) DO UPDATE "
+        "SET last_time = GREATEST(employee_last_activity.last_time, EXCLUDED.last_time)",
+        (employee, WIRING, value)
+    )
+
+
+def recompute_last_wiring(cursor, employee):
+    """
+    删除绕线记录后按 products 重新计算，并通知各进程丢弃内存值（随事务提交发出）
+
+    调用前需已通过 lock_last_wiring 锁住该行
+    """
+    cursor.execute(
+        'SELECT max(product_time_instant("绕线时间"::text)) AS last_time FROM products WHERE "绕线员工" = %s',
+        (employee,)
+    )
+    last_time = cursor.fetchone()["last_time"]
+    cursor.execute(
+        "UPDATE employee_last_activity SET last_time = %s WHERE employee = %s AND process = %s",
+        (last_time, employee, WIRING)
+    )
+    cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, employee))
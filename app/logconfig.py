@@ -0,0 +1,241 @@
+"""
+日志配置
+
+- 所有日志先进入有界队列，由后台线程写入按大小轮转的文件，请求线程不做磁盘IO；队列满时丢弃并计数
+- 每行一个JSON对象：时间、级别、logger、消息，以及 extra 和请求上下文字段（endpoint / employee / request_id）
+- 可按 logger 采样，用于逐行的调试日志
+- RequestLogMiddleware 为每个请求记录一条访问日志（状态码、耗时）；请求体中的员工名由接口调用 bind 补充
+
+环境变量：
+    LOG_LEVEL        默认 INFO
+    LOG_FILE         默认 <项目目录>/logs/api.log
+    LOG_MAX_BYTES    单个文件大小上限，默认 20MB
+    LOG_BACKUP_COUNT 保留的轮转文件数，默认 5
+    LOG_QUEUE_SIZE   队列长度，默认 10000
+    LOG_SAMPLING     按 logger 采样比例，如 "api.rows=0.01,repository=0.5"
+    LOG_STDERR       为 1 时同时输出到标准错误
+    SLOW_QUERY_PLAN_FILE  慢语句执行计划（slow_query.plan）单独写入的文件，默认 <项目目录>/logs/slow_plans.log
+"""
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+
+from database import env_int
+from responses import dumps
+
+LOG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
+DEFAULT_LOG_FILE = os.path.join(LOG_DIR, "api.log")
+# 单独写入文件的 logger：logger 名 -> (文件路径环境变量, 默认文件名)
+SEPARATE_FILES = {
+    "slow_query.plan": ("SLOW_QUERY_PLAN_FILE", "slow_plans.log"),
+}
+
+# 当前请求的上下文字段，由 RequestLogMiddleware 设置
+request_context = contextvars.ContextVar("request_context", default=None)
+
+# LogRecord 自带的属性，其余属性视为 extra 字段
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return dumps(entry).decode("utf-8")
+
+
+class LoggerFilter(logging.Filter):
+    """
+    按 logger 名分流：include 为 True 时只保留这些 logger，否则排除
+    """
+
+    def __init__(self, names, include):
+        super().__init__()
+        self.names = tuple(names)
+        self.include = include
+
+    def filter(self, record):
+        matched = any(record.name == name or record.name.startswith(name + ".") for name in self.names)
+        return matched == self.include
+
+
+class ContextFilter(logging.Filter):
+    """
+    在调用线程中把请求上下文字段附加到日志记录上
+    """
+
+    def filter(self, record):
+        context = request_context.get()
+        if context:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    setattr(record, key, value)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    按比例保留日志；WARNING 及以上不采样
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    队列满时直接丢弃，不阻塞请求线程
+    """
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+def _parse_sampling(spec):
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = float(rate)
+        except ValueError:
+            continue
+    return rates
+
+
+def _rotating_handler(path, formatter):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        path,
+        maxBytes=env_int("LOG_MAX_BYTES", 20 * 1024 * 1024),
+        backupCount=env_int("LOG_BACKUP_COUNT", 5),
+        encoding="utf-8",
+    )
+    handler.setFormatter(formatter)
+    return handler
+
+
+def setup_logging():
+    """
+    配置根 logger，重复调用无效
+    """
+    global _listener
+    if _listener is not None:
+        return
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    log_file = os.getenv("LOG_FILE", DEFAULT_LOG_FILE)
+
+    formatter = JsonFormatter()
+    file_handler = _rotating_handler(log_file, formatter)
+    file_handler.addFilter(LoggerFilter(SEPARATE_FILES, include=False))
+    handlers = [file_handler]
+    for name, (env_name, filename) in SEPARATE_FILES.items():
+        handler = _rotating_handler(os.getenv(env_name, os.path.join(LOG_DIR, filename)), formatter)
+        handler.addFilter(LoggerFilter([name], include=True))
+        handlers.append(handler)
+    if os.getenv("LOG_STDERR") == "1":
+        stderr_handler = logging.StreamHandler(sys.stderr)
+        stderr_handler.setFormatter(formatter)
+        handlers.append(stderr_handler)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=env_int("LOG_QUEUE_SIZE", 10000)))
+    queue_handler.addFilter(ContextFilter())
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    for name, rate in _parse_sampling(os.getenv("LOG_SAMPLING", "")).items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    写完队列中剩余的日志后停止后台线程
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def bind(**fields):
+    """
+    向当前请求的上下文追加字段（如从请求体中取得的员工名）
+    """
+    context = request_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def log_stats():
+    return {"dropped": DroppingQueueHandler.dropped}
+
+
+class RequestLogMiddleware:
+    """
+    ASGI 中间件：设置请求上下文并在响应结束后记录访问日志（流式响应同样在最后一块发送后计时）
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        query = dict(
+            pair.split("=", 1) if "=" in pair else (pair, "")
+            for pair in scope.get("query_string", b"").decode("latin-1").split("&") if pair
+        )
+        context = {"endpoint": scope["path"], "request_id": uuid.uuid4().hex[:12]}
+        if "employeeName" in query:
+            context["employee"] = unquote_plus(query["employeeName"])
+        token = request_context.set(context)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.logger.info(
+                "%s %s %s", scope["method"], scope["path"], status["code"],
+                extra={"status": status["code"], "duration_ms": round((time.perf_counter() - start) * 1000, 2)}
+            )
+            request_context.reset(token)
@@ -1,50 +1,159 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import APIRouter, FastAPI, File, HTTPException, Query, Request, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
-import json
-from datetime import datetime, timezone, timedelta
-
-from database import get_db_connection
-
-app = FastAPI()
-
-# 添加CORS中间件
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # 允许所有源，生产环境应限制
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+from datetime import date, datetime, timezone, timedelta
+
+from database import close_pool, env_int, pool_stats
+from db_executor import run_read, shutdown_executors
+import refcache
+import last_activity
+import product_cache
+import repository
+import write_queue
+import processes
+from processes import PROCESS_COLUMNS
+from timeutil import normalize_timestamp, SHANGHAI_TZ
+from models import (
+    UpdateProductProcess, BatchUpdateProductProcess, ProductDetailsBatch, DeleteProductProcess,
+    SuccessResponse, BatchResultsResponse, ProductDetailsResponse, ProductDetailsBatchResponse,
+    MonthlyProductsResponse, MonthlyTransactionsResponse, MonthRangeResponse, RowsResponse, ProcessCountResponse,
+    TeamProcessCountResponse, EmployeeSearchResponse, PlanImportResponse,
 )
+from responses import FastJSONResponse, dumps, make_etag, etag_matches, not_modified, etag_headers
+from logconfig import setup_logging, bind, log_stats, RequestLogMiddleware
+import metrics
+import slow_query
+import singleflight
+import admission
+import plan_import
+
+logger = logging.getLogger("api")
+# 逐行的时间比较日志，量大，默认不输出；需要时 LOG_LEVEL=DEBUG 并用 LOG_SAMPLING 设置采样比例
+row_logger = logging.getLogger("api.rows")
+
+router = APIRouter()
+
+metrics.add_gauges("db_pool", "数据库连接池", pool_stats)
+metrics.add_gauges("product_cache", "产品行缓存", product_cache.cache.stats)
+metrics.add_gauges("log_queue", "日志队列", log_stats)
+metrics.add_gauges("write_queue", "写入队列", write_queue.queue.stats)
+metrics.add_gauges("singleflight", "读请求合并", singleflight.group.stats)
+metrics.add_gauges("admission", "准入控制", admission.stats)
+
+
+def create_app():
+    """
+    应用工厂：配置日志和慢语句记录，创建应用并挂上中间件和路由
+
+    每个进程调用一次（serve.py 的每个工作进程以工厂方式启动）；main:app 在首次访问时调用
+    """
+    setup_logging()
+    slow_query.install()
+
+    # 读接口直接返回 FastJSONResponse（orjson 编码，跳过 jsonable_encoder 和响应模型的逐行校验），
+    # response_model 只用于接口文档
+    app = FastAPI(default_response_class=FastJSONResponse, lifespan=lifespan)
+
+    # 准入控制：写入和报表接口分别限制并发和排队，报表过载时快速返回503，保证扫码写入的处理能力
+    # 放在最内层，503 响应同样带CORS头、计入访问日志和 /metrics
+    app.add_middleware(admission.AdmissionMiddleware, limits={
+        "/api/updateProductProcess": admission.WRITE,
+        "/api/batchUpdateProductProcess": admission.WRITE,
+        "/api/deleteProductProcess": admission.WRITE,
+        "/api/importProductPlan": admission.WRITE,
+        "/api/getUserMonthlyProducts": admission.REPORT,
+        "/api/getUserMonthlyTransactions": admission.REPORT,
+        "/api/getUserTodayProcessCount": admission.REPORT,
+        "/api/getTeamProcessCounts": admission.REPORT,
+    })
+
+    # 添加CORS中间件
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # 允许所有源，生产环境应限制
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # 较大的响应在应用内按 Accept-Encoding 压缩，不只依赖nginx
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=env_int("GZIP_MIN_SIZE", 1024),
+        compresslevel=env_int("GZIP_LEVEL", 5),
+    )
+
+    # 每个请求一条访问日志（endpoint、employee、状态码、耗时），请求期间的日志都带上这些字段
+    app.add_middleware(RequestLogMiddleware)
+
+    # 最外层：/metrics 的请求次数、耗时和正在处理的请求数
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    app.include_router(router)
+    return app
+
+
+def __getattr__(name):
+    # uvicorn main:app、测试和 bench_load 直接使用 main.app：首次访问时创建，导入本模块本身不做初始化
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@asynccontextmanager
+async def lifespan(app):
+    # 启动和停止各执行一次（router.on_event 在当前 FastAPI 版本中会执行两次）
+    await warm_reference_cache()
+    try:
+        yield
+    finally:
+        await shutdown_db_pool()
 
-# 定义数据模型
-class UpdateProductProcess(BaseModel):
-    productCode: str
-    processType: str
-    employeeName: str
-    timeField: str
-    employeeField: str
-    timestamp: str
-
-class BatchUpdateProductProcess(BaseModel):
-    productCodes: List[str]
-    processType: str
-    employeeName: str
-
-class DeleteProductProcess(BaseModel):
-    productCode: str
-    processType: str
-    employeeName: str
-    timeField: str
-    employeeField: str
+
+async def warm_reference_cache():
+    # 接收请求之前预加载基础数据、建好连接池的连接和报表查询语句，并开始监听变更通知；
+    # 数据库暂不可用时首次请求再加载
+    try:
+        await run_read(refcache.cache.warm)
+        await run_read(repository.warm)
+    except Exception as e:
+        logger.warning("预加载基础数据失败: %s", e)
+    # 其他进程删除绕线记录时丢弃本进程记住的最近绕线时间
+    refcache.cache.add_handler(last_activity.CHANNEL, last_activity.forget)
+    # 其他进程写入产品后失效本进程缓存的产品行
+    refcache.cache.add_handler(product_cache.CHANNEL, product_cache.on_notify)
+    refcache.cache.start_listener()
+    if write_queue.ENABLED:
+        write_queue.queue.start()
+
+
+async def shutdown_db_pool():
+    # 先写完队列中的录入，再停止监听和数据库线程池，最后关闭连接池中的所有连接
+    await write_queue.queue.stop()
+    refcache.cache.stop_listener()
+    shutdown_executors()
+    slow_query.shutdown()
+    close_pool()
 
 # API端点
-@app.get("/")
+@router.get("/")
 async def root():
     return {"message": "产品管理系统API"}
 
-@app.get("/api/test")
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus 文本格式的运行指标
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@router.get("/api/test")
 async def test_api():
     """
     简单的测试接口，验证API是否正常工作
@@ -56,368 +165,257 @@ async def test_api():
         "version": "1.0.0"
     }
 
-@app.post("/api/updateProductProcess")
+@router.post("/api/updateProductProcess", response_model=SuccessResponse)
 async def update_product_process(data: UpdateProductProcess):
+    bind(employee=data.employeeName, productCode=data.productCode)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # 查询产品型号
-        cursor.execute('SELECT "产品型号" FROM products WHERE "产品编码" = %s', (data.productCode,))
-        product_row = cursor.fetchone()
-        product_model = product_row["产品型号"] if product_row and isinstance(product_row, dict) else (product_row[0] if product_row else None)
-        # 检查是否在exception表
-        if data.processType == 'wiring':
-            skip_check = False
-            if product_model:
-                cursor.execute('SELECT 1 FROM exception WHERE "产品型号" = %s LIMIT 1', (product_model,))
-                exception_row = cursor.fetchone()
-                if exception_row:
-                    skip_check = True
-            if not skip_check:
-                cursor.execute(
-                    'SELECT "绕线时间" FROM products WHERE "绕线员工" = %s AND "绕线时间" IS NOT NULL ORDER BY "绕线时间" DESC LIMIT 1',
-                    (data.employeeName,)
-                )
-                row = cursor.fetchone()
-                if row:
-                    latest_time = row["绕线时间"] if isinstance(row, dict) else row[0]
-                    try:
-                        from datetime import timezone
-                        now = datetime.now(timezone.utc)
-                        t2 = datetime.fromisoformat(str(latest_time).replace('Z', '+00:00'))
-                        if abs((now - t2).total_seconds()) < 300:
-                            conn.close()
-                            raise HTTPException(status_code=400, detail="两次录入绕线工序时间间隔小于5分钟，禁止录入")
-                    except Exception as e:
-                        pass
-        else:
-            # 查不到产品型号，默认校验
-            cursor.execute(
-                'SELECT "绕线时间" FROM products WHERE "绕线员工" = %s AND "绕线时间" IS NOT NULL ORDER BY "绕线时间" DESC LIMIT 1',
-                (data.employeeName,)
-            )
-            row = cursor.fetchone()
-            if row:
-                latest_time = row["绕线时间"] if isinstance(row, dict) else row[0]
-                try:
-                    from datetime import timezone
-                    now = datetime.now(timezone.utc)
-                    t2 = datetime.fromisoformat(str(latest_time).replace('Z', '+00:00'))
-                    if abs((now - t2).total_seconds()) < 300:
-                        conn.close()
-                        raise HTTPException(status_code=400, detail="两次录入绕线工序时间间隔小于5分钟，禁止录入")
-                except Exception as e:
-                    # 日期格式异常不拦截
-                    pass
-        # 检查产品是否存在
-        cursor.execute(
-            "SELECT * FROM products WHERE \"产品编码\" = %s",
-            (data.productCode,)
-        )
-        product = cursor.fetchone()
-        if not product:
-            # 修改：如果产品不存在，则直接插入新记录，而不是返回错误
-            print(f"产品不存在，创建新记录: {data.productCode}")
-            insert_data = {
-                "产品编码": data.productCode,
-                data.timeField: data.timestamp
-            }
-            if data.employeeField:
-                insert_data[data.employeeField] = data.employeeName
-            columns = ', '.join([f'"{k}"' for k in insert_data.keys()])
-            placeholders = ', '.join(['%s'] * len(insert_data))
-            values = list(insert_data.values())
-            query = f'INSERT INTO products ({columns}) VALUES ({placeholders})'
-            cursor.execute(query, values)
-            conn.commit()
-            conn.close()
-            return {"success": True}
-        # 检查工序字段是否已有数据
-        if product[data.timeField]:
-            conn.close()
-            raise HTTPException(status_code=400, detail="该产品的该工序已存在数据，不能覆盖")
-        # 更新数据
-        update_data = {data.timeField: data.timestamp}
-        if data.employeeField:
-            update_data[data.employeeField] = data.employeeName
-        update_fields = ", ".join([f'"{k}" = %s' for k in update_data.keys()])
-        update_values = list(update_data.values())
-        query = f"UPDATE products SET {update_fields} WHERE \"产品编码\" = %s"
-        cursor.execute(query, update_values + [data.productCode])
-        conn.commit()
-        conn.close()
-        return {"success": True}
+        # 开启 WRITE_QUEUE_ENABLED 时与其他请求合并提交，结果相同
+        return await write_queue.queue.submit(data)
+    except HTTPException:
+        raise
     except Exception as e:
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/batchUpdateProductProcess")
+@router.post("/api/batchUpdateProductProcess", response_model=BatchResultsResponse, response_model_exclude_none=True)
 async def batch_update_product_process(data: BatchUpdateProductProcess):
-    results = []
-    
-    for code in data.productCodes:
-        try:
-            # 构建单个更新请求
-            update_data = UpdateProductProcess(
-                productCode=code,
-                processType=data.processType,
-                employeeName=data.employeeName,
-                timeField=get_time_field(data.processType),
-                employeeField=get_employee_field(data.processType),
-                timestamp=datetime.now(timezone.utc).isoformat()
-            )
-            
-            # 尝试更新
-            try:
-                await update_product_process(update_data)
-                results.append({"code": code, "success": True})
-            except HTTPException as e:
-                # 记录错误信息但继续处理其他产品
-                print(f"更新产品失败: {code}, 错误: {str(e.detail)}")
-                # 如果是400错误（工序已存在），则标记为失败，其他错误(如404-产品不存在)不再出现因为修改了函数
-                results.append({"code": code, "success": False, "error": str(e.detail)})
-        except Exception as e:
-            print(f"处理产品异常: {code}, 错误: {str(e)}")
-            results.append({"code": code, "success": False, "error": str(e)})
+    bind(employee=data.employeeName)
+    # 所有产品编码在一个事务中批量校验、批量写入
+    try:
+        results = await repository.apply_batch_process(
+            data.productCodes,
+            data.processType,
+            data.employeeName,
+            get_time_field(data.processType),
+            get_employee_field(data.processType),
+            datetime.now(timezone.utc).isoformat()
+        )
+    except Exception as e:
+        logger.exception("批量录入异常", extra={"codes": len(data.productCodes)})
+        results = [{"code": code, "success": False, "error": str(e)} for code in data.productCodes]
     
     return {"results": results}
 
-@app.get("/api/getProductDetails")
+@router.post("/api/importProductPlan", response_model=PlanImportResponse)
+async def import_product_plan(
+    file: UploadFile = File(...),
+    header: bool = True,
+    encoding: str = Query("UTF8", max_length=32),
+):
+    """
+    导入生产计划预登记产品：CSV 两列（产品编码、产品型号），header=false 表示没有表头，GBK 文件传 encoding=GBK
+    """
+    try:
+        return await repository.import_plan(file.file, header, encoding)
+    except plan_import.PlanFileError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except plan_import.ImportBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("生产计划导入失败")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await file.close()
+
+@router.get("/api/getProductDetails", response_model=ProductDetailsResponse)
 async def get_product_details(productCode: str):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT * FROM products WHERE \"产品编码\" = %s",
-            (productCode,)
-        )
-        product = cursor.fetchone()
+        product = await repository.get_product(productCode)
         
         if not product:
             raise HTTPException(status_code=404, detail="产品不存在")
         
-        return {"data": dict(product)}
+        return FastJSONResponse({"data": product})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/getUserMonthlyProducts")
-async def get_user_monthly_products(employeeName: str, startDate: str, endDate: str):
-    conn = None
+# 单次批量查询的产品编码上限
+MAX_BATCH_LOOKUP = 500
+
+@router.post("/api/getProductDetailsBatch", response_model=ProductDetailsBatchResponse)
+async def get_product_details_batch(data: ProductDetailsBatch):
+    """
+    一次查询多个产品编码，每行格式与 getProductDetails 的 data 相同；
+    fields 可选，只返回指定列（始终包含产品编码）
+    """
+    if len(data.productCodes) > MAX_BATCH_LOOKUP:
+        raise HTTPException(status_code=400, detail=f"一次最多查询{MAX_BATCH_LOOKUP}个产品编码")
+    try:
+        rows, not_found = await repository.get_products(data.productCodes, data.fields)
+        return FastJSONResponse({"data": rows, "notFound": not_found})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 月度查询分页每页最大行数
+MAX_PAGE_SIZE = 5000
+
+STREAM_FORMATS = {"json": "application/json", "ndjson": "application/x-ndjson"}
+
+def transaction_item(row):
+    # 分页查询的行带有 sort_time / seq 排序键，不输出
+    return {
+        "process": row["process"],
+        "productCode": row["productCode"],
+        "model": row["model"],
+        "time": row["time"]
+    }
+
+def split_page(kind, rows, limit):
+    """
+    查询时多取了一行：超出 limit 说明还有下一页，返回 (本页行, 下一页游标)
+    """
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, repository.encode_cursor(repository.page_key(kind, rows[-1]))
+
+def monthly_stream_response(kind, stream, fmt, limit, to_item, extra, headers):
+    """
+    流式输出月度查询结果，每批行编码后立即发送
+
+    fmt=json 时输出与非流式相同结构的 JSON；fmt=ndjson 时每行一条记录，
+    分页时最后一行为 {"nextCursor": ...}
+    """
+    async def body():
+        sent = 0
+        last = None
+        more = False
+        if fmt == "json":
+            yield b'{"data":['
+        async for rows in repository.iter_monthly_stream(stream):
+            if limit is not None and sent + len(rows) > limit:
+                rows = rows[:limit - sent]
+                more = True
+            if rows:
+                items = [to_item(row) for row in rows] if to_item else rows
+                if fmt == "json":
+                    # 整批编码为数组后去掉首尾的方括号
+                    yield (b"," if sent else b"") + dumps(items)[1:-1]
+                else:
+                    yield b"\n".join(dumps(item) for item in items) + b"\n"
+                sent += len(rows)
+                last = rows[-1]
+            if more:
+                break
+        next_cursor = repository.encode_cursor(repository.page_key(kind, last)) if more else None
+        tail = dict(extra)
+        if limit is not None:
+            tail["nextCursor"] = next_cursor
+        if fmt == "json":
+            yield b"]," + dumps(tail)[1:] if tail else b"]}"
+        elif limit is not None:
+            yield dumps({"nextCursor": next_cursor}) + b"\n"
+        logger.debug("流式输出", extra={"rows": sent})
+
+    return StreamingResponse(
+        body(),
+        media_type=STREAM_FORMATS[fmt],
+        headers=headers,
+        # 响应未开始发送就中断时也要归还连接
+        background=BackgroundTask(repository.close_monthly_stream, stream)
+    )
+
+async def monthly_query(request, kind, employeeName, startDate, endDate, limit, cursor, stream, extra):
+    """
+    月度查询的公共流程：limit/cursor 为按键分页，stream 为流式输出（json 或 ndjson），都不传时返回完整列表
+
+    查询结果的列名即接口字段名，行直接编码输出；只有分页的交易记录需要去掉排序键。
+    ETag 由匹配员工的数据版本和请求参数计算，If-None-Match 相同时返回 304，不执行查询
+    """
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail="stream 只支持 json 或 ndjson")
+    after = repository.decode_cursor(kind, cursor) if cursor else None
+    to_item = transaction_item if kind == repository.TRANSACTIONS and limit is not None else None
+    start_date, end_date = parse_date_range(startDate, endDate)
+    logger.debug("日期范围", extra={"start": start_date.isoformat(), "end": end_date.isoformat()})
+    # 版本号在查询之前读取：查询期间有写入时 ETag 偏旧，下次请求会重新查询，不会返回过期的 304
+    version = await repository.get_data_version(employeeName)
+    etag = make_etag(
+        kind, version, employee_key(employeeName), start_date.isoformat(), end_date.isoformat(), limit, cursor, stream
+    )
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    if stream is not None:
+        rows_stream = await repository.open_monthly_stream(kind, employeeName, start_date, end_date, limit, after)
+        return monthly_stream_response(kind, rows_stream, stream, limit, to_item, extra, etag_headers(etag))
+    # 同时到达的相同请求共享一次查询
+    fetch = repository.get_monthly_products if kind == repository.PRODUCTS else repository.get_monthly_transactions
+    rows = await singleflight.group.do(kind, etag, fetch, employeeName, start_date, end_date, limit, after)
+    rows, next_cursor = split_page(kind, rows, limit)
+    response = {"data": [to_item(row) for row in rows] if to_item else rows, **extra}
+    if limit is not None:
+        response["nextCursor"] = next_cursor
+    logger.debug("返回行数", extra={"rows": len(rows)})
+    return FastJSONResponse(response, headers=etag_headers(etag))
+
+@router.get("/api/getUserMonthlyProducts", response_model=MonthlyProductsResponse)
+async def get_user_monthly_products(
+    request: Request,
+    employeeName: str,
+    startDate: str,
+    endDate: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = None
+):
+    """
+    员工匹配和日期范围过滤都在数据库中完成
+
+    分页按产品编码排序，limit 为每页行数，cursor 为上一页返回的 nextCursor
+    """
     try:
-        # 先获取所有产品
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = """
-        SELECT * FROM products 
-        WHERE ("绕线员工" LIKE %s OR "嵌线员工" LIKE %s OR "接线员工" LIKE %s OR 
-                   "压装员工" LIKE %s OR "车止口员工" LIKE %s OR "浸漆员工" LIKE %s)
-        ORDER BY "产品编码"
-        """
-        
-        # 在参数两侧添加%以进行模糊匹配
-        search_name = f"%{employeeName.strip()}%"
-        cursor.execute(query, [search_name] * 6)
-        products = cursor.fetchall()
-        
-        # 查询完毕后关闭连接
-        conn.close()
-        conn = None
-        
-        # 在Python中过滤日期范围
-        try:
-            start_date = datetime.fromisoformat(startDate.replace('Z', '+00:00'))
-            end_date = datetime.fromisoformat(endDate.replace('Z', '+00:00'))
-            print(f"[DEBUG] 日期解析成功: start_date={start_date}, end_date={end_date}")
-        except Exception as e:
-            print(f"[ERROR] 日期解析错误: {str(e)}")
-            # 如果日期解析失败，使用当前月份范围
-            now = datetime.now()
-            start_date = datetime(now.year, now.month, 1)
-            # 正确处理月份溢出
-            if now.month == 12:
-                end_date = datetime(now.year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end_date = datetime(now.year, now.month + 1, 1) - timedelta(days=1)
-            end_date = datetime(end_date.year, end_date.month, end_date.day, 23, 59, 59)
-            
-        print(f"[DEBUG] 日期范围: {start_date.isoformat()} 至 {end_date.isoformat()}")
-        
-        filtered_products = []
-        for product in products:
-            try:
-                # 检查员工是否在时间范围内参与了工序，使用更宽松的匹配
-                if is_employee_match(product.get("绕线员工"), employeeName) and is_in_time_range(product, "绕线时间", employeeName, start_date, end_date) or \
-                   is_employee_match(product.get("嵌线员工"), employeeName) and is_in_time_range(product, "嵌线时间", employeeName, start_date, end_date) or \
-                   is_employee_match(product.get("接线员工"), employeeName) and is_in_time_range(product, "接线时间", employeeName, start_date, end_date) or \
-                   is_employee_match(product.get("压装员工"), employeeName) and is_in_time_range(product, "压装时间", employeeName, start_date, end_date) or \
-                   is_employee_match(product.get("车止口员工"), employeeName) and is_in_time_range(product, "车止口时间", employeeName, start_date, end_date) or \
-                   is_employee_match(product.get("浸漆员工"), employeeName) and is_in_time_range(product, "浸漆时间", employeeName, start_date, end_date):
-                    filtered_products.append(dict(product))
-            except Exception as e:
-                print(f"[ERROR] 处理产品时出错: {str(e)}")
-        
-        print(f"[DEBUG] 过滤后产品数量: {len(filtered_products)}")
-        
         # 返回响应，添加特殊标记以便前端处理
-        response = {
-            "data": filtered_products,
-            "client_info": {
-                "is_ios": False
-            }
-        }
-        
-        return response
+        return await monthly_query(
+            request, repository.PRODUCTS, employeeName, startDate, endDate, limit, cursor, stream,
+            {"client_info": {"is_ios": False}}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] 总体异常: {str(e)}")
+        logger.exception("查询月度产品失败")
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
-@app.get("/api/getUserMonthlyTransactions")
-async def get_user_monthly_transactions(employeeName: str, startDate: str, endDate: str):
-    conn = None
+@router.get("/api/getUserMonthlyTransactions", response_model=MonthlyTransactionsResponse)
+async def get_user_monthly_transactions(
+    request: Request,
+    employeeName: str,
+    startDate: str,
+    endDate: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: Optional[str] = None
+):
+    """
+    六个工序在数据库中展开为交易记录并过滤
+
+    不分页时按产品编码排序；分页时按 (时间, 产品编码) 排序，limit 为每页行数，cursor 为上一页返回的 nextCursor
+    """
     try:
-        print(f"查询月度交易: employeeName={employeeName}, startDate={startDate}, endDate={endDate}")
-        
-        # 先获取所有产品
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        query = """
-        SELECT * FROM products 
-        WHERE ("绕线员工" LIKE %s OR "嵌线员工" LIKE %s OR "接线员工" LIKE %s OR 
-                   "压装员工" LIKE %s OR "车止口员工" LIKE %s OR "浸漆员工" LIKE %s)
-        ORDER BY "产品编码"
-        """
-        
-        # 在参数两侧添加%以进行模糊匹配
-        search_name = f"%{employeeName.strip()}%"
-        cursor.execute(query, [search_name] * 6)
-        products = cursor.fetchall()
-        
-        print(f"查询到 {len(products)} 条产品记录")
-        
-        # 查询完毕后关闭连接
-        conn.close()
-        conn = None
-        
-        # 处理成交易记录格式
-        try:
-            start_date = datetime.fromisoformat(startDate.replace('Z', '+00:00'))
-            end_date = datetime.fromisoformat(endDate.replace('Z', '+00:00'))
-        except Exception as e:
-            print(f"日期解析错误: {str(e)}")
-            # 如果日期解析失败，使用当前月份范围
-            now = datetime.now()
-            start_date = datetime(now.year, now.month, 1)
-            # 正确处理月份溢出
-            if now.month == 12:
-                end_date = datetime(now.year + 1, 1, 1) - timedelta(days=1)
-            else:
-                end_date = datetime(now.year, now.month + 1, 1) - timedelta(days=1)
-            end_date = datetime(end_date.year, end_date.month, end_date.day, 23, 59, 59)
-        
-        transactions = []
-        
-        for product in products:
-            try:
-                product_dict = dict(product)
-                
-                # 检查每个工序，使用更宽松的员工名称匹配
-                if is_employee_match(product_dict.get("绕线员工"), employeeName) and is_date_in_range(product_dict.get("绕线时间"), start_date, end_date):
-                    transactions.append({
-                        "process": "绕线",
-                        "productCode": product_dict.get("产品编码"),
-                        "model": product_dict.get("产品型号", "未知型号"),
-                        "time": product_dict.get("绕线时间")
-                    })
-                
-                if is_employee_match(product_dict.get("嵌线员工"), employeeName) and is_date_in_range(product_dict.get("嵌线时间"), start_date, end_date):
-                    transactions.append({
-                        "process": "嵌线",
-                        "productCode": product_dict.get("产品编码"),
-                        "model": product_dict.get("产品型号", "未知型号"),
-                        "time": product_dict.get("嵌线时间")
-                    })
-                
-                if is_employee_match(product_dict.get("接线员工"), employeeName) and is_date_in_range(product_dict.get("接线时间"), start_date, end_date):
-                    transactions.append({
-                        "process": "接线",
-                        "productCode": product_dict.get("产品编码"),
-                        "model": product_dict.get("产品型号", "未知型号"),
-                        "time": product_dict.get("接线时间")
-                    })
-                
-                if is_employee_match(product_dict.get("压装员工"), employeeName) and is_date_in_range(product_dict.get("压装时间"), start_date, end_date):
-                    transactions.append({
-                        "process": "压装",
-                        "productCode": product_dict.get("产品编码"),
-                        "model": product_dict.get("产品型号", "未知型号"),
-                        "time": product_dict.get("压装时间")
-                    })
-                
-                if is_employee_match(product_dict.get("车止口员工"), employeeName) and is_date_in_range(product_dict.get("车止口时间"), start_date, end_date):
-                    transactions.append({
-                        "process": "车止口",
-                        "productCode": product_dict.get("产品编码"),
-                        "model": product_dict.get("产品型号", "未知型号"),
-                        "time": product_dict.get("车止口时间")
-                    })
-
-                if is_employee_match(product_dict.get("浸漆员工"), employeeName) and is_date_in_range(product_dict.get("浸漆时间"), start_date, end_date):
-                    transactions.append({
-                        "process": "浸漆",
-                        "productCode": product_dict.get("产品编码"),
-                        "model": product_dict.get("产品型号", "未知型号"),
-                        "time": product_dict.get("浸漆时间")
-                    })
-            except Exception as e:
-                print(f"处理产品交易记录时出错: {str(e)}")
-                # 继续处理下一个产品
-                continue
-        
-        print(f"筛选后 {len(transactions)} 条交易记录在时间范围内")
-        
-        return {"data": transactions}
+        logger.debug("查询月度交易", extra={"startDate": startDate, "endDate": endDate})
+        return await monthly_query(
+            request, repository.TRANSACTIONS, employeeName, startDate, endDate, limit, cursor, stream,
+            {}
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"查询月度交易失败: {str(e)}")
+        logger.exception("查询月度交易失败")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/deleteProductProcess")
+@router.post("/api/deleteProductProcess", response_model=SuccessResponse)
 async def delete_product_process(data: DeleteProductProcess):
-    conn = None
+    bind(employee=data.employeeName, productCode=data.productCode)
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # 检查产品是否存在
-        cursor.execute(
-            "SELECT * FROM products WHERE \"产品编码\" = %s",
-            (data.productCode,)
-        )
-        product = cursor.fetchone()
-        if not product:
-            raise HTTPException(status_code=404, detail="产品不存在")
-        # 检查是否是当前用户的工序 - 浸漆工序特殊处理
-        if data.employeeField and data.processType != '浸漆' and product[data.employeeField] != data.employeeName:
-            raise HTTPException(status_code=403, detail="不是当前用户的工序")
-        # 清除工序信息
-        update_data = {data.timeField: None}
-        if data.employeeField:
-            update_data[data.employeeField] = None
-        update_fields = ", ".join([f"\"{k}\" = %s" for k in update_data.keys()])
-        update_values = list(update_data.values())
-        query = f"UPDATE products SET {update_fields} WHERE \"产品编码\" = %s"
-        cursor.execute(query, update_values + [data.productCode])
-        conn.commit()
-        return {"success": True}
+        return await repository.clear_product_process(data)
+    except HTTPException:
+        raise
     except Exception as e:
-        if conn:
-            conn.rollback()
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if conn:
-            conn.close()
 
 # 辅助函数
 def get_time_field(process_type):
@@ -428,16 +426,34 @@ def get_employee_field(process_type):
     process_name = get_chinese_process_name(process_type)
     return f"{process_name}员工"
 
+def parse_date_range(startDate, endDate):
+    """
+    解析查询的起止时间，解析失败时使用当前月份范围
+    """
+    try:
+        start_date = datetime.fromisoformat(startDate.replace('Z', '+00:00'))
+        end_date = datetime.fromisoformat(endDate.replace('Z', '+00:00'))
+    except Exception as e:
+        logger.warning("日期解析错误: %s", e)
+        now = datetime.now()
+        start_date = datetime(now.year, now.month, 1)
+        # 正确处理月份溢出
+        if now.month == 12:
+            end_date = datetime(now.year + 1, 1, 1) - timedelta(days=1)
+        else:
+            end_date = datetime(now.year, now.month + 1, 1) - timedelta(days=1)
+        end_date = datetime(end_date.year, end_date.month, end_date.day, 23, 59, 59)
+    return start_date, end_date
+
 def get_chinese_process_name(process_type):
-    mapping = {
-        'wiring': '绕线',
-        'embedding': '嵌线',
-        'wiring_connect': '接线',
-        'pressing': '压装',
-        'stopper': '车止口',
-        'immersion': '浸漆'
-    }
-    return mapping.get(process_type, process_type)
+    # 工序列表见 processes.py（PROCESSES）
+    return processes.name_of(process_type)
+
+def employee_key(employee_name):
+    """
+    ETag 和请求合并用的员工名：去掉首尾空白后查询结果相同（全是空白的名字保持原样）
+    """
+    return employee_name.strip() or employee_name
 
 def is_employee_match(db_employee, query_employee):
     if not db_employee or not query_employee:
@@ -456,49 +472,21 @@ def is_in_time_range(product, time_field, employee_name, start_date, end_date):
     
     time_value = product.get(time_field)
     try:
-        # 直接处理datetime对象
-        if isinstance(time_value, datetime):
-            print(f"日期对象直接比较: {time_field}={time_value}")
-            # 确保时区正确处理
-            if time_value.tzinfo is not None and start_date.tzinfo is None:
-                # 如果需要，可以移除时区信息或调整时区
-                time_naive = time_value.replace(tzinfo=None)
-                result = start_date <= time_naive <= end_date
-            else:
-                result = start_date <= time_value <= end_date
-            
-            if result:
-                print(f"时间在范围内: {time_field}={time_value}, 比较结果={result}")
-            return result
+        time = normalize_timestamp(time_value)
+        if time is None:
+            # 所有格式都无法解析
+            return False
         
-        # 处理字符串格式日期
-        time_str = str(time_value)
-        try:
-            time = datetime.fromisoformat(time_str.replace('Z', '+00:00'))
-        except:
-            # 尝试其他格式
-            formats = ["%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", 
-                       "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y"]
-            for fmt in formats:
-                try:
-                    time = datetime.strptime(time_str, fmt)
-                    break
-                except:
-                    continue
-            else:
-                # 如果所有格式都失败
-                return False
-                
         # 确保时区一致
         if time.tzinfo is not None and start_date.tzinfo is None:
             time = time.replace(tzinfo=None)
             
         result = start_date <= time <= end_date
         if result:
-            print(f"时间在范围内: {time_field}={time_str}, 比较结果={result}")
+            row_logger.debug("时间在范围内: %s=%s", time_field, time_value)
         return result
     except Exception as e:
-        print(f"时间格式错误: {time_field}={time_value}, 错误={str(e)}")
+        row_logger.warning("时间格式错误: %s=%s, 错误=%s", time_field, time_value, e)
         return False
 
 def is_date_in_range(date_value, start_date, end_date):
@@ -506,38 +494,10 @@ def is_date_in_range(date_value, start_date, end_date):
         return False
     
     try:
-        # 直接处理datetime对象
-        if isinstance(date_value, datetime):
-            print(f"日期对象直接比较: {date_value}")
-            # 确保时区正确处理
-            if date_value.tzinfo is not None and start_date.tzinfo is None:
-                # 如果需要，可以移除时区信息或调整时区
-                date_naive = date_value.replace(tzinfo=None)
-                result = start_date <= date_naive <= end_date
-            else:
-                result = start_date <= date_value <= end_date
-            
-            if result:
-                print(f"日期在范围内: {date_value}, 比较结果={result}")
-            return result
-            
-        # 处理字符串格式日期
-        date_str = str(date_value)
-        try:
-            date = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        except:
-            # 尝试其他格式
-            formats = ["%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S", 
-                       "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y"]
-            for fmt in formats:
-                try:
-                    date = datetime.strptime(date_str, fmt)
-                    break
-                except:
-                    continue
-            else:
-                # 如果所有格式都失败
-                return False
+        date = normalize_timestamp(date_value)
+        if date is None:
+            # 所有格式都无法解析
+            return False
         
         # 确保时区一致
         if date.tzinfo is not None and start_date.tzinfo is None:
@@ -545,30 +505,23 @@ def is_date_in_range(date_value, start_date, end_date):
             
         result = start_date <= date <= end_date
         if result:
-            print(f"日期在范围内: {date_str}, 比较结果={result}")
+            row_logger.debug("日期在范围内: %s", date_value)
         return result
     except Exception as e:
-        print(f"日期格式错误: {date_value}, 错误={str(e)}")
+        row_logger.warning("日期格式错误: %s, 错误=%s", date_value, e)
         return False
 
-@app.get("/api/getMonthRange")
+@router.get("/api/getMonthRange", response_model=MonthRangeResponse)
 async def get_month_range():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         # 尝试从数据库获取月份范围
         try:
             # 查询month_range表
-            cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'month_range'")
-            columns = [col["column_name"] for col in cursor.fetchall()]
-            print(f"month_range表的列: {columns}")
-            
-            cursor.execute("SELECT * FROM month_range ORDER BY id DESC LIMIT 1")
-            range_data = cursor.fetchone()
+            columns, range_data = await repository.get_month_range()
+            logger.debug("month_range表的列: %s", columns)
             
             if range_data:
-                print(f"获取到月份范围数据: {range_data}")
+                logger.debug("获取到月份范围数据: %s", range_data)
                 # 尝试确定正确的列名
                 start_date_field = None
                 end_date_field = None
@@ -585,7 +538,7 @@ async def get_month_range():
                         break
                 
                 if start_date_field and end_date_field:
-                    print(f"使用字段: start={start_date_field}, end={end_date_field}")
+                    logger.debug("使用字段: start=%s, end=%s", start_date_field, end_date_field)
                     start_date = range_data[start_date_field]
                     end_date = range_data[end_date_field]
                     
@@ -597,127 +550,135 @@ async def get_month_range():
                             }
                         }
                 else:
-                    print(f"无法找到合适的日期字段，返回默认日期")
+                    logger.warning("month_range表无法找到合适的日期字段，返回默认日期")
             else:
-                print("没有找到月份范围数据")
+                logger.info("没有找到月份范围数据")
                 
         except Exception as db_error:
-            print(f"查询month_range表出错: {str(db_error)}")
+            logger.error("查询month_range表出错: %s", db_error)
             
-        return {
-            "data": {
-                "startDate": first_day.isoformat(),
-                "endDate": last_day.isoformat()
-            }
-        }
-    except Exception as e:
-        print(f"获取月份范围出错: {str(e)}")
-        # 出错时返回当前月份
-        now = datetime.now()
-        first_day = datetime(now.year, now.month, 1)
-        # 正确处理月份溢出
-        if now.month == 12:
-            last_day = datetime(now.year + 1, 1, 1) - timedelta(days=1)
-        else:
-            last_day = datetime(now.year, now.month + 1, 1) - timedelta(days=1)
-        last_day = datetime(last_day.year, last_day.month, last_day.day, 23, 59, 59)
-        
-        return {
-            "data": {
-                "startDate": first_day.isoformat(),
-                "endDate": last_day.isoformat()
-            }
+        return default_month_range()
+    except Exception:
+        logger.exception("获取月份范围出错")
+        return default_month_range()
+
+def default_month_range():
+    # 返回当前月份
+    now = datetime.now()
+    first_day = datetime(now.year, now.month, 1)
+    # 正确处理月份溢出
+    if now.month == 12:
+        last_day = datetime(now.year + 1, 1, 1) - timedelta(days=1)
+    else:
+        last_day = datetime(now.year, now.month + 1, 1) - timedelta(days=1)
+    last_day = datetime(last_day.year, last_day.month, last_day.day, 23, 59, 59)
+    
+    return {
+        "data": {
+            "startDate": first_day.isoformat(),
+            "endDate": last_day.isoformat()
         }
+    }
 
-@app.get("/api/modelSeries")
-async def get_model_series():
+@router.get("/api/modelSeries", response_model=RowsResponse)
+async def get_model_series(request: Request):
     """
     获取所有产品型号与工艺分类信息
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM model_series')
-        rows = cursor.fetchall()
-        return {"data": rows}
+        rows, version = await repository.get_model_series()
+        etag = make_etag("model_series", version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return FastJSONResponse({"data": rows}, headers=etag_headers(etag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/seriesProcesses")
-async def get_series_processes():
+@router.get("/api/seriesProcesses", response_model=RowsResponse)
+async def get_series_processes(request: Request):
     """
     获取所有工艺分类与工序流程信息
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM series_processes')
-        rows = cursor.fetchall()
-        return {"data": rows}
+        rows, version = await repository.get_series_processes()
+        etag = make_etag("series_processes", version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        return FastJSONResponse({"data": rows}, headers=etag_headers(etag))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/getUserTodayProcessCount")
-async def get_user_today_process_count(employeeName: str = Query(...)):
-    conn = None
+@router.get("/api/getUserTodayProcessCount", response_model=ProcessCountResponse)
+async def get_user_today_process_count(request: Request, employeeName: str = Query(...)):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        # 获取东八区时区
-        tz = timezone(timedelta(hours=8))
-        now = datetime.now(tz)
-        start_date = datetime(now.year, now.month, now.day, 0, 0, 0, tzinfo=tz)
-        end_date = datetime(now.year, now.month, now.day, 23, 59, 59, tzinfo=tz)
-        # 查询所有与该员工有关的产品
-        query = '''
-        SELECT * FROM products 
-        WHERE ("绕线员工" LIKE %s OR "嵌线员工" LIKE %s OR "接线员工" LIKE %s OR 
-                   "压装员工" LIKE %s OR "车止口员工" LIKE %s OR "浸漆员工" LIKE %s)
-        '''
-        search_name = f"%{employeeName.strip()}%"
-        cursor.execute(query, [search_name] * 6)
-        products = cursor.fetchall()
-        conn.close()
-        conn = None
-        # 统计每个工序今日数量
-        process_map = {
-            "绕线": ("绕线员工", "绕线时间"),
-            "嵌线": ("嵌线员工", "嵌线时间"),
-            "接线": ("接线员工", "接线时间"),
-            "压装": ("压装员工", "压装时间"),
-            "车止口": ("车止口员工", "车止口时间"),
-            "浸漆": ("浸漆员工", "浸漆时间")
-        }
+        # 东八区的今天
+        today = datetime.now(SHANGHAI_TZ).date()
+        version = await repository.get_data_version(employeeName)
+        etag = make_etag("today", version, employee_key(employeeName), today.isoformat())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        # 读取计数表中今天与员工名宽松匹配的员工的记录，按工序汇总
+        rows = await singleflight.group.do("today", etag, repository.get_day_process_counts, today, employeeName)
+        counts = {}
+        for row in rows:
+            counts[row["process"]] = counts.get(row["process"], 0) + row["count"]
         result = []
-        for process, (emp_field, time_field) in process_map.items():
-            count = 0
-            for product in products:
-                if is_employee_match(product.get(emp_field), employeeName):
-                    t = product.get(time_field)
-                    if t:
-                        try:
-                            # 统一转为东八区时间
-                            if isinstance(t, str):
-                                dt = datetime.fromisoformat(t.replace('Z', '+00:00'))
-                                if dt.tzinfo is None:
-                                    dt = dt.replace(tzinfo=tz)
-                                else:
-                                    dt = dt.astimezone(tz)
-                            elif isinstance(t, datetime):
-                                if t.tzinfo is None:
-                                    dt = t.replace(tzinfo=tz)
-                                else:
-                                    dt = t.astimezone(tz)
-                            else:
-                                continue
-                            if start_date <= dt <= end_date:
-                                count += 1
-                        except Exception:
-                            continue
+        for process, _, _ in PROCESS_COLUMNS:
+            count = counts.get(process, 0)
             if count > 0:
                 result.append({"process": process, "count": count})
-        return {"data": result}
+        return FastJSONResponse({"data": result}, headers=etag_headers(etag))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 全员汇总一次最多查询的天数
+TEAM_COUNTS_MAX_DAYS = 92
+PROCESS_ORDER = {process: i for i, (process, _, _) in enumerate(PROCESS_COLUMNS)}
+
+@router.get("/api/getTeamProcessCounts", response_model=TeamProcessCountResponse)
+async def get_team_process_counts(
+    request: Request,
+    startDate: Optional[str] = None,
+    endDate: Optional[str] = None,
+    byModel: bool = False
+):
+    """
+    所有员工在东八区日期范围内（YYYY-MM-DD，含首尾，默认今天）的工序计数，一条聚合语句
+
+    读取每日计数表，与 getUserTodayProcessCount 的日期边界相同；byModel=true 时再按产品型号分开
+    """
+    try:
+        today = datetime.now(SHANGHAI_TZ).date()
+        try:
+            start = date.fromisoformat(startDate) if startDate else today
+            end = date.fromisoformat(endDate) if endDate else start
+        except ValueError:
+            raise HTTPException(status_code=400, detail="日期格式应为 YYYY-MM-DD")
+        if end < start or (end - start).days >= TEAM_COUNTS_MAX_DAYS:
+            raise HTTPException(status_code=400, detail=f"日期范围无效，最多 {TEAM_COUNTS_MAX_DAYS} 天")
+        version = await repository.get_total_version()
+        etag = make_etag("team", version, start.isoformat(), end.isoformat(), byModel)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        rows = await singleflight.group.do("team", etag, repository.get_team_counts, start, end, byModel)
+        rows = sorted(
+            rows, key=lambda r: (r["employee"], PROCESS_ORDER.get(r["process"], len(PROCESS_ORDER)), r.get("model") or "")
+        )
+        return FastJSONResponse(
+            {"startDate": start.isoformat(), "endDate": end.isoformat(), "data": rows},
+            headers=etag_headers(etag)
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/api/employees/search", response_model=EmployeeSearchResponse)
+async def search_employees(q: str = Query(..., max_length=64), limit: int = Query(10, ge=1, le=50)):
+    """
+    员工名自动补全：去掉空格后包含输入的员工
+    """
+    try:
+        return FastJSONResponse({"data": await repository.search_employees(q, limit)})
     except Exception as e:
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=str(e))
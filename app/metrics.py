@@ -0,0 +1,209 @@
+"""
+Prometheus 文本格式的运行指标（/metrics）
+
+- 请求：按路由模板统计次数（含状态码）、耗时直方图、正在处理的请求数
+- 数据库：按操作名统计耗时直方图和取回行数，连接池取连接的等待时间直方图
+- 采集时附带连接池、产品行缓存和日志队列的当前状态
+
+每次观测只做一次 bisect 和一次加锁累加，生产环境可常开。
+指标保存在进程内存中，多进程部署时每个进程分别统计。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# 当前数据库操作取回的行数，由 database.CountingCursor 累加
+query_rows = ContextVar("query_rows", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ACQUIRE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+ROW_BUCKETS = (0, 1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+INF_BUCKET = 'le="+Inf"'
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._values = {}  # 标签 -> [各桶计数..., 总和, 次数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, INF_BUCKET)} {state[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(state[-2])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {state[-1]}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "HTTP请求数", ("route", "method", "status"))
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "HTTP请求耗时", ("route", "method"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "正在处理的HTTP请求数")
+QUERY_LATENCY = Histogram("db_query_duration_seconds", "数据库操作耗时（含取连接）", ("query",))
+QUERY_ROWS = Histogram("db_query_rows", "数据库操作取回的行数", ("query",), buckets=ROW_BUCKETS)
+QUERY_ERRORS = Counter("db_query_errors_total", "数据库操作异常次数", ("query",))
+POOL_ACQUIRE = Histogram("db_pool_acquire_seconds", "从连接池取连接的等待时间", buckets=ACQUIRE_BUCKETS)
+
+_collectors = [REQUESTS, REQUEST_LATENCY, IN_FLIGHT, QUERY_LATENCY, QUERY_ROWS, QUERY_ERRORS, POOL_ACQUIRE]
+_gauge_sources = []  # (指标名前缀, 说明, 返回 dict 的函数)
+
+
+def register(collector):
+    """
+    登记其他模块定义的指标
+    """
+    _collectors.append(collector)
+    return collector
+
+
+def add_gauges(prefix, help_text, source):
+    """
+    采集时调用 source()，把其中的数值项输出为 <prefix>_<key> 指标
+    """
+    _gauge_sources.append((prefix, help_text, source))
+
+
+def timed_call(name, func, *args, **kwargs):
+    """
+    执行一次数据库操作并记录耗时、取回行数和异常（在工作线程中调用）
+    """
+    token = query_rows.set([0])
+    start = time.perf_counter()
+    try:
+        return func(*args, **kwargs)
+    except Exception:
+        QUERY_ERRORS.inc(name)
+        raise
+    finally:
+        QUERY_LATENCY.observe(time.perf_counter() - start, name)
+        QUERY_ROWS.observe(query_rows.get()[0], name)
+        query_rows.reset(token)
+
+
+def count_rows(n):
+    counter = query_rows.get()
+    if counter is not None:
+        counter[0] += n
+
+
+def render():
+    lines = []
+    for collector in _collectors:
+        lines.extend(collector.render())
+    for prefix, help_text, source in _gauge_sources:
+        try:
+            values = source()
+        except Exception:
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"{prefix}_{key}"
+            lines.append(f"# HELP {name} {help_text} {key}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    ASGI 中间件：按路由模板记录请求次数、耗时和正在处理的请求数
+
+    未匹配到路由的请求（404等）统一记为 route="unmatched"，避免标签无限增长
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUEST_LATENCY.observe(time.perf_counter() - start, path, method)
+            REQUESTS.inc(path, method, str(status["code"]))
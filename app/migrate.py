@@ -0,0 +1,69 @@
+"""
+数据库版本化迁移
+
+按文件名顺序执行 migrations/ 目录下尚未执行的 .sql 文件，执行记录保存在 schema_migrations 表中。
+
+用法:
+    cd app
+    python3 migrate.py            # 执行所有未执行的迁移
+    python3 migrate.py --list     # 查看迁移状态
+"""
+import os
+import sys
+
+from database import get_connection
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+def list_migrations():
+    return sorted(f for f in os.listdir(MIGRATIONS_DIR) if f.endswith('.sql'))
+
+
+def applied_versions(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version text PRIMARY KEY,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cursor.fetchall()}
+
+
+def migrate():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        done = applied_versions(cursor)
+        conn.commit()
+        for name in list_migrations():
+            if name in done:
+                continue
+            with open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8') as f:
+                sql = f.read()
+            print(f"执行迁移: {name}")
+            # 每个迁移文件一个事务，失败则整体回滚
+            try:
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (version) VALUES (%s)", (name,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                print(f"迁移失败: {name}")
+                raise
+
+
+def show_status():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        done = applied_versions(cursor)
+        conn.commit()
+    for name in list_migrations():
+        print(f"{'[已执行]' if name in done else '[未执行]'} {name}")
+
+
+if __name__ == "__main__":
+    if "--list" in sys.argv[1:]:
+        show_status()
+    else:
+        migrate()
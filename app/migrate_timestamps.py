@@ -0,0 +1,244 @@
+"""
+工序时间列转换为 timestamptz
+
+六个 "*时间" 列目前是字符串，格式混杂。转换分三步进行，可随时中断后重跑：
+
+    cd app
+    python3 migrate_timestamps.py prepare     # 为每个时间列增加影子列 "<列名>_tz" timestamptz 和同步触发器
+    python3 migrate_timestamps.py backfill    # 分批解析并写入影子列，无法解析的值写入报告
+    python3 migrate_timestamps.py swap        # 锁表补齐增量后，原列改名为 "<列名>_legacy"，影子列改为原列名
+    python3 migrate_timestamps.py status      # 查看各列进度
+    python3 migrate_timestamps.py drop-legacy # 确认无误后删除 "<列名>_legacy" 列
+
+- 不带时区的值按东八区解释（与 getUserTodayProcessCount 一致），可用 --naive-tz 修改
+- 无法解析的值不会丢失：swap 后原始值仍保存在 "<列名>_legacy" 列，同时记录在报告文件中
+  （每次 backfill / swap 重写报告，内容为当时所有无法解析的值）
+- backfill 之后时间列被改写（删除后重新扫码）时，触发器清空影子列，swap 时重新转换
+"""
+import argparse
+import csv
+import os
+from datetime import timezone, timedelta
+
+from psycopg2.extras import execute_values
+
+from database import get_connection
+from processes import PROCESS_COLUMNS
+from timeutil import normalize_timestamp, to_timezone
+
+TIME_COLUMNS = [time_col for _, _, time_col in PROCESS_COLUMNS]
+DEFAULT_REPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'logs', 'timestamp_migration_unparsed.csv')
+
+
+def shadow(col):
+    return f"{col}_tz"
+
+
+def legacy(col):
+    return f"{col}_legacy"
+
+
+def sync_function(col):
+    return f"products_{col}_tz_sync"
+
+
+def parse_tz(value):
+    # 形如 +08:00 / -05:30
+    sign = -1 if value.startswith('-') else 1
+    hours, _, minutes = value.lstrip('+-').partition(':')
+    return timezone(sign * timedelta(hours=int(hours), minutes=int(minutes or 0)))
+
+
+def column_types(cursor):
+    cursor.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'products'"
+    )
+    return {row["column_name"]: row["data_type"] for row in cursor.fetchall()}
+
+
+def pending_columns(types):
+    """
+    仍需转换的时间列（尚不是 timestamptz）
+    """
+    return [col for col in TIME_COLUMNS if types.get(col) != 'timestamp with time zone']
+
+
+def prepare():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        types = column_types(cursor)
+        for col in pending_columns(types):
+            cursor.execute(f'ALTER TABLE products ADD COLUMN IF NOT EXISTS "{shadow(col)}" timestamptz')
+            # 时间列被改写时清空影子列，由 backfill / swap 按新值重新转换
+            cursor.execute(f'''
+                CREATE OR REPLACE FUNCTION "{sync_function(col)}"() RETURNS trigger
+                LANGUAGE plpgsql AS $$
+                BEGIN
+                    IF NEW."{col}" IS DISTINCT FROM OLD."{col}" THEN
+                        NEW."{shadow(col)}" := NULL;
+                    END IF;
+                    RETURN NEW;
+                END
+                $$
+            ''')
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{sync_function(col)}" ON products')
+            cursor.execute(
+                f'CREATE TRIGGER "{sync_function(col)}" BEFORE UPDATE OF "{col}" ON products '
+                f'FOR EACH ROW EXECUTE FUNCTION "{sync_function(col)}"()'
+            )
+            print(f"已添加影子列: {shadow(col)}")
+        conn.commit()
+
+
+def convert(value, naive_tz):
+    """
+    返回 (timestamptz值, 是否无法解析)
+    """
+    if value is None or value == '':
+        return None, False
+    parsed = normalize_timestamp(value)
+    if parsed is None:
+        return None, True
+    return to_timezone(parsed, naive_tz), False
+
+
+def _backfill_column(cursor, col, naive_tz, batch_size, writer):
+    """
+    按产品编码分批回填一个列，每批完成后产出累计的 (转换行数, 无法解析行数)
+    """
+    converted = failed = 0
+    last_code = ''
+    while True:
+        cursor.execute(
+            f'SELECT "产品编码", "{col}" AS value FROM products '
+            f'WHERE "产品编码" > %s AND "{col}" IS NOT NULL AND "{shadow(col)}" IS NULL '
+            f'ORDER BY "产品编码" LIMIT %s',
+            (last_code, batch_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        last_code = rows[-1]["产品编码"]
+        updates = []
+        for row in rows:
+            value, bad = convert(row["value"], naive_tz)
+            if bad:
+                failed += 1
+                writer.writerow([col, row["产品编码"], row["value"]])
+            elif value is not None:
+                updates.append((row["产品编码"], value))
+        if updates:
+            execute_values(
+                cursor,
+                f'UPDATE products AS p SET "{shadow(col)}" = v.value '
+                f'FROM (VALUES %s) AS v(code, value) WHERE p."产品编码" = v.code',
+                updates,
+                template="(%s, %s::timestamptz)"
+            )
+            converted += len(updates)
+        yield converted, failed
+
+
+def backfill(naive_tz, batch_size, report_path):
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    with get_connection() as conn, open(report_path, 'w', newline='', encoding='utf-8') as report:
+        writer = csv.writer(report)
+        writer.writerow(["列", "产品编码", "原始值"])
+        cursor = conn.cursor()
+        types = column_types(cursor)
+        for col in pending_columns(types):
+            if shadow(col) not in types:
+                print(f"缺少影子列 {shadow(col)}，请先执行 prepare")
+                continue
+            for converted, failed in _backfill_column(cursor, col, naive_tz, batch_size, writer):
+                # 每批单独提交，避免长事务锁住扫码写入
+                conn.commit()
+                print(f"{col}: 已转换 {converted} 行，无法解析 {failed} 行")
+            report.flush()
+    print(f"无法解析的值已写入: {report_path}")
+
+
+def swap(naive_tz, batch_size, report_path):
+    os.makedirs(os.path.dirname(report_path), exist_ok=True)
+    # 影子列为空的行都会重新解析，报告包含所有无法解析的值，覆盖 backfill 的报告
+    with get_connection() as conn, open(report_path, 'w', newline='', encoding='utf-8') as report:
+        writer = csv.writer(report)
+        writer.writerow(["列", "产品编码", "原始值"])
+        cursor = conn.cursor()
+        types = column_types(cursor)
+        columns = [col for col in pending_columns(types) if shadow(col) in types]
+        if not columns:
+            print("没有需要切换的列")
+            return
+        # 锁表期间扫码写入会等待，增量通常很少
+        cursor.execute("LOCK TABLE products IN ACCESS EXCLUSIVE MODE")
+        for col in columns:
+            # backfill 之后新写入或改写的值（改写时触发器已清空影子列）
+            for _ in _backfill_column(cursor, col, naive_tz, batch_size, writer):
+                pass
+            # backfill 之后被删除的工序
+            cursor.execute(
+                f'UPDATE products SET "{shadow(col)}" = NULL WHERE "{col}" IS NULL AND "{shadow(col)}" IS NOT NULL'
+            )
+            cursor.execute(f'DROP TRIGGER IF EXISTS "{sync_function(col)}" ON products')
+            cursor.execute(f'DROP FUNCTION IF EXISTS "{sync_function(col)}"()')
+            cursor.execute(f'ALTER TABLE products RENAME COLUMN "{col}" TO "{legacy(col)}"')
+            cursor.execute(f'ALTER TABLE products RENAME COLUMN "{shadow(col)}" TO "{col}"')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS "idx_products_{col}_tz" ON products ("{col}")')
+            print(f"已切换: {col} -> timestamptz，原始值保存在 {legacy(col)}")
+        conn.commit()
+    print(f"无法解析的值已写入: {report_path}")
+
+
+def drop_legacy():
+    """
+    确认无误后删除 "<列名>_legacy" 列（删除前请先处理报告中无法解析的值）
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        types = column_types(cursor)
+        for col in TIME_COLUMNS:
+            if legacy(col) in types:
+                cursor.execute(f'ALTER TABLE products DROP COLUMN "{legacy(col)}"')
+                print(f"已删除: {legacy(col)}")
+        conn.commit()
+
+
+def status():
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        types = column_types(cursor)
+        for col in TIME_COLUMNS:
+            if types.get(col) == 'timestamp with time zone':
+                print(f"{col}: 已完成 (timestamptz)")
+                continue
+            if shadow(col) not in types:
+                print(f"{col}: 未开始 ({types.get(col)})")
+                continue
+            cursor.execute(
+                f'SELECT count("{col}") AS total, count("{shadow(col)}") AS done FROM products'
+            )
+            row = cursor.fetchone()
+            print(f"{col}: 已回填 {row['done']}/{row['total']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="工序时间列转换为 timestamptz")
+    parser.add_argument("command", choices=["prepare", "backfill", "swap", "status", "drop-legacy"])
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批处理的行数")
+    parser.add_argument("--naive-tz", default="+08:00", help="不带时区的值按该时区解释")
+    parser.add_argument("--report", default=DEFAULT_REPORT, help="无法解析的值写入的CSV文件")
+    args = parser.parse_args()
+
+    tz = parse_tz(args.naive_tz)
+    if args.command == "prepare":
+        prepare()
+    elif args.command == "backfill":
+        backfill(tz, args.batch_size, args.report)
+    elif args.command == "swap":
+        swap(tz, args.batch_size, args.report)
+    elif args.command == "drop-legacy":
+        drop_legacy()
+    else:
+        status()
@@ -0,0 +1,95 @@
+-- 月度报表查询下推到数据库所需的函数和索引
+--
+-- 工序时间列里既有 timestamp 也有各种格式的字符串，这里的解析规则与 main.py 中
+-- is_in_time_range / is_date_in_range 的 Python 实现保持一致：
+--   1. 先按 ISO 8601 解析（'Z' 视为 +00:00），对应 datetime.fromisoformat
+--   2. 再依次尝试 %Y-%m-%d %H:%M:%S、%Y/%m/%d %H:%M:%S、%Y-%m-%d、%Y/%m/%d、%d-%m-%Y、%d/%m/%Y
+--   3. 都失败则返回 NULL（Python 中返回 False）
+
+-- 解析结果：wall 为去掉时区后的"墙上时间"，instant 仅在原值带时区时有值
+CREATE OR REPLACE FUNCTION product_time_parse(v text, OUT wall timestamp, OUT instant timestamptz)
+LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    s text;
+    m text[];
+BEGIN
+    IF v IS NULL OR v = '' THEN
+        RETURN;
+    END IF;
+    s := replace(v, 'Z', '+00:00');
+    BEGIN
+        m := regexp_match(s, '^(\d{4}-\d{2}-\d{2})(?:[T ](\d{2})(?::(\d{2})(?::(\d{2})(\.\d{1,6})?)?)?([+-]\d{2}(?::?\d{2}(?::?\d{2})?)?)?)?$');
+        IF m IS NOT NULL THEN
+            wall := (m[1] || ' ' || coalesce(m[2], '00') || ':' || coalesce(m[3], '00') || ':'
+                     || coalesce(m[4], '00') || coalesce(m[5], ''))::timestamp;
+            IF m[6] IS NOT NULL THEN
+                instant := (wall::text || m[6])::timestamptz;
+            END IF;
+            RETURN;
+        END IF;
+        -- strptime 格式使用原始字符串（Python 中不做 'Z' 替换）
+        m := regexp_match(v, '^(\d{4})([-/])(\d{1,2})\2(\d{1,2})(?: (\d{1,2}):(\d{1,2}):(\d{1,2}))?$');
+        IF m IS NOT NULL THEN
+            wall := make_timestamp(m[1]::int, m[3]::int, m[4]::int,
+                                   coalesce(m[5], '0')::int, coalesce(m[6], '0')::int, coalesce(m[7], '0')::int);
+            RETURN;
+        END IF;
+        m := regexp_match(v, '^(\d{1,2})([-/])(\d{1,2})\2(\d{4})$');
+        IF m IS NOT NULL THEN
+            wall := make_timestamp(m[4]::int, m[3]::int, m[1]::int, 0, 0, 0);
+            RETURN;
+        END IF;
+    EXCEPTION WHEN others THEN
+        -- 日期非法（如13月）视为无法解析
+        wall := NULL;
+        instant := NULL;
+    END;
+END
+$$;
+
+CREATE OR REPLACE FUNCTION product_time_wall(v text) RETURNS timestamp
+LANGUAGE sql IMMUTABLE AS $$ SELECT (product_time_parse(v)).wall $$;
+
+CREATE OR REPLACE FUNCTION product_time_instant(v text) RETURNS timestamptz
+LANGUAGE sql IMMUTABLE AS $$ SELECT (product_time_parse(v)).instant $$;
+
+-- 与 is_employee_match 一致：去掉所有空格和首尾空白后双向包含
+CREATE OR REPLACE FUNCTION employee_clean(v text) RETURNS text
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT btrim(replace(v, ' ', ''), E'\t\n\r\f\u000b\u00a0\u3000')
+$$;
+
+CREATE OR REPLACE FUNCTION employee_matches(db_employee text, query_clean text) RETURNS boolean
+LANGUAGE sql IMMUTABLE AS $$
+    SELECT db_employee IS NOT NULL AND db_employee <> ''
+       AND (strpos(query_clean, employee_clean(db_employee)) > 0
+            OR strpos(employee_clean(db_employee), query_clean) > 0)
+$$;
+
+-- 每个工序一个按"墙上时间"的表达式索引，月度查询按时间范围走索引后再过滤员工
+-- 时间列已是 timestamp/timestamptz 类型时，::text 转换不是 IMMUTABLE，直接在列上建索引
+DO $$
+DECLARE
+    process text;
+    col_type text;
+BEGIN
+    FOREACH process IN ARRAY ARRAY['绕线', '嵌线', '接线', '压装', '车止口', '浸漆'] LOOP
+        SELECT data_type INTO col_type
+        FROM information_schema.columns
+        WHERE table_name = 'products' AND column_name = process || '时间';
+        IF col_type IN ('text', 'character varying') THEN
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON products (product_time_wall(%I::text))',
+                'idx_products_' || process || '_wall_time',
+                process || '时间'
+            );
+        ELSE
+            EXECUTE format(
+                'CREATE INDEX IF NOT EXISTS %I ON products (%I)',
+                'idx_products_' || process || '_time',
+                process || '时间'
+            );
+        END IF;
+    END LOOP;
+END
+$$;
@@ -0,0 +1,27 @@
+-- 工序事件日志与按员工/日期/工序的计数表
+--
+-- 每次录入(+1)或删除(-1)工序都在同一事务中追加一条事件，并累加到计数表，
+-- getUserTodayProcessCount 直接读取计数表，不再扫描员工的全部历史。
+-- 上线时执行一次 `python3 process_events.py rebuild` 从 products 初始化计数。
+
+CREATE TABLE IF NOT EXISTS process_events (
+    id bigserial PRIMARY KEY,
+    product_code text NOT NULL,
+    process text NOT NULL,
+    employee text,
+    event_time timestamptz,
+    delta smallint NOT NULL CHECK (delta IN (1, -1)),
+    created_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_process_events_product_code ON process_events (product_code);
+CREATE INDEX IF NOT EXISTS idx_process_events_created_at ON process_events (created_at);
+
+-- work_date 为东八区日期
+CREATE TABLE IF NOT EXISTS employee_daily_process_counts (
+    employee text NOT NULL,
+    work_date date NOT NULL,
+    process text NOT NULL,
+    count integer NOT NULL DEFAULT 0,
+    PRIMARY KEY (work_date, employee, process)
+);
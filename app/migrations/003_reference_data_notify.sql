@@ -0,0 +1,24 @@
+-- 基础数据表变更时通过 NOTIFY 通知API进程刷新内存缓存（见 refcache.py）
+
+CREATE OR REPLACE FUNCTION notify_reference_data_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    PERFORM pg_notify('reference_data_changed', TG_TABLE_NAME);
+    RETURN NULL;
+END
+$$;
+
+DO $$
+DECLARE
+    tbl text;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['model_series', 'series_processes', 'month_range', 'exception'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tbl || '_notify_changed', tbl);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON %I '
+            'FOR EACH STATEMENT EXECUTE PROCEDURE notify_reference_data_changed()',
+            tbl || '_notify_changed', tbl
+        );
+    END LOOP;
+END
+$$;
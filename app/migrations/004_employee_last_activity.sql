@@ -0,0 +1,20 @@
+-- 员工最近一次工序时间，用于5分钟间隔校验（见 last_activity.py）
+--
+-- 录入时在同一事务中对 (员工, 工序) 行加锁、校验并更新，
+-- 不再对员工全部历史执行 ORDER BY "绕线时间" DESC，并发扫码也不会同时通过校验。
+
+CREATE TABLE IF NOT EXISTS employee_last_activity (
+    employee text NOT NULL,
+    process text NOT NULL,
+    last_time timestamptz,
+    PRIMARY KEY (employee, process)
+);
+
+-- 从现有数据初始化；与原校验一致，只有带时区的时间参与间隔判断
+INSERT INTO employee_last_activity (employee, process, last_time)
+SELECT "绕线员工", '绕线', max(product_time_instant("绕线时间"::text))
+FROM products
+WHERE "绕线员工" IS NOT NULL AND "绕线时间" IS NOT NULL
+GROUP BY "绕线员工"
+ON CONFLICT (employee, process) DO UPDATE
+SET last_time = GREATEST(employee_last_activity.last_time, EXCLUDED.last_time);
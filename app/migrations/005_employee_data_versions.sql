@@ -0,0 +1,9 @@
+-- 员工数据版本号，用于报表接口的 ETag（见 data_versions.py）
+--
+-- 录入/删除工序时在同一事务中把相关员工的版本号加一；
+-- 查询前先按员工名匹配汇总版本号，与客户端 If-None-Match 相同时直接返回 304，不执行报表查询。
+
+CREATE TABLE IF NOT EXISTS employee_data_versions (
+    employee text PRIMARY KEY,
+    version bigint NOT NULL DEFAULT 0
+);
@@ -0,0 +1,80 @@
+-- 员工名维表，用于报表的员工名匹配和员工名自动补全（见 employees.py）
+--
+-- 六个员工列中出现过的每个原始值一行，clean 为 employee_clean(name)。
+-- 报表查询先在本表中找出与查询名匹配的原始员工名（employee_matches，规则不变），
+-- 再用 "xx员工" = ANY(...) 走员工列的索引，不再对 products 做六列 '%名%' 的 LIKE。
+-- 名字只增不删：表中多出的名字只会让候选多一项，不会多返回 products 中的行。
+
+CREATE TABLE IF NOT EXISTS employee_names (
+    name text PRIMARY KEY,
+    clean text NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_employee_names_clean ON employee_names (clean);
+
+-- products 写入后把新出现的员工名加入维表；语句级触发器，COPY 和批量写入时每条语句只执行一次
+CREATE OR REPLACE FUNCTION record_employee_names() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO employee_names (name, clean)
+    SELECT DISTINCT e, employee_clean(e)
+    FROM new_rows, LATERAL (VALUES
+        (new_rows."绕线员工"), (new_rows."嵌线员工"), (new_rows."接线员工"),
+        (new_rows."压装员工"), (new_rows."车止口员工"), (new_rows."浸漆员工")
+    ) AS v(e)
+    WHERE e IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM employee_names n WHERE n.name = e)
+    ORDER BY 1
+    ON CONFLICT (name) DO NOTHING;
+    RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS products_employee_names_insert ON products;
+CREATE TRIGGER products_employee_names_insert
+AFTER INSERT ON products
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION record_employee_names();
+
+DROP TRIGGER IF EXISTS products_employee_names_update ON products;
+CREATE TRIGGER products_employee_names_update
+AFTER UPDATE ON products
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION record_employee_names();
+
+INSERT INTO employee_names (name, clean)
+SELECT DISTINCT e, employee_clean(e)
+FROM products, LATERAL (VALUES
+    ("绕线员工"), ("嵌线员工"), ("接线员工"), ("压装员工"), ("车止口员工"), ("浸漆员工")
+) AS v(e)
+WHERE e IS NOT NULL
+ON CONFLICT (name) DO NOTHING;
+
+-- 每个员工列一个索引，报表按匹配到的员工名查找
+DO $$
+DECLARE
+    process text;
+BEGIN
+    FOREACH process IN ARRAY ARRAY['绕线', '嵌线', '接线', '压装', '车止口', '浸漆'] LOOP
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON products (%I)',
+            'idx_products_' || process || '_employee',
+            process || '员工'
+        );
+    END LOOP;
+END
+$$;
+
+-- 自动补全按包含查询：装有 pg_trgm 时建三元组索引，没有时维表很小，顺序扫描即可
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS idx_employee_names_clean_trgm ON employee_names USING gin (clean gin_trgm_ops);
+    ELSE
+        RAISE NOTICE 'pg_trgm 不可用，员工名自动补全不建三元组索引';
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE '没有创建 pg_trgm 扩展的权限，员工名自动补全不建三元组索引';
+END
+$$;
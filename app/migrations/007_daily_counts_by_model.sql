@@ -0,0 +1,10 @@
+-- 每日计数按产品型号细分，全员汇总接口（getTeamProcessCounts?byModel=true）直接读取计数表
+--
+-- 型号取录入/删除工序时产品行上的型号，没有型号的记为 ''。
+-- 已有的计数行型号为 ''，执行本迁移后需执行一次 `python3 process_events.py rebuild` 按型号重新计算；
+-- 之后如直接在库中修改了产品型号，也可重新执行 rebuild 使按型号的细分与 products 一致（按员工和工序的合计不受影响）。
+
+ALTER TABLE employee_daily_process_counts ADD COLUMN IF NOT EXISTS model text NOT NULL DEFAULT '';
+
+ALTER TABLE employee_daily_process_counts DROP CONSTRAINT IF EXISTS employee_daily_process_counts_pkey;
+ALTER TABLE employee_daily_process_counts ADD PRIMARY KEY (work_date, employee, process, model);
@@ -0,0 +1,75 @@
+-- 工序注册表（processes.py / PROCESSES）对应的数据库部分
+--
+-- 1. 员工名维表的触发器函数按 products 中所有 "<工序>员工" 列生成（refresh_employee_names_trigger），增加工序时重新生成。
+-- 2. add_product_process('<工序名>')：在 products 中增加 "<工序>员工" / "<工序>时间" 两列，
+--    类型与绕线工序的列相同，并建员工列索引和时间列索引（与 001 / 006 的索引相同）。已存在时不做修改。
+--
+-- 增加第七道工序：
+--     SELECT add_product_process('质检');
+-- 然后在 app/.env 的 PROCESSES 末尾加上 ",inspection:质检" 并重启服务。
+
+-- 按 products 当前的 "<工序>员工" 列重新生成 record_employee_names（列名写在函数体中，比逐行转 jsonb 快）
+CREATE OR REPLACE FUNCTION refresh_employee_names_trigger() RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    columns text;
+BEGIN
+    SELECT string_agg(format('(new_rows.%I)', attname), ', ' ORDER BY attnum) INTO columns
+    FROM pg_attribute
+    WHERE attrelid = 'products'::regclass AND attnum > 0 AND NOT attisdropped AND attname LIKE '%员工';
+    EXECUTE format($f$
+        CREATE OR REPLACE FUNCTION record_employee_names() RETURNS trigger
+        LANGUAGE plpgsql AS $body$
+        BEGIN
+            INSERT INTO employee_names (name, clean)
+            SELECT DISTINCT e, employee_clean(e)
+            FROM new_rows, LATERAL (VALUES %s) AS v(e)
+            WHERE e IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM employee_names n WHERE n.name = e)
+            ORDER BY 1
+            ON CONFLICT (name) DO NOTHING;
+            RETURN NULL;
+        END
+        $body$
+    $f$, columns);
+END
+$$;
+
+CREATE OR REPLACE FUNCTION add_product_process(process text) RETURNS void
+LANGUAGE plpgsql AS $$
+DECLARE
+    employee_type text;
+    time_type text;
+BEGIN
+    SELECT format_type(atttypid, atttypmod) INTO employee_type
+    FROM pg_attribute WHERE attrelid = 'products'::regclass AND attname = '绕线员工';
+    SELECT format_type(atttypid, atttypmod) INTO time_type
+    FROM pg_attribute WHERE attrelid = 'products'::regclass AND attname = '绕线时间';
+
+    EXECUTE format('ALTER TABLE products ADD COLUMN IF NOT EXISTS %I %s', process || '员工', employee_type);
+    EXECUTE format('ALTER TABLE products ADD COLUMN IF NOT EXISTS %I %s', process || '时间', time_type);
+
+    EXECUTE format(
+        'CREATE INDEX IF NOT EXISTS %I ON products (%I)',
+        'idx_products_' || process || '_employee',
+        process || '员工'
+    );
+    IF time_type = 'text' OR time_type LIKE 'character varying%' THEN
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON products (product_time_wall(%I::text))',
+            'idx_products_' || process || '_wall_time',
+            process || '时间'
+        );
+    ELSE
+        EXECUTE format(
+            'CREATE INDEX IF NOT EXISTS %I ON products (%I)',
+            'idx_products_' || process || '_time',
+            process || '时间'
+        );
+    END IF;
+
+    PERFORM refresh_employee_names_trigger();
+END
+$$;
+
+SELECT refresh_employee_names_trigger();
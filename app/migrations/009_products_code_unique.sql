@@ -0,0 +1,34 @@
+-- 产品编码唯一索引
+--
+-- 扫码、批量录入和生产计划导入都会为新编码插入产品行，并发插入同一编码时靠该索引保证只有一行
+-- （插入前还会按编码加咨询锁，见 repository._lock_new_codes）。已有产品编码唯一索引时（bench_seed 建的 idx_products_code）不做修改。
+-- 已有重复编码时迁移失败并列出部分编码，合并重复行后重新执行。建索引期间 products 的写入会等待。
+
+DO $$
+DECLARE
+    duplicates text;
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM pg_index i
+        JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+        WHERE i.indrelid = 'products'::regclass AND i.indisunique AND i.indnkeyatts = 1
+          AND i.indpred IS NULL AND a.attname = '产品编码'
+    ) THEN
+        RETURN;
+    END IF;
+
+    SELECT string_agg(code, ', ') INTO duplicates
+    FROM (
+        SELECT "产品编码" AS code FROM products
+        WHERE "产品编码" IS NOT NULL
+        GROUP BY "产品编码" HAVING count(*) > 1
+        ORDER BY "产品编码"
+        LIMIT 20
+    ) d;
+    IF duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'products 中有重复的产品编码，请合并后重新执行迁移: %', duplicates;
+    END IF;
+
+    CREATE UNIQUE INDEX idx_products_code_unique ON products ("产品编码");
+END
+$$;
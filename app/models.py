@@ -0,0 +1,157 @@
+"""
+请求和响应数据模型
+
+响应模型用于接口文档和约定返回结构；读接口直接返回 FastJSONResponse，不再逐行校验
+"""
+from datetime import datetime
+from typing import Annotated, Any, Dict, List, Optional, Union
+
+from pydantic import AfterValidator, BaseModel, create_model
+
+from processes import PROCESS_COLUMNS, EMPLOYEE_COLUMNS, TIME_COLUMNS
+
+# 工序时间列可能是 timestamptz 或各种格式的字符串
+TimeValue = Union[datetime, str]
+
+
+# ---------- 请求 ----------
+
+def _time_field(value):
+    if value not in TIME_COLUMNS:
+        raise ValueError(f"未知的工序时间列: {value}")
+    return value
+
+def _employee_field(value):
+    if value and value not in EMPLOYEE_COLUMNS:
+        raise ValueError(f"未知的工序员工列: {value}")
+    return value
+
+# 直接用作 products 的列名，只接受注册表中的工序列（见 processes.py）；员工列可为空
+TimeField = Annotated[str, AfterValidator(_time_field)]
+EmployeeField = Annotated[str, AfterValidator(_employee_field)]
+
+class UpdateProductProcess(BaseModel):
+    productCode: str
+    processType: str
+    employeeName: str
+    timeField: TimeField
+    employeeField: EmployeeField
+    timestamp: str
+
+class BatchUpdateProductProcess(BaseModel):
+    productCodes: List[str]
+    processType: str
+    employeeName: str
+
+class ProductDetailsBatch(BaseModel):
+    productCodes: List[str]
+    fields: Optional[List[str]] = None
+
+class DeleteProductProcess(BaseModel):
+    productCode: str
+    processType: str
+    employeeName: str
+    timeField: TimeField
+    employeeField: EmployeeField
+
+
+# ---------- 响应 ----------
+
+# 产品行：产品编码、产品型号和各工序的员工/时间列（与 repository.PRODUCT_SELECT 一致）
+ProductRecord = create_model(
+    "ProductRecord",
+    产品编码=(str, ...),
+    产品型号=(Optional[str], None),
+    **{
+        col: (Optional[TimeValue] if col == time_col else Optional[str], None)
+        for _, emp_col, time_col in PROCESS_COLUMNS for col in (emp_col, time_col)
+    }
+)
+
+class SuccessResponse(BaseModel):
+    success: bool
+
+class BatchResult(BaseModel):
+    code: str
+    success: bool
+    error: Optional[str] = None
+
+class BatchResultsResponse(BaseModel):
+    results: List[BatchResult]
+
+class ProductDetailsResponse(BaseModel):
+    data: ProductRecord
+
+class ProductDetailsBatchResponse(BaseModel):
+    # fields 投影时每行只包含请求的列
+    data: List[Dict[str, Any]]
+    notFound: List[str]
+
+class ClientInfo(BaseModel):
+    is_ios: bool
+
+class MonthlyProductsResponse(BaseModel):
+    data: List[ProductRecord]
+    client_info: ClientInfo
+    nextCursor: Optional[str] = None
+
+class TransactionRecord(BaseModel):
+    process: str
+    productCode: str
+    model: Optional[str] = None
+    time: Optional[TimeValue] = None
+
+class MonthlyTransactionsResponse(BaseModel):
+    data: List[TransactionRecord]
+    nextCursor: Optional[str] = None
+
+class DateRange(BaseModel):
+    startDate: str
+    endDate: str
+
+class MonthRangeResponse(BaseModel):
+    data: DateRange
+
+class RowsResponse(BaseModel):
+    data: List[Dict[str, Any]]
+
+class ProcessCount(BaseModel):
+    process: str
+    count: int
+
+class ProcessCountResponse(BaseModel):
+    data: List[ProcessCount]
+
+class TeamProcessCount(BaseModel):
+    employee: str
+    process: str
+    # 只在 byModel=true 时返回
+    model: Optional[str] = None
+    count: int
+
+class TeamProcessCountResponse(BaseModel):
+    startDate: str
+    endDate: str
+    data: List[TeamProcessCount]
+
+class EmployeeMatch(BaseModel):
+    # 去掉空格后的员工名，aliases 为库中的原始写法
+    name: str
+    aliases: List[str]
+
+class EmployeeSearchResponse(BaseModel):
+    data: List[EmployeeMatch]
+
+class PlanConflict(BaseModel):
+    productCode: str
+    # 计划中的型号；文件中同一编码有多个型号时全部列出
+    models: List[str]
+    # 已登记的型号，只在与计划不同时返回
+    existingModel: Optional[str] = None
+
+class PlanImportResponse(BaseModel):
+    lines: int
+    inserted: int
+    skipped: int
+    conflicting: int
+    conflicts: List[PlanConflict]
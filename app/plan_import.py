@@ -0,0 +1,184 @@
+"""
+生产计划预登记
+
+每天的生产计划（产品编码、产品型号两列的 CSV）批量写入 products，扫码时产品行已存在，录入只需 UPDATE。
+CSV 用 COPY FROM STDIN 流式写入临时表，再按产品编码一次性合并到 products，内存占用与文件大小无关。
+
+按行统计结果（inserted + skipped + conflicting = lines）：
+- inserted     新登记产品的行（每个新产品编码一行）
+- skipped      不需要写入的行（空行不计）：产品编码为空、同一编码的重复行、已登记且型号相同或计划中未填型号
+- conflicting  型号冲突的产品编码的所有行，不写入：文件中同一编码有多个型号，或已登记的型号与计划不同（包括已登记但未填型号）
+conflicts 为前 CONFLICT_SAMPLE 个冲突的产品编码。已存在的产品行不修改；同一时间只允许一个导入。
+
+新产品插入前按编码加与扫码相同的咨询锁（database.NEW_CODE_LOCK），与首次扫码同时插入同一编码时扫码等导入提交后
+改为 UPDATE；产品编码的唯一索引（migrations/009）保证不会产生重复行。
+
+用法:
+    cd app
+    python3 plan_import.py plan.csv
+    python3 plan_import.py plan.csv --no-header --encoding GBK
+    python3 plan_import.py - < plan.csv
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+import psycopg2
+from psycopg2 import sql
+
+from database import get_connection, NEW_CODE_LOCK, new_code_bucket
+
+logger = logging.getLogger("plan_import")
+
+CONFLICT_SAMPLE = 100
+COPY_BUFFER = 64 * 1024
+# pg_try_advisory_xact_lock 的键，同一时间只允许一个导入
+LOCK_KEY = 0x706C616E  # "plan"
+
+
+class PlanFileError(ValueError):
+    """
+    CSV 格式或编码错误
+    """
+
+
+class ImportBusy(RuntimeError):
+    """
+    已有导入正在进行
+    """
+
+
+class _NonBlankLines:
+    """
+    COPY 读取的文件对象：按整行读取并去掉空行（COPY csv 遇到空行报错，导出的计划文件末尾常有空行）
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def read(self, size=-1):
+        while True:
+            lines = self.file.readlines(size if size and size > 0 else -1)
+            if not lines:
+                return b""
+            data = b"".join(line for line in lines if line.strip())
+            if data:
+                return data
+
+
+def import_plan(file, header=True, encoding="UTF8"):
+    """
+    file 为二进制文件对象，两列：产品编码、产品型号（可为空）；返回统计结果
+    """
+    started = time.perf_counter()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (LOCK_KEY,))
+        if not cursor.fetchone()["locked"]:
+            raise ImportBusy("已有生产计划正在导入，请稍后重试")
+        cursor.execute("CREATE TEMP TABLE plan_import (code text, model text) ON COMMIT DROP")
+        copy = sql.SQL("COPY plan_import (code, model) FROM STDIN WITH (FORMAT csv, HEADER {}, ENCODING {})").format(
+            sql.Literal(bool(header)), sql.Literal(encoding)
+        )
+        try:
+            cursor.copy_expert(copy.as_string(conn), _NonBlankLines(file), size=COPY_BUFFER)
+        except psycopg2.DataError as e:
+            raise PlanFileError(str(e).strip()) from e
+
+        # 按产品编码归并：去掉首尾空白（和 UTF-8 BOM），空型号视为未填
+        cursor.execute("""
+            CREATE TEMP TABLE plan_codes ON COMMIT DROP AS
+            SELECT code,
+                   array_agg(DISTINCT model ORDER BY model) FILTER (WHERE model IS NOT NULL) AS models,
+                   count(*) AS lines
+            FROM (
+                SELECT btrim(ltrim(code, chr(65279))) AS code, nullif(btrim(model), '') AS model FROM plan_import
+            ) t
+            WHERE code <> ''
+            GROUP BY code
+        """)
+        cursor.execute("ANALYZE plan_codes")
+        # 按桶号顺序锁住要插入的新编码，与扫码、批量录入的加锁顺序一致
+        cursor.execute(f"""
+            SELECT pg_advisory_xact_lock({NEW_CODE_LOCK}, b) FROM (
+                SELECT DISTINCT {new_code_bucket('c.code')} AS b FROM plan_codes c
+                WHERE coalesce(cardinality(c.models), 0) <= 1
+                  AND NOT EXISTS (SELECT 1 FROM products p WHERE p."产品编码" = c.code)
+                ORDER BY b
+            ) s
+        """)
+        cursor.execute("""
+            WITH inserted AS (
+                INSERT INTO products ("产品编码", "产品型号")
+                SELECT c.code, c.models[1] FROM plan_codes c
+                WHERE coalesce(cardinality(c.models), 0) <= 1
+                  AND NOT EXISTS (SELECT 1 FROM products p WHERE p."产品编码" = c.code)
+                ORDER BY c.code
+                ON CONFLICT ("产品编码") DO NOTHING
+                RETURNING 1
+            )
+            SELECT count(*) AS n FROM inserted
+        """)
+        inserted = cursor.fetchone()["n"]
+        # 新插入的行型号与计划相同，不会算作冲突
+        cursor.execute("""
+            CREATE TEMP TABLE plan_conflicts ON COMMIT DROP AS
+            SELECT c.code, c.models, c.lines, p.existing
+            FROM plan_codes c
+            LEFT JOIN LATERAL (
+                SELECT true AS found, "产品型号" AS existing FROM products
+                WHERE "产品编码" = c.code AND "产品型号" IS DISTINCT FROM c.models[1]
+                LIMIT 1
+            ) p ON true
+            WHERE cardinality(c.models) > 1 OR (cardinality(c.models) = 1 AND p.found)
+        """)
+        cursor.execute("""
+            SELECT (SELECT count(*) FROM plan_import) AS lines,
+                   (SELECT coalesce(sum(lines), 0)::bigint FROM plan_conflicts) AS conflicting
+        """)
+        totals = cursor.fetchone()
+        cursor.execute(
+            'SELECT code AS "productCode", models, existing AS "existingModel" '
+            "FROM plan_conflicts ORDER BY code LIMIT %s",
+            (CONFLICT_SAMPLE,)
+        )
+        conflicts = cursor.fetchall()
+        conn.commit()
+    result = {
+        "lines": totals["lines"],
+        "inserted": inserted,
+        "skipped": totals["lines"] - inserted - totals["conflicting"],
+        "conflicting": totals["conflicting"],
+        "conflicts": conflicts,
+    }
+    logger.info(
+        "生产计划导入完成",
+        extra={**{k: v for k, v in result.items() if k != "conflicts"},
+               "duration_ms": round((time.perf_counter() - started) * 1000)}
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="从CSV导入生产计划（产品编码、产品型号）")
+    parser.add_argument("file", help="CSV文件，- 表示标准输入")
+    parser.add_argument("--no-header", action="store_true", help="第一行不是表头")
+    parser.add_argument("--encoding", default="UTF8", help="文件编码，如 UTF8、GBK，默认 UTF8")
+    args = parser.parse_args()
+
+    try:
+        if args.file == "-":
+            result = import_plan(sys.stdin.buffer, not args.no_header, args.encoding)
+        else:
+            with open(args.file, "rb") as f:
+                result = import_plan(f, not args.no_header, args.encoding)
+    except (PlanFileError, ImportBusy) as e:
+        print(f"导入失败: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+工序事件日志与每日计数
+
+录入/批量录入/删除工序时，在同一事务中：
+- 向 process_events 追加事件（产品编码、工序、员工、时间、+1/-1）
+- 按 (东八区日期, 员工, 工序, 产品型号) 累加 employee_daily_process_counts，型号取产品行上当前的型号
+- 相关员工以及写入后产品行上署名的所有员工的数据版本号加一（见 data_versions.py）：
+  月度产品列表返回整行，同事录入/删除同一产品的其他工序也会改变报表内容
+
+计数表可随时从 products 重建：
+    cd app
+    python3 process_events.py rebuild
+"""
+from collections import Counter
+
+from psycopg2.extras import execute_values
+
+import data_versions
+import employees
+from database import get_connection
+from processes import PROCESS_COLUMNS
+from timeutil import normalize_timestamp, to_timezone, SHANGHAI_TZ
+
+# 时间列名 -> 工序名，如 "绕线时间" -> "绕线"
+TIME_SUFFIX = "时间"
+
+
+def process_of(time_field):
+    return time_field[:-len(TIME_SUFFIX)] if time_field.endswith(TIME_SUFFIX) else time_field
+
+
+def work_date(event_time):
+    """
+    事件时间对应的东八区日期，无法解析返回 None
+    """
+    parsed = normalize_timestamp(event_time)
+    if parsed is None:
+        return None
+    return to_timezone(parsed, SHANGHAI_TZ).date()
+
+
+def record_events(cursor, events):
+    """
+    在当前事务中写入事件并更新计数，不提交
+
+    events: [(产品编码, 工序, 员工, 时间, +1/-1)]
+    """
+    if not events:
+        return
+    rows = []
+    counted = []
+    for product_code, process, employee, event_time, delta in events:
+        parsed = normalize_timestamp(event_time)
+        rows.append((product_code, process, employee, to_timezone(parsed) if parsed else None, delta))
+        if employee and parsed is not None:
+            counted.append((to_timezone(parsed, SHANGHAI_TZ).date(), employee, process, product_code, delta))
+    execute_values(
+        cursor,
+        'INSERT INTO process_events (product_code, process, employee, event_time, delta) VALUES %s',
+        rows
+    )
+    products = _product_rows(cursor, {product_code for product_code, _, _, _, _ in events})
+    if counted:
+        counts = Counter()
+        for day, employee, process, product_code, delta in counted:
+            model = products[product_code]["产品型号"] if product_code in products else None
+            counts[(day, employee, process, model or "")] += delta
+        _add_counts(cursor, counts)
+    named = [row[emp_col] for row in products.values() for _, emp_col, _ in PROCESS_COLUMNS]
+    data_versions.bump(cursor, [employee for _, _, employee, _, _ in events] + named)
+
+
+def _product_rows(cursor, product_codes):
+    # 产品行已在本事务中写入并加锁，读到的是写入后的型号和各工序员工
+    columns = ", ".join(f'"{emp_col}"' for _, emp_col, _ in PROCESS_COLUMNS)
+    cursor.execute(
+        f'SELECT "产品编码", "产品型号", {columns} FROM products WHERE "产品编码" = ANY(%s)',
+        (list(product_codes),)
+    )
+    return {row["产品编码"]: row for row in cursor.fetchall()}
+
+
+def _add_counts(cursor, counts):
+    counts = [(day, employee, process, model, n) for (day, employee, process, model), n in counts.items() if n]
+    if not counts:
+        return
+    # 固定顺序加锁，避免并发事务互相等待造成死锁
+    counts.sort()
+    execute_values(
+        cursor,
+        """
+        INSERT INTO employee_daily_process_counts (work_date, employee, process, model, count) VALUES %s
+        ON CONFLICT (work_date, employee, process, model)
+        DO UPDATE SET count = employee_daily_process_counts.count + EXCLUDED.count
+        """,
+        counts
+    )
+
+
+def fetch_day_counts(day, employee_name):
+    """
+    某一天与员工名匹配的员工的工序计数 [(员工, 工序, 数量)]
+
+    与原实现和月度报表相同：产品行先按任一员工列包含查询名预筛选（原 LIKE '%名%'），
+    再统计该行上与员工名宽松匹配（employee_matches）的工序。
+    本身包含查询名的员工所在的行都能通过预筛选，直接取计数表；
+    其余匹配的员工（如查询"张三丰"时的"张三"）只统计同一行上有包含查询名的员工的工序，从 products 中逐行判断
+    """
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        matched, listed = employees.resolve(cursor, employee_name)
+        if not listed:
+            return []
+        names = sorted(set(matched) & set(listed))
+        counts = []
+        if names:
+            cursor.execute(
+                'SELECT employee, process, sum(count)::int AS count FROM employee_daily_process_counts '
+                'WHERE work_date = %s AND employee = ANY(%s) GROUP BY employee, process HAVING sum(count) <> 0',
+                (day, names)
+            )
+            counts = cursor.fetchall()
+        others = sorted(set(matched) - set(listed))
+        if others:
+            counts += _count_listed_rows(cursor, day, others, listed)
+        return counts
+
+
+def _any_employee(param):
+    # 任一员工列在 %(param)s 中，按员工列索引查找
+    return "(" + " OR ".join(f'"{emp_col}" = ANY(%({param})s)' for _, emp_col, _ in PROCESS_COLUMNS) + ")"
+
+
+def _count_listed_rows(cursor, day, others, listed):
+    """
+    others 中的员工当天在有 listed 员工署名的产品行上的工序计数
+    """
+    columns = ", ".join(f'"{emp_col}", "{time_col}"' for _, emp_col, time_col in PROCESS_COLUMNS)
+    cursor.execute(
+        f"SELECT {columns} FROM products WHERE {_any_employee('others')} AND {_any_employee('listed')}",
+        {"others": others, "listed": listed}
+    )
+    counts = Counter()
+    wanted = set(others)
+    for row in cursor.fetchall():
+        for process, emp_col, time_col in PROCESS_COLUMNS:
+            if row[emp_col] in wanted and row[time_col] and work_date(row[time_col]) == day:
+                counts[(row[emp_col], process)] += 1
+    return [{"employee": e, "process": p, "count": n} for (e, p), n in sorted(counts.items())]
+
+
+def fetch_range_counts(start, end, by_model=False):
+    """
+    [start, end] 东八区日期范围内所有员工的工序计数合计 [(员工, 工序, 数量)]，一条聚合语句
+
+    by_model 时按 (员工, 工序, 产品型号) 汇总，没有型号的 model 为 None
+    """
+    group = "employee, process, model" if by_model else "employee, process"
+    select = "employee, process, nullif(model, '') AS model" if by_model else group
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT {select}, sum(count)::int AS count FROM employee_daily_process_counts '
+            f'WHERE work_date BETWEEN %s AND %s GROUP BY {group} HAVING sum(count) <> 0',
+            (start, end)
+        )
+        return cursor.fetchall()
+
+
+def rebuild_counters(batch_size=10000):
+    """
+    从 products 重新计算全部计数
+
+    先锁住计数表再扫描 products：并发的录入会在更新计数时等待，
+    其对 products 的修改在本事务扫描时尚未提交，提交后再累加，结果不会重复或遗漏。
+    """
+    counts = Counter()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("LOCK TABLE employee_daily_process_counts IN EXCLUSIVE MODE")
+        columns = '"产品型号", ' + ", ".join(f'"{emp_col}", "{time_col}"' for _, emp_col, time_col in PROCESS_COLUMNS)
+        # 服务端游标分批读取，内存只保留聚合结果
+        scan = conn.cursor(name="rebuild_counters_scan")
+        scan.itersize = batch_size
+        scan.execute(f"SELECT {columns} FROM products")
+        for row in scan:
+            for process, emp_col, time_col in PROCESS_COLUMNS:
+                employee = row[emp_col]
+                if not employee:
+                    continue
+                day = work_date(row[time_col])
+                if day is not None:
+                    counts[(day, employee, process, row["产品型号"] or "")] += 1
+        scan.close()
+        cursor.execute("DELETE FROM employee_daily_process_counts")
+        _add_counts(cursor, counts)
+        # 计数变化后已缓存的报表（ETag）全部失效
+        data_versions.bump_all(cursor, {employee for _, employee, _, _ in counts})
+        conn.commit()
+    return len(counts)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if sys.argv[1:] != ["rebuild"]:
+        print("用法: python3 process_events.py rebuild")
+        sys.exit(1)
+    print(f"计数表已重建，共 {rebuild_counters()} 行")
@@ -0,0 +1,80 @@
+"""
+工序注册表
+
+工序列表在启动时从环境变量 PROCESSES 读取："类型:工序名"，逗号分隔，按报表中的显示顺序，
+例如 wiring:绕线,embedding:嵌线。未设置时为默认的六道工序。
+每道工序在 products 中对应 "<工序名>员工" 和 "<工序名>时间" 两列；报表和录入的SQL都由注册表生成，
+增加工序时执行 add_product_process('<工序名>')（migrations/008）加列和索引，再加入 PROCESSES，不需要改代码。
+"""
+import logging
+import os
+from collections import namedtuple
+
+# 加载 app/.env
+import database  # noqa: F401
+
+logger = logging.getLogger("processes")
+
+EMPLOYEE_SUFFIX = "员工"
+TIME_SUFFIX = "时间"
+
+DEFAULT_PROCESSES = "wiring:绕线,embedding:嵌线,wiring_connect:接线,pressing:压装,stopper:车止口,immersion:浸漆"
+
+Process = namedtuple("Process", ["type", "name", "employee_column", "time_column"])
+
+
+def parse(spec):
+    """
+    解析 PROCESSES，格式不对时抛出 ValueError
+    """
+    processes = []
+    for item in spec.split(","):
+        process_type, sep, name = (part.strip() for part in item.partition(":"))
+        if not sep or not process_type or not name or '"' in name:
+            raise ValueError(f"PROCESSES 格式错误: {item!r}")
+        processes.append(Process(process_type, name, name + EMPLOYEE_SUFFIX, name + TIME_SUFFIX))
+    if len({p.type for p in processes}) != len(processes) or len({p.name for p in processes}) != len(processes):
+        raise ValueError("PROCESSES 中有重复的工序")
+    return processes
+
+
+PROCESSES = parse(os.getenv("PROCESSES") or DEFAULT_PROCESSES)
+BY_TYPE = {p.type: p for p in PROCESSES}
+
+# (工序, 员工列, 时间列)
+PROCESS_COLUMNS = [(p.name, p.employee_column, p.time_column) for p in PROCESSES]
+
+EMPLOYEE_COLUMNS = frozenset(p.employee_column for p in PROCESSES)
+TIME_COLUMNS = frozenset(p.time_column for p in PROCESSES)
+
+# 产品接口返回的列：产品编码、产品型号和各工序的员工/时间列
+PRODUCT_FIELDS = ["产品编码", "产品型号"] + [
+    col for _, emp_col, time_col in PROCESS_COLUMNS for col in (emp_col, time_col)
+]
+
+
+def name_of(process_type):
+    """
+    processType（如 wiring）对应的工序名，未注册的原样返回
+    """
+    process = BY_TYPE.get(process_type)
+    return process.name if process else process_type
+
+
+def check(cursor, series_processes):
+    """
+    启动时检查注册表：products 缺少的列记错误日志，工序流程中未注册的工序记警告
+    """
+    cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'products'")
+    existing = {row["column_name"] for row in cursor.fetchall()}
+    missing = [col for col in PRODUCT_FIELDS if col not in existing]
+    if missing:
+        logger.error("products 缺少工序列 %s，请执行 add_product_process 或检查 PROCESSES", missing)
+    registered = {p.name for p in PROCESSES}
+    unknown = set()
+    for row in series_processes:
+        flow = row.get("工序流程") or ""
+        unknown.update(name.strip() for name in flow.split(",") if name.strip() and name.strip() not in registered)
+    if unknown:
+        logger.warning("工序流程中的工序 %s 未在 PROCESSES 中注册", sorted(unknown))
+    return missing
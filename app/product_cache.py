@@ -0,0 +1,134 @@
+"""
+产品行缓存
+
+扫码期间同一批在制品会被反复查询，按产品编码缓存完整行（LRU + TTL）：
+- 本进程的录入/批量录入/删除提交后立即失效，之后不会再读到旧行
+  （不写入新行：并发写入的提交后处理没有先后顺序，后执行的可能是旧行；失效后下次查询读数据库）
+- 写入事务中 NOTIFY products_changed，其他进程收到后失效对应编码；监听断开期间按 PRODUCT_CACHE_TTL 过期兜底
+- 其他进程的失效是异步的，缓存只用于查询接口，录入/删除的校验不使用缓存
+- 查询数据库期间该编码被写入时，查询结果不会写回缓存（按编码记录版本号）
+- stats() 返回命中率、淘汰和失效次数
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from database import env_int, env_float
+
+CHANNEL = "products_changed"
+SIZE = env_int("PRODUCT_CACHE_SIZE", 2048)
+TTL = env_float("PRODUCT_CACHE_TTL", 60)
+# 通知内容为 "<进程标识> <产品编码>"，收到自己发出的通知时忽略
+INSTANCE = uuid.uuid4().hex[:12]
+
+
+class ProductCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._rows = OrderedDict()  # 产品编码 -> (行, 写入时间)
+        self._versions = {}         # 产品编码 -> 版本号，失效时加一
+        self._epoch = 0             # _versions 清空时加一，使进行中的查询全部作废
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, code):
+        """
+        返回 (行, 版本号)；未命中时行为 None，查询数据库后把版本号传给 fill
+        """
+        with self._lock:
+            item = self._rows.get(code)
+            if item is not None:
+                row, stored_at = item
+                if time.monotonic() - stored_at < self.ttl:
+                    self._rows.move_to_end(code)
+                    self.hits += 1
+                    return row, None
+                del self._rows[code]
+                self.expirations += 1
+            self.misses += 1
+            return None, (self._epoch, self._versions.get(code, 0))
+
+    def fill(self, code, row, version):
+        """
+        写回查询结果；查询期间该编码已被写入或失效时丢弃
+        """
+        if row is None or self.maxsize <= 0:
+            return
+        with self._lock:
+            if (self._epoch, self._versions.get(code, 0)) != version:
+                return
+            self._store(code, dict(row))
+
+    def invalidate(self, code=None):
+        """
+        失效一个编码；code 为 None 时全部失效（监听连接重连时）
+        """
+        with self._lock:
+            if code is None:
+                self.invalidations += len(self._rows)
+                self._rows.clear()
+                self._versions.clear()
+                self._epoch += 1
+                return
+            self._bump(code)
+            if self._rows.pop(code, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_many(self, codes):
+        for code in codes:
+            self.invalidate(code)
+
+    def _bump(self, code):
+        self._versions[code] = self._versions.get(code, 0) + 1
+        if len(self._versions) > 4 * max(self.maxsize, 1024):
+            self._versions.clear()
+            self._epoch += 1
+
+    def _store(self, code, row):
+        self._rows[code] = (row, time.monotonic())
+        self._rows.move_to_end(code)
+        while len(self._rows) > self.maxsize:
+            self._rows.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._rows),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+def notify_changed(cursor, codes):
+    """
+    在当前事务中通知其他进程失效这些编码（提交时发出）
+    """
+    cursor.execute(
+        "SELECT pg_notify(%s, %s || ' ' || code) FROM unnest(%s::text[]) AS code",
+        (CHANNEL, INSTANCE, list(codes))
+    )
+
+
+def on_notify(payload):
+    if payload is None:
+        cache.invalidate()
+        return
+    instance, _, code = payload.partition(" ")
+    if instance != INSTANCE:
+        cache.invalidate(code)
+
+
+cache = ProductCache(SIZE, TTL)
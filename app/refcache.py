@@ -0,0 +1,229 @@
+"""
+基础数据内存缓存
+
+model_series / series_processes / month_range / exception 几乎不变，启动时加载到内存：
+- 表变更时数据库触发器发出 NOTIFY reference_data_changed（见 migrations/003），监听线程收到后立即重新加载
+- 监听连接断开期间按 REFCACHE_TTL 秒过期兜底
+- 每次加载时按内容计算 etag，各进程对相同数据得到相同的值
+- stats() 返回各表的命中、未命中和加载次数
+- add_handler() 复用同一监听连接处理其他频道（如 last_activity 的 employee_activity_changed）
+"""
+import hashlib
+import logging
+import select
+import threading
+import time
+
+from database import get_connection, new_connection, env_float
+from db_executor import run_read
+from responses import dumps
+
+logger = logging.getLogger("refcache")
+
+CHANNEL = "reference_data_changed"
+TTL = env_float("REFCACHE_TTL", 300)
+
+
+def _load_model_series(cursor):
+    cursor.execute('SELECT * FROM model_series')
+    return cursor.fetchall()
+
+
+def _load_series_processes(cursor):
+    cursor.execute('SELECT * FROM series_processes')
+    return cursor.fetchall()
+
+
+def _load_month_range(cursor):
+    # 返回 (month_range表的列名, 最新一条记录)
+    cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name = 'month_range'")
+    columns = [col["column_name"] for col in cursor.fetchall()]
+    cursor.execute("SELECT * FROM month_range ORDER BY id DESC LIMIT 1")
+    return columns, cursor.fetchone()
+
+
+def _load_exception(cursor):
+    cursor.execute('SELECT DISTINCT "产品型号" FROM exception')
+    return frozenset(row["产品型号"] for row in cursor.fetchall())
+
+
+LOADERS = {
+    "model_series": _load_model_series,
+    "series_processes": _load_series_processes,
+    "month_range": _load_month_range,
+    "exception": _load_exception,
+}
+
+
+class _Entry:
+    def __init__(self):
+        self.value = None
+        self.etag = None
+        self.loaded_at = None
+        self.version = 0           # 每次失效加一
+        self.loaded_version = -1   # 当前值对应的版本
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.invalidations = 0
+
+
+class ReferenceCache:
+    def __init__(self, loaders, ttl):
+        self.loaders = loaders
+        self.ttl = ttl
+        self._entries = {name: _Entry() for name in loaders}
+        self._stop = threading.Event()
+        self._listener = None
+        self._handlers = {}  # 其他通知频道 -> 回调(payload)
+        self.listening = False
+
+    def add_handler(self, channel, handler):
+        """
+        复用监听连接处理其他频道的通知，需在 start_listener 之前注册
+        """
+        self._handlers[channel] = handler
+
+    def _fresh(self, entry):
+        return (entry.loaded_version == entry.version
+                and entry.loaded_at is not None
+                and time.monotonic() - entry.loaded_at < self.ttl)
+
+    def load(self, name):
+        """
+        从数据库加载一个表；并发调用只会加载一次
+        """
+        entry = self._entries[name]
+        with entry.lock:
+            if self._fresh(entry):
+                return entry.value
+            version = entry.version
+            with get_connection() as conn:
+                value = self.loaders[name](conn.cursor())
+            entry.value = value
+            entry.etag = hashlib.blake2b(dumps(value), digest_size=12).hexdigest()
+            entry.loaded_version = version
+            entry.loaded_at = time.monotonic()
+            entry.reloads += 1
+            return value
+
+    def get_sync(self, name):
+        """
+        同步读取（供已在线程池中执行的代码使用）
+        """
+        entry = self._entries[name]
+        if self._fresh(entry):
+            entry.hits += 1
+            return entry.value
+        entry.misses += 1
+        return self.load(name)
+
+    async def get(self, name):
+        entry = self._entries[name]
+        if self._fresh(entry):
+            entry.hits += 1
+            return entry.value
+        entry.misses += 1
+        return await run_read(self.load, name)
+
+    async def get_tagged(self, name):
+        """
+        返回 (值, etag)
+
+        加载时先写值再写 etag，这里先读 etag 再读值：并发刷新时 etag 只可能比值旧，客户端下次请求会重新获取
+        """
+        await self.get(name)
+        entry = self._entries[name]
+        etag = entry.etag
+        return entry.value, etag
+
+    def invalidate(self, name=None):
+        names = [name] if name else list(self._entries)
+        for n in names:
+            entry = self._entries.get(n)
+            if entry is not None:
+                entry.version += 1
+                entry.invalidations += 1
+
+    def warm(self):
+        for name in self.loaders:
+            self.load(name)
+
+    def start_listener(self):
+        if self._listener is None:
+            self._stop.clear()
+            self._listener = threading.Thread(target=self._listen_loop, name="refcache-listener", daemon=True)
+            self._listener.start()
+
+    def stop_listener(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=10)
+            self._listener = None
+
+    def _listen_loop(self):
+        reconnect = False
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = new_connection()
+                conn.autocommit = True
+                cursor = conn.cursor()
+                for channel in [CHANNEL] + list(self._handlers):
+                    cursor.execute(f"LISTEN {channel}")
+                self.listening = True
+                if reconnect:
+                    # 断线期间可能错过通知，全部失效
+                    self.invalidate()
+                    for handler in self._handlers.values():
+                        handler(None)
+                reconnect = True
+                while not self._stop.is_set():
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    changed = set()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        if notify.channel == CHANNEL:
+                            changed.add(notify.payload)
+                        elif notify.channel in self._handlers:
+                            self._handlers[notify.channel](notify.payload)
+                    for name in changed:
+                        if name in self._entries:
+                            self.invalidate(name)
+                            try:
+                                self.load(name)
+                            except Exception as e:
+                                # 加载失败时保持失效状态，下次请求时重新加载
+                                logger.warning("刷新基础数据失败: %s, 错误: %s", name, e)
+            except Exception as e:
+                logger.warning("基础数据监听连接异常: %s", e)
+            finally:
+                self.listening = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(5)
+
+    def stats(self):
+        return {
+            "listening": self.listening,
+            "ttl": self.ttl,
+            "tables": {
+                name: {
+                    "hits": entry.hits,
+                    "misses": entry.misses,
+                    "reloads": entry.reloads,
+                    "invalidations": entry.invalidations,
+                    "age": round(time.monotonic() - entry.loaded_at, 3) if entry.loaded_at else None,
+                }
+                for name, entry in self._entries.items()
+            },
+        }
+
+
+cache = ReferenceCache(LOADERS, TTL)
@@ -0,0 +1,870 @@
+"""
+异步数据访问层
+
+所有对 products 的查询都在这里，阻塞的 psycopg2 调用统一放到 db_executor 的有界线程池中执行，不占用事件循环。
+exception / model_series / series_processes / month_range 由 refcache 缓存在内存中。
+"""
+import base64
+import json
+import logging
+import threading
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+from itertools import count
+
+from fastapi import HTTPException
+import psycopg2
+from psycopg2.extras import execute_values
+
+from database import get_connection, get_pool, env_int, NEW_CODE_LOCK, new_code_bucket
+from db_executor import run_read, run_write, READ_WORKERS, WRITE_WORKERS
+from processes import PROCESS_COLUMNS, PRODUCT_FIELDS, EMPLOYEE_COLUMNS, TIME_COLUMNS
+import processes
+import refcache
+import last_activity
+import product_cache
+from process_events import record_events, process_of, fetch_day_counts, fetch_range_counts
+import admission
+import data_versions
+import employees
+import plan_import
+
+logger = logging.getLogger("repository")
+
+# 与原SQL预筛选（任一员工列 LIKE '%名%'）一致：任一员工列是包含查询名的员工，
+# 员工名先在 employee_names 维表中查出（见 employees.resolve），这里按员工列索引查找
+EMPLOYEE_LISTED_CONDITION = "(" + " OR ".join(
+    f'"{emp_col}" = ANY(%(listed)s)' for _, emp_col, _ in PROCESS_COLUMNS
+) + ")"
+
+# 只查询接口用到的列，不返回表中的其他列（如时间列迁移期间的 *_legacy 列）
+PRODUCT_SELECT = ", ".join(f'"{col}"' for col in PRODUCT_FIELDS)
+
+# 时区偏移最大不超过14小时，带时区的查询范围先按墙上时间放宽后走索引，再按绝对时间精确过滤
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+# 流式查询每次从服务端游标取回的行数
+STREAM_BATCH_SIZE = max(1, env_int("STREAM_BATCH_SIZE", 500))
+
+# 流式响应在整个响应期间占用一个连接池连接（不经过读写线程池），同时进行的流式响应数不超过
+# 连接池中读写线程之外的空余连接数，慢客户端不会占满连接池使扫码写入等不到连接
+STREAM_MAX = max(1, env_int("STREAM_MAX_CONCURRENT", env_int("DB_POOL_MAX", 10) - READ_WORKERS - WRITE_WORKERS))
+_stream_slots = threading.BoundedSemaphore(STREAM_MAX)
+
+
+def _process_condition(emp_col, time_col, aware, native):
+    """
+    单个工序的员工匹配 + 时间范围条件，语义与 is_employee_match / is_date_in_range 一致
+
+    %(names)s 为与查询名匹配（employee_matches）的原始员工名
+
+    native 表示时间列已转换为 timestamptz（见 migrate_timestamps.py），此时直接在列上比较以使用索引
+    """
+    condition = f'"{emp_col}" = ANY(%(names)s) AND '
+    if native and aware:
+        condition += f'"{time_col}" BETWEEN %(start)s AND %(end)s'
+    elif native:
+        # 不带时区的范围按会话时区的墙上时间比较
+        condition += (
+            f'"{time_col}" BETWEEN (%(start)s::timestamp AT TIME ZONE current_setting(\'TimeZone\')) '
+            f'AND (%(end)s::timestamp AT TIME ZONE current_setting(\'TimeZone\'))'
+        )
+    else:
+        condition += f'product_time_wall("{time_col}"::text) BETWEEN %(wall_start)s AND %(wall_end)s'
+        if aware:
+            condition += f' AND product_time_instant("{time_col}"::text) BETWEEN %(start)s AND %(end)s'
+    return condition
+
+
+def _sort_time(time_col, native):
+    # 分页排序用的时间：文本列按墙上时间（与表达式索引一致），timestamptz 列直接用列值
+    return f'"{time_col}"' if native else f'product_time_wall("{time_col}"::text)'
+
+
+@lru_cache(maxsize=None)
+def monthly_products_query(aware, native, paged=False, after=False):
+    """
+    paged 时按产品编码分页（LIMIT %(limit)s），after 时从 %(after_code)s 之后开始
+    """
+    conditions = " OR ".join(
+        f"({_process_condition(emp_col, time_col, aware, native)})" for _, emp_col, time_col in PROCESS_COLUMNS
+    )
+    return f"""
+SELECT {PRODUCT_SELECT} FROM products
+WHERE {EMPLOYEE_LISTED_CONDITION} AND ({conditions}){' AND "产品编码" > %(after_code)s' if after else ''}
+ORDER BY "产品编码"{' LIMIT %(limit)s' if paged else ''}
+"""
+
+
+@lru_cache(maxsize=None)
+def monthly_transactions_query(aware, native, paged=False, after=False):
+    """
+    paged 时按 (时间, 产品编码, 工序序号) 分页，after 时从 %(after_time)s / %(after_code)s / %(after_seq)s 之后开始
+    """
+    # 各工序列展开为行：每个工序一个分支，分别走各自时间列的索引
+    branches = "\nUNION ALL\n".join(
+        f"""SELECT {seq} AS seq, '{process}' AS process, "产品编码", "产品型号", "{time_col}" AS time"""
+        + (f", {_sort_time(time_col, native)} AS sort_time" if paged else "")
+        + f"""
+FROM products
+WHERE {EMPLOYEE_LISTED_CONDITION} AND {_process_condition(emp_col, time_col, aware, native)}"""
+        for seq, (process, emp_col, time_col) in enumerate(PROCESS_COLUMNS)
+    )
+    # 直接输出接口字段名，路由不再逐行转换
+    if not paged:
+        return f"""
+SELECT process, "产品编码" AS "productCode", "产品型号" AS model, time FROM (
+{branches}
+) t
+ORDER BY "产品编码", seq
+"""
+    where = 'WHERE (sort_time, "产品编码", seq) > (%(after_time)s, %(after_code)s, %(after_seq)s)' if after else ''
+    return f"""
+SELECT process, "产品编码" AS "productCode", "产品型号" AS model, time, sort_time, seq FROM (
+{branches}
+) t
+{where}
+ORDER BY sort_time, "产品编码", seq
+LIMIT %(limit)s
+"""
+
+
+_native_time_columns = None
+
+
+def time_columns_native(cursor):
+    """
+    各工序时间列是否都已是 timestamptz，结果在进程内缓存（迁移切换后需重启服务）
+    """
+    global _native_time_columns
+    if _native_time_columns is None:
+        cursor.execute(
+            "SELECT count(*) AS n FROM information_schema.columns "
+            "WHERE table_name = 'products' AND column_name = ANY(%s) AND data_type = 'timestamp with time zone'",
+            ([time_col for _, _, time_col in PROCESS_COLUMNS],)
+        )
+        _native_time_columns = cursor.fetchone()["n"] == len(PROCESS_COLUMNS)
+    return _native_time_columns
+
+
+# 录入/清除工序的语句，按 (语句, 时间列, 员工列) 生成一次
+INSERT = "insert"            # (产品编码, 时间[, 员工])
+INSERT_MANY = "insert_many"  # execute_values 的 VALUES %s
+UPDATE = "update"            # 时间[, 员工], 产品编码
+UPDATE_MANY = "update_many"  # 时间[, 员工], 产品编码数组
+CLEAR = "clear"              # 产品编码
+
+
+@lru_cache(maxsize=None)
+def process_write_query(kind, time_col, emp_col=None):
+    """
+    emp_col 为空时只写时间列；列名必须是注册表中的工序列，否则抛出 ValueError（不缓存）
+    """
+    if time_col not in TIME_COLUMNS or (emp_col and emp_col not in EMPLOYEE_COLUMNS):
+        raise ValueError(f"未知的工序字段: {time_col}, {emp_col}")
+    columns = [time_col, emp_col] if emp_col else [time_col]
+    if kind == INSERT:
+        names = ", ".join(f'"{col}"' for col in columns)
+        placeholders = ", ".join(["%s"] * len(columns))
+        return f'INSERT INTO products ("产品编码", {names}) VALUES (%s, {placeholders}) RETURNING {PRODUCT_SELECT}'
+    if kind == INSERT_MANY:
+        names = ", ".join(f'"{col}"' for col in columns)
+        return f'INSERT INTO products ("产品编码", {names}) VALUES %s RETURNING {PRODUCT_SELECT}'
+    value = "NULL" if kind == CLEAR else "%s"
+    assignments = ", ".join(f'"{col}" = {value}' for col in columns)
+    where = '"产品编码" = ANY(%s)' if kind == UPDATE_MANY else '"产品编码" = %s'
+    return f"UPDATE products SET {assignments} WHERE {where} RETURNING {PRODUCT_SELECT}"
+
+
+INTERVAL_ERROR = "两次录入绕线工序时间间隔小于5分钟，禁止录入"
+EXISTS_ERROR = "该产品的该工序已存在数据，不能覆盖"
+
+
+# ---------- 同步实现（在线程池中执行） ----------
+
+def warm():
+    """
+    启动时在接收请求之前调用：建好连接池的初始连接，检查工序注册表，读取时间列类型，
+    生成各种月度查询语句和各工序的录入/清除语句
+    """
+    series_processes = refcache.cache.get_sync("series_processes")
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        processes.check(cursor, series_processes)
+        native = time_columns_native(cursor)
+    for build in MONTHLY_QUERIES.values():
+        for aware in (False, True):
+            for paged, after in ((False, False), (True, False), (True, True)):
+                build(aware, native, paged, after)
+    for _, emp_col, time_col in PROCESS_COLUMNS:
+        for kind in (INSERT, INSERT_MANY, UPDATE, UPDATE_MANY, CLEAR):
+            process_write_query(kind, time_col, emp_col)
+
+
+def _fetch_product(product_code):
+    row, version = product_cache.cache.get(product_code)
+    if row is not None:
+        return row
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = %s',
+            (product_code,)
+        )
+        row = cursor.fetchone()
+    product_cache.cache.fill(product_code, row, version)
+    return row
+
+
+def _fetch_products(product_codes, fields=None):
+    """
+    批量查询产品，返回 (按请求顺序的行, 不存在的编码)
+
+    先查产品缓存，未命中的编码用一次 = ANY(...) 查询取回完整行并写回缓存；
+    fields 不为空时只返回这些列（始终包含产品编码），含 PRODUCT_FIELDS 以外的列时返回 400
+    """
+    if fields:
+        unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(unknown)}")
+    codes = list(dict.fromkeys(product_codes))
+    found = {}
+    missing = {}  # 未命中缓存的编码 -> 版本号
+    for code in codes:
+        row, version = product_cache.cache.get(code)
+        if row is not None:
+            found[code] = row
+        else:
+            missing[code] = version
+    if missing:
+        with get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = ANY(%s)',
+                (list(missing),)
+            )
+            for row in cursor.fetchall():
+                code = row["产品编码"]
+                found[code] = row
+                product_cache.cache.fill(code, row, missing[code])
+    if fields:
+        columns = ["产品编码"] + [f for f in dict.fromkeys(fields) if f != "产品编码"]
+        rows = [{col: found[code][col] for col in columns} for code in codes if code in found]
+    else:
+        rows = [found[code] for code in codes if code in found]
+    not_found = [code for code in codes if code not in found]
+    return rows, not_found
+
+
+def _monthly_params(employee_name, start_date, end_date):
+    """
+    构造月度查询参数；起止时间一个带时区一个不带时，Python 中比较必然失败，返回 None 表示无结果
+    """
+    aware = start_date.tzinfo is not None
+    if aware != (end_date.tzinfo is not None):
+        return None, None
+    if aware:
+        wall_start = start_date.astimezone(timezone.utc).replace(tzinfo=None) - MAX_UTC_OFFSET
+        wall_end = end_date.astimezone(timezone.utc).replace(tzinfo=None) + MAX_UTC_OFFSET
+    else:
+        wall_start, wall_end = start_date, end_date
+    params = {
+        "start": start_date,
+        "end": end_date,
+        "wall_start": wall_start,
+        "wall_end": wall_end,
+    }
+    return aware, params
+
+
+# ---------- 月度查询分页 ----------
+# 分页游标为 base64 编码的 JSON 数组：产品列表为 [产品编码]，交易记录为 [时间, 产品编码, 工序序号]
+
+PRODUCTS = "products"
+TRANSACTIONS = "transactions"
+
+MONTHLY_QUERIES = {
+    PRODUCTS: monthly_products_query,
+    TRANSACTIONS: monthly_transactions_query,
+}
+
+
+def page_key(kind, row):
+    if kind == PRODUCTS:
+        return [row["产品编码"]]
+    return [row["sort_time"].isoformat(), row["productCode"], row["seq"]]
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, ensure_ascii=False).encode()).decode().rstrip("=")
+
+
+def decode_cursor(kind, token):
+    """
+    解析分页游标，格式不对时返回 400
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if kind == PRODUCTS:
+            (code,) = key
+            return {"after_code": str(code)}
+        sort_time, code, seq = key
+        return {"after_time": datetime.fromisoformat(sort_time), "after_code": str(code), "after_seq": int(seq)}
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def _monthly_query(kind, cursor, employee_name, start_date, end_date, limit=None, after=None):
+    """
+    构造月度查询，返回 (SQL, 参数)；没有结果时返回 (None, None)
+
+    limit 不为空时多取一行，用于判断是否还有下一页
+    """
+    aware, params = _monthly_params(employee_name, start_date, end_date)
+    if not employee_name or params is None:
+        return None, None
+    params["names"], params["listed"] = employees.resolve(cursor, employee_name)
+    if not params["names"] or not params["listed"]:
+        return None, None
+    paged = limit is not None
+    if paged:
+        params["limit"] = limit + 1
+    if after:
+        params.update(after)
+    query = MONTHLY_QUERIES[kind](aware, time_columns_native(cursor), paged, bool(after))
+    return query, params
+
+
+def _fetch_monthly(kind, employee_name, start_date, end_date, limit=None, after=None):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        query, params = _monthly_query(kind, cursor, employee_name, start_date, end_date, limit, after)
+        if query is None:
+            return []
+        cursor.execute(query, params)
+        return cursor.fetchall()
+
+
+_stream_ids = count()
+
+
+class _RowStream:
+    """
+    服务端命名游标：连接在整个流式响应期间借出，每次只取回一批行，内存占用与结果总量无关
+    """
+
+    def __init__(self, kind, employee_name, start_date, end_date, limit=None, after=None):
+        # 不在读线程中等待名额，直接返回 503
+        if not _stream_slots.acquire(blocking=False):
+            admission.REJECTED.inc("stream", "queue_full")
+            raise HTTPException(
+                status_code=503, detail=admission.BUSY_DETAIL, headers={"Retry-After": str(admission.RETRY_AFTER)}
+            )
+        self.pool = get_pool()
+        self.cursor = None
+        self.lock = threading.Lock()
+        try:
+            self.conn = self.pool.getconn()
+        except Exception:
+            self.conn = None
+            _stream_slots.release()
+            raise
+        try:
+            query, params = _monthly_query(kind, self.conn.cursor(), employee_name, start_date, end_date, limit, after)
+            if query is not None:
+                self.cursor = self.conn.cursor(name=f"monthly_stream_{next(_stream_ids)}")
+                self.cursor.itersize = STREAM_BATCH_SIZE
+                self.cursor.execute(query, params)
+        except Exception:
+            self.close()
+            raise
+
+    def fetch(self):
+        if self.cursor is None:
+            return []
+        return self.cursor.fetchmany(STREAM_BATCH_SIZE)
+
+    def close(self):
+        """
+        关闭游标并归还连接，可重复调用
+        """
+        with self.lock:
+            if self.conn is None:
+                return
+            discard = False
+            try:
+                if self.cursor is not None and not self.cursor.closed:
+                    self.cursor.close()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                discard = True
+            except psycopg2.Error:
+                pass
+            # 归还时连接池会回滚未结束的事务
+            self.pool.putconn(self.conn, discard=discard)
+            self.conn = None
+            _stream_slots.release()
+
+
+def _check_process_rules(data, product, latest_wiring, exception_models):
+    """
+    5分钟间隔和"工序已有数据"校验；exception 表中的型号录入绕线时不校验间隔
+    """
+    model = product.get("产品型号") if product else None
+    if not (model and model in exception_models):
+        # 本进程记住的最近绕线时间只会比数据库旧，命中时可直接拒绝
+        if last_activity.recently_wired(data.employeeName) or last_activity.within_interval(latest_wiring):
+            raise HTTPException(status_code=400, detail=INTERVAL_ERROR)
+    if product and product[data.timeField]:
+        raise HTTPException(status_code=400, detail=EXISTS_ERROR)
+
+
+def _apply_product_process(data):
+    wiring = data.processType == 'wiring'
+    exception_models = refcache.cache.get_sync("exception") if wiring else frozenset()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        if wiring:
+            # 锁住该员工的最近绕线行，同一员工的绕线录入依次校验和写入
+            latest_wiring = last_activity.lock_last_wiring(cursor, data.employeeName)
+        else:
+            latest_wiring = last_activity.read_last_wiring(cursor, data.employeeName)
+        # 检查产品是否存在，加行锁防止并发扫码覆盖
+        cursor.execute(
+            f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = %s FOR UPDATE',
+            (data.productCode,)
+        )
+        product = cursor.fetchone()
+        if not product:
+            # 与批量录入插入同一新编码时按编码加锁，等锁期间对方插入的行改为 UPDATE
+            product = _lock_new_codes(cursor, {data.productCode}).get(data.productCode)
+        _check_process_rules(data, product, latest_wiring, exception_models)
+        if not product:
+            # 修改：如果产品不存在，则直接插入新记录，而不是返回错误
+            logger.info("产品不存在，创建新记录", extra={"productCode": data.productCode})
+            cursor.execute(
+                process_write_query(INSERT, data.timeField, data.employeeField),
+                [data.productCode] + _process_values(data)
+            )
+            _commit_process(conn, cursor, data, wiring)
+            return {"success": True}
+        # 更新数据
+        cursor.execute(
+            process_write_query(UPDATE, data.timeField, data.employeeField),
+            _process_values(data) + [data.productCode]
+        )
+        _commit_process(conn, cursor, data, wiring)
+        return {"success": True}
+
+
+def _commit_process(conn, cursor, data, wiring):
+    """
+    写入事件、最近绕线时间并提交，提交后失效产品缓存
+    """
+    record_events(cursor, [_process_event(data, +1)])
+    record_wiring = wiring and data.employeeField
+    if record_wiring:
+        last_activity.set_last_wiring(cursor, data.employeeName, data.timestamp)
+    product_cache.notify_changed(cursor, [data.productCode])
+    conn.commit()
+    product_cache.cache.invalidate(data.productCode)
+    if record_wiring:
+        last_activity.remember(data.employeeName, data.timestamp)
+
+
+def _process_values(data):
+    # 与 process_write_query 的列顺序一致：时间[, 员工]
+    return [data.timestamp, data.employeeName] if data.employeeField else [data.timestamp]
+
+
+def _process_event(data, delta):
+    employee = data.employeeName if data.employeeField else None
+    return (data.productCode, process_of(data.timeField), employee, data.timestamp, delta)
+
+
+def _apply_batch_process(product_codes, process_type, employee_name, time_field, employee_field, timestamp):
+    """
+    在一个事务中批量录入工序
+
+    按原逐个录入的顺序在内存中判断"工序已有数据"和"5分钟间隔"规则，
+    本批次内先写入的绕线记录同样参与后续编码的间隔判断，结果与逐个调用 update 一致。
+    """
+    results = []
+    if not product_codes:
+        return results
+    wiring = process_type == 'wiring'
+    # 取连接之前读取：缓存过期时 get_sync 要再取一个连接，连接池将满时嵌套取连接会互相等待
+    exception_models = refcache.cache.get_sync("exception") if wiring else frozenset()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # 先锁员工的最近绕线行再锁产品行，与单个录入的加锁顺序一致
+        if wiring:
+            latest_wiring = last_activity.lock_last_wiring(cursor, employee_name)
+        else:
+            latest_wiring = last_activity.read_last_wiring(cursor, employee_name)
+        unique_codes = list(dict.fromkeys(product_codes))
+        # 一次取回所有已存在的产品并按产品编码顺序加行锁，防止并发扫码覆盖，重叠的批次不会死锁
+        cursor.execute(
+            f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = ANY(%s) ORDER BY "产品编码" FOR UPDATE',
+            (unique_codes,)
+        )
+        existing = {row["产品编码"]: row for row in cursor.fetchall()}
+        existing.update(_lock_new_codes(cursor, set(unique_codes) - set(existing)))
+
+        filled = set()  # 本批次内已写入该工序的产品编码
+        to_insert = []
+        to_update = []
+        for code in product_codes:
+            try:
+                product = existing.get(code)
+                model = product.get("产品型号") if product else None
+                skip_check = wiring and model in exception_models
+                if not skip_check and last_activity.within_interval(latest_wiring):
+                    results.append({"code": code, "success": False, "error": INTERVAL_ERROR})
+                    continue
+                if code in filled or (product and product[time_field]):
+                    results.append({"code": code, "success": False, "error": EXISTS_ERROR})
+                    continue
+                if product:
+                    to_update.append(code)
+                else:
+                    to_insert.append(code)
+                filled.add(code)
+                if wiring:
+                    latest_wiring = timestamp
+                results.append({"code": code, "success": True})
+            except Exception as e:
+                results.append({"code": code, "success": False, "error": str(e)})
+
+        try:
+            values = [timestamp, employee_name] if employee_field else [timestamp]
+            written = []  # RETURNING 的新行，提交后失效这些编码的产品缓存
+            if to_insert:
+                written += execute_values(
+                    cursor,
+                    process_write_query(INSERT_MANY, time_field, employee_field),
+                    # 按产品编码顺序插入，并发批次在唯一索引上的等待顺序一致
+                    [(code, *values) for code in sorted(to_insert)],
+                    fetch=True
+                )
+            if to_update:
+                cursor.execute(process_write_query(UPDATE_MANY, time_field, employee_field), values + [to_update])
+                written += cursor.fetchall()
+            employee = employee_name if employee_field else None
+            record_events(cursor, [
+                (code, process_of(time_field), employee, timestamp, +1)
+                for code in to_insert + to_update
+            ])
+            record_wiring = wiring and employee_field and (to_insert or to_update)
+            if record_wiring:
+                last_activity.set_last_wiring(cursor, employee_name, timestamp)
+            if written:
+                product_cache.notify_changed(cursor, [row["产品编码"] for row in written])
+            conn.commit()
+            product_cache.cache.invalidate_many(row["产品编码"] for row in written)
+            if record_wiring:
+                last_activity.remember(employee_name, timestamp)
+        except Exception as e:
+            conn.rollback()
+            # 写入失败时整批回滚，本批次标记成功的编码全部改为失败
+            logger.exception("批量录入失败")
+            results = [
+                r if not r["success"] else {"code": r["code"], "success": False, "error": str(e)}
+                for r in results
+            ]
+    return results
+
+
+def _apply_process_group(items):
+    """
+    在一个事务中依次执行多个单条录入（写入队列的一个批次），返回与 items 对应的结果或 HTTPException
+
+    按队列顺序在内存中模拟逐条执行：每条都按加锁读取的数据库行和本批次之前的写入做校验，
+    结果与逐个调用 _apply_product_process 一致。提交前出错时退回逐条执行，一条异常不影响其他请求。
+    """
+    # 取连接之前读取，避免在持有连接时再取连接
+    if any(d.processType == 'wiring' for d in items):
+        exception_models = refcache.cache.get_sync("exception")
+    else:
+        exception_models = frozenset()
+    try:
+        with get_connection() as conn:
+            results, written, wired = _write_process_group(conn.cursor(), items, exception_models)
+            conn.commit()
+    except Exception:
+        logger.exception("合并写入失败，逐条重试", extra={"items": len(items)})
+        results = []
+        for data in items:
+            try:
+                results.append(_apply_product_process(data))
+            except Exception as e:
+                results.append(e)
+        return results
+    product_cache.cache.invalidate_many(written)
+    for employee, value in wired.items():
+        last_activity.remember(employee, value)
+    return results
+
+
+def _lock_new_codes(cursor, codes):
+    """
+    按桶号顺序对尚未登记的产品编码加事务级咨询锁（见 database.NEW_CODE_LOCK），插入新产品行前调用；
+    返回等锁期间其他事务已插入的产品行（加行锁），这些编码改为 UPDATE
+    """
+    if not codes:
+        return {}
+    codes = sorted(codes)
+    cursor.execute(
+        f"SELECT pg_advisory_xact_lock({NEW_CODE_LOCK}, b) FROM "
+        f"(SELECT DISTINCT {new_code_bucket('c')} AS b FROM unnest(%s::text[]) c ORDER BY b) s",
+        (codes,)
+    )
+    cursor.execute(
+        f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = ANY(%s) ORDER BY "产品编码" FOR UPDATE',
+        (codes,)
+    )
+    return {row["产品编码"]: row for row in cursor.fetchall()}
+
+
+def _write_process_group(cursor, items, exception_models):
+    """
+    校验并写入一个批次，不提交；返回 (结果, 产品编码 -> 最新行, 员工 -> 本批次最近绕线时间)
+    """
+    # 加锁顺序与单条录入一致：先按员工名顺序锁住最近绕线行，再锁产品行
+    wiring_employees = sorted({d.employeeName for d in items if d.processType == 'wiring'})
+    latest = {}
+    for employee in wiring_employees:
+        latest[employee] = last_activity.lock_last_wiring(cursor, employee)
+    for employee in sorted({d.employeeName for d in items} - set(wiring_employees)):
+        latest[employee] = last_activity.read_last_wiring(cursor, employee)
+    cursor.execute(
+        f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = ANY(%s) ORDER BY "产品编码" FOR UPDATE',
+        (sorted({d.productCode for d in items}),)
+    )
+    products = {row["产品编码"]: row for row in cursor.fetchall()}
+    # 新编码按队列顺序插入（规则依赖顺序），先按固定顺序锁住，并发批次插入不同顺序的新编码时不会死锁
+    products.update(_lock_new_codes(cursor, {d.productCode for d in items} - set(products)))
+
+    results = []
+    written = {}
+    wired = {}
+    events = []
+    for data in items:
+        wiring = data.processType == 'wiring'
+        try:
+            _check_process_rules(
+                data, products.get(data.productCode), latest[data.employeeName],
+                exception_models if wiring else frozenset()
+            )
+        except HTTPException as e:
+            results.append(e)
+            continue
+        if data.productCode not in products:
+            cursor.execute(
+                process_write_query(INSERT, data.timeField, data.employeeField),
+                [data.productCode] + _process_values(data)
+            )
+        else:
+            cursor.execute(
+                process_write_query(UPDATE, data.timeField, data.employeeField),
+                _process_values(data) + [data.productCode]
+            )
+        row = cursor.fetchone()
+        # 本批次后续的请求按写入后的行校验
+        products[data.productCode] = written[data.productCode] = row
+        events.append(_process_event(data, +1))
+        if wiring and data.employeeField:
+            latest[data.employeeName] = last_activity.later(latest[data.employeeName], data.timestamp)
+            wired[data.employeeName] = last_activity.later(wired.get(data.employeeName), data.timestamp)
+        results.append({"success": True})
+
+    if events:
+        record_events(cursor, events)
+        for employee, value in wired.items():
+            last_activity.set_last_wiring(cursor, employee, value)
+        product_cache.notify_changed(cursor, list(written))
+    return results, written, wired
+
+
+def _check_clear_rules(data, product):
+    if not product:
+        raise HTTPException(status_code=404, detail="产品不存在")
+    # 检查是否是当前用户的工序 - 浸漆工序特殊处理
+    if data.employeeField and data.processType != '浸漆' and product[data.employeeField] != data.employeeName:
+        raise HTTPException(status_code=403, detail="不是当前用户的工序")
+
+
+def _clearing_wiring_employee(data, product):
+    # 清除的是已有的绕线记录时返回原绕线员工，其最近绕线时间需要重新计算
+    if product and process_of(data.timeField) == last_activity.WIRING and product.get(data.timeField):
+        return product.get("绕线员工")
+    return None
+
+
+def _clear_product_process(data):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        # 清除绕线记录会影响原员工的最近绕线时间：与录入的加锁顺序一致，先锁住该员工的行再锁产品行
+        wiring_employee = None
+        if process_of(data.timeField) == last_activity.WIRING:
+            cursor.execute(
+                f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = %s',
+                (data.productCode,)
+            )
+            product = cursor.fetchone()
+            _check_clear_rules(data, product)
+            wiring_employee = _clearing_wiring_employee(data, product)
+            if wiring_employee:
+                last_activity.lock_last_wiring(cursor, wiring_employee)
+        # 加锁读取产品行：校验和冲减计数都以此为准，并发删除同一工序时后一个看到的是已清除的行
+        cursor.execute(
+            f'SELECT {PRODUCT_SELECT} FROM products WHERE "产品编码" = %s FOR UPDATE',
+            (data.productCode,)
+        )
+        product = cursor.fetchone()
+        _check_clear_rules(data, product)
+        locked_employee = _clearing_wiring_employee(data, product)
+        if locked_employee and locked_employee != wiring_employee:
+            # 两次读取之间绕线记录被其他事务改写
+            last_activity.lock_last_wiring(cursor, locked_employee)
+        wiring_employee = locked_employee
+        # 清除工序信息
+        cursor.execute(process_write_query(CLEAR, data.timeField, data.employeeField), (data.productCode,))
+        # 按被清除的原记录冲减计数
+        if product.get(data.timeField):
+            old_employee = product.get(data.employeeField) if data.employeeField else None
+            record_events(cursor, [
+                (data.productCode, process_of(data.timeField), old_employee, product[data.timeField], -1)
+            ])
+        if wiring_employee:
+            last_activity.recompute_last_wiring(cursor, wiring_employee)
+        product_cache.notify_changed(cursor, [data.productCode])
+        conn.commit()
+        product_cache.cache.invalidate(data.productCode)
+        if wiring_employee:
+            last_activity.forget(wiring_employee)
+        return {"success": True}
+
+
+# ---------- 异步接口（供路由使用） ----------
+
+async def get_product(product_code):
+    return await run_read(_fetch_product, product_code)
+
+
+async def get_products(product_codes, fields=None):
+    """
+    批量查询产品，返回 (按请求顺序的行, 不存在的编码)
+    """
+    return await run_read(_fetch_products, product_codes, fields)
+
+
+async def get_monthly_products(employee_name, start_date, end_date, limit=None, after=None):
+    """
+    员工在时间范围内参与过任一工序的产品（完整行）
+    """
+    return await run_read(_fetch_monthly, PRODUCTS, employee_name, start_date, end_date, limit, after)
+
+
+async def get_monthly_transactions(employee_name, start_date, end_date, limit=None, after=None):
+    """
+    员工在时间范围内的工序记录，每行包含 process / productCode / model / time（分页时另有 sort_time / seq）
+    """
+    return await run_read(_fetch_monthly, TRANSACTIONS, employee_name, start_date, end_date, limit, after)
+
+
+async def open_monthly_stream(kind, employee_name, start_date, end_date, limit=None, after=None):
+    """
+    打开月度查询的服务端游标；在返回响应前调用，查询出错时仍可返回正常的错误码
+    """
+    return await run_read(_RowStream, kind, employee_name, start_date, end_date, limit, after)
+
+
+async def iter_monthly_stream(stream):
+    """
+    按批产出结果（每批最多 STREAM_BATCH_SIZE 行），结束或中断时归还连接
+    """
+    try:
+        while True:
+            rows = await run_read(stream.fetch)
+            if not rows:
+                break
+            yield rows
+    finally:
+        await run_read(stream.close)
+
+
+async def close_monthly_stream(stream):
+    await run_read(stream.close)
+
+
+async def get_day_process_counts(day, employee_name):
+    """
+    某一天与员工名匹配的员工的工序计数 [(员工, 工序, 数量)]
+    """
+    return await run_read(fetch_day_counts, day, employee_name)
+
+
+async def get_team_counts(start, end, by_model=False):
+    """
+    [start, end] 东八区日期范围内所有员工的工序计数；by_model 时再按产品型号分开
+    """
+    return await run_read(fetch_range_counts, start, end, by_model)
+
+
+async def get_total_version():
+    return await run_read(data_versions.fetch_total_version)
+
+
+async def search_employees(query, limit):
+    return await run_read(employees.search, query, limit)
+
+
+async def import_plan(file, header, encoding):
+    return await run_write(plan_import.import_plan, file, header, encoding)
+
+
+async def get_data_version(employee_name):
+    """
+    与员工名匹配的员工数据版本，用于报表接口的 ETag；需在执行报表查询之前读取
+    """
+    return await run_read(data_versions.fetch_version, employee_name)
+
+
+async def get_model_series():
+    """
+    返回 (行, etag)
+    """
+    return await refcache.cache.get_tagged("model_series")
+
+
+async def get_series_processes():
+    """
+    返回 (行, etag)
+    """
+    return await refcache.cache.get_tagged("series_processes")
+
+
+async def get_month_range():
+    """
+    返回 (month_range表的列名, 最新一条记录)
+    """
+    return await refcache.cache.get("month_range")
+
+
+async def apply_product_process(data):
+    return await run_write(_apply_product_process, data)
+
+
+async def apply_process_group(items):
+    return await run_write(_apply_process_group, items)
+
+
+async def apply_batch_process(product_codes, process_type, employee_name, time_field, employee_field, timestamp):
+    return await run_write(
+        _apply_batch_process, product_codes, process_type, employee_name,
+        time_field, employee_field, timestamp
+    )
+
+
+async def clear_product_process(data):
+    return await run_write(_clear_product_process, data)
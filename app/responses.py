@@ -0,0 +1,84 @@
+"""
+JSON 响应编码
+
+使用 orjson 直接编码 dict / 数据库行 / datetime，不经过 FastAPI 的 jsonable_encoder；
+输出与默认 JSONResponse 相同（紧凑格式、不转义中文、datetime 为 isoformat）。
+未安装 orjson 时退回标准库 json。
+
+另提供 ETag / If-None-Match 条件请求的辅助函数。
+"""
+import hashlib
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    import json
+
+
+def _default(value):
+    # orjson 不支持的类型，与 jsonable_encoder 一致
+    if isinstance(value, Decimal):
+        return int(value) if value.as_tuple().exponent >= 0 else float(value)
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError
+
+
+def dumps(content):
+    """
+    编码为 JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps(content)
+
+
+# 客户端每次都带 If-None-Match 重新验证
+CACHE_CONTROL = "no-cache"
+
+
+def make_etag(*parts):
+    """
+    由版本号、请求参数等计算弱 ETag（压缩与否内容等价）
+    """
+    digest = hashlib.blake2b("\x1f".join(str(p) for p in parts).encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _opaque(tag):
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def etag_matches(request, etag):
+    """
+    If-None-Match 是否与 etag 匹配（弱比较）
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(_opaque(tag) == _opaque(etag) for tag in header.split(","))
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def etag_headers(etag):
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
@@ -0,0 +1,211 @@
+"""
+生产环境启动入口（多进程）
+
+按 CPU 核数（或 --workers）启动多个工作进程，共享主进程打开的监听端口。
+每个工作进程以工厂方式（main:create_app）创建应用，预加载基础数据、建好数据库连接、生成报表查询语句之后才开始接收请求。
+
+数据库连接总数 DB_CONNECTION_BUDGET 按工作进程数平分：每个进程留一个连接给变更通知监听，
+其余作为连接池上限，其中一个留给流式响应，剩下的分给读写线程池
+（显式设置的 DB_POOL_MAX / DB_POOL_MIN / DB_READ_WORKERS / DB_WRITE_WORKERS 优先）。
+每个进程至少需要 MIN_WORKER_CONNECTIONS 个连接，连接数不够所有进程时减少工作进程数。
+多个工作进程时每个进程写各自的日志文件（api.log -> api.1.log），避免同时轮转同一个文件。
+
+收到 SIGTERM/SIGINT 时各工作进程停止接收新连接，等待处理中的请求完成（最多 SERVE_GRACEFUL_TIMEOUT 秒），
+写完写入队列后退出。工作进程意外退出时主进程重新启动它。
+
+用法:
+    cd app
+    python3 serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+环境变量：
+    SERVE_WORKERS           工作进程数，默认 CPU 核数
+    DB_CONNECTION_BUDGET    所有工作进程合计的数据库连接数，默认 20
+    SERVE_GRACEFUL_TIMEOUT  停止时等待处理中请求的秒数，默认 30
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from database import env_int, env_float
+from logconfig import DEFAULT_LOG_FILE, LOG_DIR, SEPARATE_FILES
+import slow_query
+
+# 工作进程启动后这么久之内退出视为启动失败，重启前等待，避免反复重启
+MIN_UPTIME = 5.0
+
+# 每个工作进程在连接池之外的独立连接：变更通知监听，开启 SLOW_QUERY_EXPLAIN 时还有采集执行计划的连接
+DEDICATED_CONNECTIONS = 1 + (1 if slow_query.EXPLAIN and slow_query.THRESHOLD_MS > 0 else 0)
+
+# 每个工作进程至少需要的连接：独立连接，以及连接池中的读线程、写线程、流式响应各一个
+MIN_WORKER_CONNECTIONS = DEDICATED_CONNECTIONS + 3
+
+
+def fit_workers(workers, budget):
+    """
+    连接数不够 workers 个进程时减少进程数（至少 1 个），返回实际进程数
+    """
+    if "DB_POOL_MAX" in os.environ:
+        # 显式设置的连接池上限优先，只检查是否超出
+        per_worker = env_int("DB_POOL_MAX", 10) + DEDICATED_CONNECTIONS
+        if workers * per_worker > budget:
+            print(f"警告: {workers} 个工作进程共需 {workers * per_worker} 个数据库连接，"
+                  f"超过 DB_CONNECTION_BUDGET={budget}", flush=True)
+        return workers
+    fitted = max(1, min(workers, budget // MIN_WORKER_CONNECTIONS))
+    if fitted < workers:
+        print(f"警告: DB_CONNECTION_BUDGET={budget} 只够 {fitted} 个工作进程"
+              f"（每个至少 {MIN_WORKER_CONNECTIONS} 个连接），工作进程数由 {workers} 减为 {fitted}", flush=True)
+    if fitted * MIN_WORKER_CONNECTIONS > budget:
+        print(f"警告: DB_CONNECTION_BUDGET={budget} 少于一个工作进程所需的 {MIN_WORKER_CONNECTIONS} 个连接", flush=True)
+    return fitted
+
+
+def worker_env(workers, index, budget):
+    """
+    工作进程的环境变量：连接池和线程池大小、日志文件
+    """
+    # 独立连接（refcache 的 LISTEN 等）不在连接池中，连接池中一个连接留给流式响应
+    pool_max = max(MIN_WORKER_CONNECTIONS, budget // workers) - DEDICATED_CONNECTIONS
+    read_workers = max(1, (pool_max - 1) // 2)
+    write_workers = max(1, pool_max - 1 - read_workers)
+    sizes = {
+        "DB_POOL_MAX": pool_max,
+        "DB_READ_WORKERS": read_workers,
+        "DB_WRITE_WORKERS": write_workers,
+        # 写线程的连接在启动时建好
+        "DB_POOL_MIN": write_workers,
+    }
+    env = {key: str(value) for key, value in sizes.items() if key not in os.environ}
+    if workers > 1:
+        env["LOG_FILE"] = _worker_path(os.getenv("LOG_FILE", DEFAULT_LOG_FILE), index)
+        for env_name, filename in SEPARATE_FILES.values():
+            env[env_name] = _worker_path(os.getenv(env_name, os.path.join(LOG_DIR, filename)), index)
+    return env
+
+
+def _worker_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
+
+
+def bind_socket(host, port, backlog):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(index, sock, ready, env, graceful_timeout):
+    """
+    工作进程：uvicorn 处理请求，lifespan 启动完成（预加载结束）后才在监听端口上接收连接
+    """
+    os.environ.update(env)
+    os.environ["SERVE_WORKER"] = str(index)
+    # 主进程的信号处理不继承到工作进程，由 uvicorn 重新设置
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    import uvicorn
+
+    class Server(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets)
+            if not self.should_exit:
+                ready.set()
+
+    config = uvicorn.Config(
+        "main:create_app",
+        factory=True,
+        access_log=False,
+        lifespan="on",
+        timeout_graceful_shutdown=graceful_timeout,
+    )
+    Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, workers, sock, budget, graceful_timeout):
+        self.workers = workers
+        self.sock = sock
+        self.budget = budget
+        self.graceful_timeout = graceful_timeout
+        self.ctx = multiprocessing.get_context("fork")
+        self.procs = {}  # 序号 -> (进程, 就绪事件, 启动时间)
+        self.stopping = False
+
+    def spawn(self, index):
+        ready = self.ctx.Event()
+        env = worker_env(self.workers, index, self.budget)
+        proc = self.ctx.Process(
+            target=run_worker, args=(index, self.sock, ready, env, self.graceful_timeout),
+            name=f"api-worker-{index}"
+        )
+        proc.start()
+        self.procs[index] = (proc, ready, time.monotonic())
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        started = time.monotonic()
+        for index in range(1, self.workers + 1):
+            self.spawn(index)
+        print(f"启动 {self.workers} 个工作进程，pid: {[p.pid for p, _, _ in self.procs.values()]}", flush=True)
+        all_ready = False
+        while not self.stopping:
+            time.sleep(0.1)
+            if not all_ready and all(ready.is_set() for _, ready, _ in self.procs.values()):
+                all_ready = True
+                print(f"全部工作进程就绪，耗时 {time.monotonic() - started:.2f} 秒", flush=True)
+            for index, (proc, _, spawned) in list(self.procs.items()):
+                if proc.is_alive() or self.stopping:
+                    continue
+                print(f"工作进程 {index} (pid {proc.pid}) 退出，退出码 {proc.exitcode}，重新启动", flush=True)
+                if time.monotonic() - spawned < MIN_UPTIME:
+                    time.sleep(1)
+                self.spawn(index)
+        self.shutdown()
+
+    def shutdown(self):
+        print("停止中，等待处理中的请求完成", flush=True)
+        for proc, _, _ in self.procs.values():
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + self.graceful_timeout + 10
+        for proc, _, _ in self.procs.values():
+            proc.join(max(0.0, deadline - time.monotonic()))
+            if proc.is_alive():
+                print(f"工作进程 pid {proc.pid} 未在时限内退出，强制结束", flush=True)
+                proc.kill()
+                proc.join()
+        self.sock.close()
+        print("已停止", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程启动API服务")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=env_int("SERVE_WORKERS", os.cpu_count() or 1),
+                        help="工作进程数，默认 CPU 核数")
+    parser.add_argument("--backlog", type=int, default=2048)
+    args = parser.parse_args()
+
+    budget = env_int("DB_CONNECTION_BUDGET", 20)
+    workers = fit_workers(max(1, args.workers), budget)
+    sock = bind_socket(args.host, args.port, args.backlog)
+    Supervisor(
+        workers, sock,
+        budget=budget,
+        graceful_timeout=env_float("SERVE_GRACEFUL_TIMEOUT", 30),
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
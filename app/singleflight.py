@@ -0,0 +1,82 @@
+"""
+相同读请求合并（single-flight）
+
+同一时刻键相同的读请求只执行一次数据库查询，其余请求等待并共享结果。
+报表接口以 ETag 为键：ETag 包含数据版本号和全部（规范化后的）请求参数，有写入后版本号变化，不会拿到写入前开始的查询结果。
+
+SINGLEFLIGHT_TTL_MS 大于 0 时，查询完成后结果在这段时间内继续供相同键的请求使用（键中有版本号，同样不会返回写入前的数据）。
+查询出错时等待中的请求都收到同一异常，结果不保留。共享的结果是同一个对象，调用方不能修改。
+
+发起查询的请求被取消（客户端断开）时查询继续执行，其他等待的请求不受影响。
+
+环境变量：
+    SINGLEFLIGHT_ENABLED  为 0 时关闭，默认开启
+    SINGLEFLIGHT_TTL_MS   查询完成后结果的保留毫秒数，默认 0
+"""
+import asyncio
+import os
+
+import metrics
+from database import env_float
+
+ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") != "0"
+TTL = max(0.0, env_float("SINGLEFLIGHT_TTL_MS", 0)) / 1000
+
+# leader: 实际执行查询；coalesced: 等待进行中的查询；cached: 使用刚完成的结果
+REQUESTS = metrics.register(metrics.Counter(
+    "singleflight_requests_total", "读请求合并：按结果分类的请求数", ("name", "result")
+))
+
+
+class Group:
+    def __init__(self, ttl=0.0, enabled=True):
+        self.ttl = ttl
+        self.enabled = enabled
+        self._calls = {}  # (name, key) -> (task, 结果保留到的时间；进行中为 None)
+
+    async def do(self, name, key, fn, *args):
+        """
+        执行 await fn(*args)；键相同的请求正在执行或结果未过期时共享其结果
+        """
+        if not self.enabled:
+            return await fn(*args)
+        loop = asyncio.get_running_loop()
+        call_key = (name, key)
+        entry = self._calls.get(call_key)
+        if entry is not None:
+            task, expires = entry
+            if expires is None or expires > loop.time():
+                REQUESTS.inc(name, "coalesced" if expires is None else "cached")
+                return await asyncio.shield(task)
+        REQUESTS.inc(name, "leader")
+        # 单独的任务执行查询，发起请求被取消时不影响其他等待的请求
+        task = asyncio.ensure_future(fn(*args))
+        self._calls[call_key] = (task, None)
+        task.add_done_callback(lambda t: self._finish(call_key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, call_key, task):
+        entry = self._calls.get(call_key)
+        if entry is None or entry[0] is not task:
+            return
+        # exception() 同时标记异常已取回，没有请求等待时也不会告警
+        if self.ttl > 0 and not task.cancelled() and task.exception() is None:
+            loop = asyncio.get_running_loop()
+            self._calls[call_key] = (task, loop.time() + self.ttl)
+            loop.call_later(self.ttl, self._expire, call_key, task)
+        else:
+            if not task.cancelled():
+                task.exception()
+            del self._calls[call_key]
+
+    def _expire(self, call_key, task):
+        entry = self._calls.get(call_key)
+        if entry is not None and entry[0] is task:
+            del self._calls[call_key]
+
+    def stats(self):
+        running = sum(1 for _, expires in self._calls.values() if expires is None)
+        return {"enabled": self.enabled, "running": running, "cached": len(self._calls) - running}
+
+
+group = Group(TTL, ENABLED)
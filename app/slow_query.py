@@ -0,0 +1,172 @@
+"""
+慢语句日志
+
+通过 database.set_slow_query_hook 挂在游标执行上，耗时超过 SLOW_QUERY_MS 的语句记录到 slow_query 日志：
+语句指纹（去掉字面量后的SQL哈希）、SQL模板、参数结构（只记类型和长度，不记值）、耗时和行数。
+
+SLOW_QUERY_EXPLAIN=1 时，每个指纹第一次变慢时在后台线程用独立连接执行
+EXPLAIN (ANALYZE off, FORMAT JSON)，计划写入 slow_query.plan 日志（单独的轮转文件，见 logconfig）。
+EXPLAIN 不执行语句本身，也不占用请求的连接和事务。计划只保留节点类型、表名、索引名、代价和行数估计，
+Filter / Index Cond 等条件中带有参数值（员工名、产品编码），不写入日志。
+
+环境变量：
+    SLOW_QUERY_MS       慢语句阈值毫秒数，默认 200，0 表示关闭
+    SLOW_QUERY_EXPLAIN  为 1 时采集执行计划
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extras import RealDictCursor
+
+import database
+from database import env_float
+
+THRESHOLD_MS = env_float("SLOW_QUERY_MS", 200)
+EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN") == "1"
+# 已采集计划的指纹数上限，超过后不再采集新指纹
+MAX_EXPLAINED = 1000
+
+logger = logging.getLogger("slow_query")
+plan_logger = logging.getLogger("slow_query.plan")
+# 执行计划只在开启 SLOW_QUERY_EXPLAIN 时产生，不受 LOG_LEVEL 限制
+plan_logger.setLevel(logging.INFO)
+
+# 执行计划节点中写入日志的字段，其余字段（条件、排序键、输出列等）可能带有参数值
+PLAN_KEYS = (
+    "Node Type", "Parent Relationship", "Join Type", "Strategy", "Scan Direction",
+    "Relation Name", "Alias", "Index Name",
+    "Startup Cost", "Total Cost", "Plan Rows", "Plan Width",
+)
+
+_explained = set()
+_explained_lock = threading.Lock()
+_explain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+_explain_conn = None  # 只在 explain 线程中使用
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_ROWS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+_SPACE = re.compile(r"\s+")
+_EXPLAINABLE = re.compile(r"(SELECT|INSERT|UPDATE|DELETE|WITH|DECLARE)\b", re.I)
+# 服务端游标（流式输出）实际发送的是 DECLARE ... FOR <查询>
+_DECLARE = re.compile(rb'^DECLARE\s+"[^"]*"\s+(?:\w+\s+)*?CURSOR\s+(?:WITH(?:OUT)?\s+HOLD\s+)?FOR\s+', re.I)
+
+
+def normalize(query):
+    """
+    去掉字面量和多余空白，execute_values 展开的多行 VALUES 也归为同一指纹
+    """
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    query = _STRING.sub("?", str(query))
+    query = _NUMBER.sub("?", query)
+    query = _LIST.sub("(?)", query)
+    query = _ROWS.sub("(?)", query)
+    return _SPACE.sub(" ", query).strip()
+
+
+def fingerprint(normalized):
+    return hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _shape(value):
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, str):
+        return f"str({len(value)})"
+    return type(value).__name__
+
+
+def params_shape(vars):
+    if vars is None:
+        return None
+    if isinstance(vars, dict):
+        return {key: _shape(value) for key, value in vars.items()}
+    return [_shape(value) for value in vars]
+
+
+def record(cursor, query, vars, elapsed):
+    """
+    慢语句回调，在执行语句的线程中调用；不能抛出异常
+    """
+    try:
+        normalized = normalize(query)
+        fp = fingerprint(normalized)
+        logger.warning(
+            "慢语句 %.1fms", elapsed * 1000,
+            extra={
+                "fingerprint": fp,
+                "sql": normalized[:2000],
+                "params": params_shape(vars),
+                "duration_ms": round(elapsed * 1000, 2),
+                "rows": cursor.rowcount,
+            }
+        )
+        if EXPLAIN and cursor.query and _EXPLAINABLE.match(normalized):
+            with _explained_lock:
+                if fp in _explained or len(_explained) >= MAX_EXPLAINED:
+                    return
+                _explained.add(fp)
+            _explain_executor.submit(_explain, fp, normalized, cursor.query)
+    except Exception:
+        logger.debug("记录慢语句失败", exc_info=True)
+
+
+def redact_plan(node):
+    """
+    只保留 PLAN_KEYS 中的字段，子节点同样处理
+    """
+    redacted = {key: node[key] for key in PLAN_KEYS if key in node}
+    if node.get("Plans"):
+        redacted["Plans"] = [redact_plan(child) for child in node["Plans"]]
+    return redacted
+
+
+def _explain(fp, normalized, statement):
+    """
+    用独立连接获取执行计划；statement 为实际发送的语句（参数已代入），日志中只记去掉条件的计划
+    """
+    global _explain_conn
+    try:
+        if _explain_conn is None or _explain_conn.closed:
+            _explain_conn = database.new_connection()
+            _explain_conn.autocommit = True
+            # 普通游标，这里的语句不再经过慢语句回调
+            with _explain_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute("SET statement_timeout = '5s'")
+        with _explain_conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(b"EXPLAIN (ANALYZE off, FORMAT JSON) " + _DECLARE.sub(b"", statement))
+            plan = [{"Plan": redact_plan(item["Plan"])} for item in cursor.fetchone()["QUERY PLAN"]]
+        plan_logger.info("执行计划", extra={"fingerprint": fp, "sql": normalized[:2000], "plan": plan})
+    except Exception as e:
+        logger.info("获取执行计划失败: %s", e, extra={"fingerprint": fp})
+        if _explain_conn is not None:
+            try:
+                _explain_conn.close()
+            except Exception:
+                pass
+            _explain_conn = None
+
+
+def install():
+    """
+    挂到游标执行上；SLOW_QUERY_MS 为 0 时不挂
+    """
+    if THRESHOLD_MS > 0:
+        database.set_slow_query_hook(THRESHOLD_MS / 1000, record)
+
+
+def shutdown():
+    global _explain_conn
+    _explain_executor.shutdown(wait=False, cancel_futures=True)
+    if _explain_conn is not None:
+        try:
+            _explain_conn.close()
+        except Exception:
+            pass
+        _explain_conn = None
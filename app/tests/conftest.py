@@ -0,0 +1,11 @@
+"""
+单元测试：只测试不需要数据库的纯 Python 部分
+
+    cd app
+    python3 -m pytest tests
+"""
+import os
+import sys
+
+# 与服务相同，以 app/ 为模块根目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,145 @@
+import asyncio
+
+import admission
+from admission import Limiter, AdmissionMiddleware
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def rejected(name, reason):
+    return admission.REJECTED._values.get((name, reason), 0)
+
+
+def test_acquire_within_limit():
+    async def scenario():
+        limiter = Limiter("t_limit", 2, 0, 0.1)
+        assert await limiter.acquire()
+        assert await limiter.acquire()
+        assert limiter.active == 2
+        limiter.release()
+        limiter.release()
+        assert limiter.active == 0
+    run(scenario())
+
+
+def test_queue_full_rejects():
+    async def scenario():
+        limiter = Limiter("t_full", 1, 0, 1.0)
+        before = rejected("t_full", "queue_full")
+        assert await limiter.acquire()
+        assert not await limiter.acquire()
+        assert rejected("t_full", "queue_full") == before + 1
+        assert limiter.active == 1
+    run(scenario())
+
+
+def test_timeout_rejects_and_leaves_queue():
+    async def scenario():
+        limiter = Limiter("t_timeout", 1, 1, 0.01)
+        assert await limiter.acquire()
+        assert not await limiter.acquire()
+        assert rejected("t_timeout", "timeout") == 1
+        assert limiter.stats()["t_timeout_waiting"] == 0
+        limiter.release()
+        assert limiter.active == 0
+    run(scenario())
+
+
+def test_release_hands_slot_to_first_waiter():
+    async def scenario():
+        limiter = Limiter("t_handoff", 1, 2, 1.0)
+        assert await limiter.acquire()
+        order = []
+
+        async def wait(name):
+            assert await limiter.acquire()
+            order.append(name)
+
+        first = asyncio.create_task(wait("first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(wait("second"))
+        await asyncio.sleep(0)
+        limiter.release()
+        await first
+        # 名额直接交给等待者，active 不变，第二个仍在排队
+        assert order == ["first"] and limiter.active == 1
+        assert limiter.stats()["t_handoff_waiting"] == 1
+        limiter.release()
+        await second
+        assert order == ["first", "second"] and limiter.active == 1
+        limiter.release()
+        assert limiter.active == 0
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        limiter = Limiter("t_cancel", 1, 1, 1.0)
+        assert await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        assert limiter.stats()["t_cancel_waiting"] == 0
+        limiter.release()
+        assert limiter.active == 0
+    run(scenario())
+
+
+def test_cancel_after_handoff_returns_slot():
+    async def scenario():
+        limiter = Limiter("t_handoff_cancel", 1, 1, 1.0)
+        assert await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # 名额交给等待者后、等待者恢复运行前被取消：取消被忽略时等待者拿到名额（Python 3.11 的 wait_for），
+        # 否则 acquire 交还名额；两种情况名额都不会丢失
+        limiter.release()
+        waiter.cancel()
+        (acquired,) = await asyncio.gather(waiter, return_exceptions=True)
+        if acquired is True:
+            limiter.release()
+        assert limiter.active == 0
+        assert await limiter.acquire()
+    run(scenario())
+
+
+async def call(middleware, path):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": path, "method": "GET", "headers": []}
+    await middleware(scope, receive, send)
+    return sent
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_middleware_rejects_with_retry_after():
+    async def scenario():
+        limiter = Limiter("t_mw", 1, 0, 0.1)
+        middleware = AdmissionMiddleware(ok_app, {"/limited": limiter})
+        assert await limiter.acquire()
+        sent = await call(middleware, "/limited")
+        start = sent[0]
+        assert start["status"] == 503
+        headers = dict(start["headers"])
+        assert headers[b"retry-after"] == str(admission.RETRY_AFTER).encode()
+        assert admission.BUSY_DETAIL.encode() in sent[1]["body"]
+        # 未列出的路径不受限制
+        assert (await call(middleware, "/other"))[0]["status"] == 200
+        limiter.release()
+        # 有名额时放行，处理完后交还
+        assert (await call(middleware, "/limited"))[0]["status"] == 200
+        assert limiter.active == 0
+    run(scenario())
@@ -0,0 +1,87 @@
+import time
+
+from product_cache import ProductCache
+
+ROW = {"产品编码": "P-1", "产品型号": "M1", "绕线员工": None}
+
+
+def test_miss_fill_hit():
+    cache = ProductCache(10, 60)
+    row, version = cache.get("P-1")
+    assert row is None and version is not None
+    cache.fill("P-1", ROW, version)
+    row, version = cache.get("P-1")
+    assert row == ROW and version is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_fill_discarded_when_invalidated_during_query():
+    cache = ProductCache(10, 60)
+    _, version = cache.get("P-1")
+    # 查询数据库期间本进程或其他进程写入了该编码
+    cache.invalidate("P-1")
+    cache.fill("P-1", ROW, version)
+    assert cache.get("P-1")[0] is None
+
+
+def test_invalidate_other_code_keeps_fill():
+    cache = ProductCache(10, 60)
+    _, version = cache.get("P-1")
+    cache.invalidate("P-2")
+    cache.fill("P-1", ROW, version)
+    assert cache.get("P-1")[0] == ROW
+
+
+def test_invalidate_all_discards_in_flight_fills():
+    cache = ProductCache(10, 60)
+    cache.fill("P-2", ROW, cache.get("P-2")[1])
+    _, version = cache.get("P-1")
+    cache.invalidate()
+    cache.fill("P-1", ROW, version)
+    assert cache.get("P-1")[0] is None
+    assert cache.get("P-2")[0] is None
+
+
+def test_invalidate_drops_cached_row():
+    cache = ProductCache(10, 60)
+    cache.fill("P-1", ROW, cache.get("P-1")[1])
+    cache.invalidate_many(["P-1"])
+    assert cache.get("P-1")[0] is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_fill_copies_row():
+    cache = ProductCache(10, 60)
+    row = dict(ROW)
+    cache.fill("P-1", row, cache.get("P-1")[1])
+    row["产品型号"] = "changed"
+    assert cache.get("P-1")[0]["产品型号"] == "M1"
+
+
+def test_ttl_expires():
+    cache = ProductCache(10, 0.01)
+    cache.fill("P-1", ROW, cache.get("P-1")[1])
+    time.sleep(0.02)
+    assert cache.get("P-1")[0] is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_lru_eviction():
+    cache = ProductCache(2, 60)
+    for code in ("A", "B"):
+        cache.fill(code, {"产品编码": code}, cache.get(code)[1])
+    cache.get("A")  # A 最近使用过
+    cache.fill("C", {"产品编码": "C"}, cache.get("C")[1])
+    assert cache.get("B")[0] is None
+    assert cache.get("A")[0] is not None and cache.get("C")[0] is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_not_found_and_disabled_not_stored():
+    cache = ProductCache(10, 60)
+    cache.fill("P-1", None, cache.get("P-1")[1])
+    assert cache.stats()["size"] == 0
+    disabled = ProductCache(0, 60)
+    disabled.fill("P-1", ROW, disabled.get("P-1")[1])
+    assert disabled.get("P-1")[0] is None
@@ -0,0 +1,34 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from repository import PRODUCTS, TRANSACTIONS, encode_cursor, decode_cursor, page_key
+
+
+def test_products_cursor_round_trip():
+    token = encode_cursor(page_key(PRODUCTS, {"产品编码": "编码-001"}))
+    assert "=" not in token
+    assert decode_cursor(PRODUCTS, token) == {"after_code": "编码-001"}
+
+
+def test_transactions_cursor_round_trip():
+    sort_time = datetime(2026, 10, 1, 8, 30, tzinfo=timezone.utc)
+    row = {"sort_time": sort_time, "productCode": "P-1", "seq": 3}
+    token = encode_cursor(page_key(TRANSACTIONS, row))
+    assert decode_cursor(TRANSACTIONS, token) == {
+        "after_time": sort_time, "after_code": "P-1", "after_seq": 3,
+    }
+
+
+@pytest.mark.parametrize("kind, token", [
+    (PRODUCTS, "not base64!"),
+    (PRODUCTS, encode_cursor(["a", "b"])),
+    (TRANSACTIONS, encode_cursor(["P-1"])),
+    (TRANSACTIONS, encode_cursor(["not a time", "P-1", 1])),
+    (TRANSACTIONS, encode_cursor(["2026-10-01T00:00:00", "P-1", "x"])),
+])
+def test_invalid_cursor_is_400(kind, token):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(kind, token)
+    assert e.value.status_code == 400
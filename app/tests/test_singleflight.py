@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from singleflight import Group
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Query:
+    """
+    可控的查询：每次调用计数，等到 release 后返回结果
+    """
+
+    def __init__(self, result="rows", error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.gate = None
+
+    async def __call__(self, *args):
+        self.calls += 1
+        await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return (self.result, args)
+
+
+def test_same_key_runs_once():
+    async def scenario():
+        group = Group()
+        query = Query()
+        query.gate = asyncio.Event()
+        tasks = [asyncio.create_task(group.do("report", "etag-1", query, 1)) for _ in range(5)]
+        await asyncio.sleep(0)
+        query.gate.set()
+        results = await asyncio.gather(*tasks)
+        assert query.calls == 1
+        assert all(r is results[0] for r in results)
+        assert group.stats()["running"] == 0
+    run(scenario())
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        group = Group()
+        query = Query()
+        query.gate = asyncio.Event()
+        query.gate.set()
+        a, b = await asyncio.gather(group.do("report", "a", query, 1), group.do("report", "b", query, 2))
+        assert query.calls == 2
+        assert a[1] == (1,) and b[1] == (2,)
+    run(scenario())
+
+
+def test_error_shared_and_not_kept():
+    async def scenario():
+        group = Group(ttl=10)
+        query = Query(error=ValueError("db down"))
+        query.gate = asyncio.Event()
+        tasks = [asyncio.create_task(group.do("report", "k", query)) for _ in range(3)]
+        await asyncio.sleep(0)
+        query.gate.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert query.calls == 1
+        assert all(isinstance(r, ValueError) for r in results)
+        # 出错的结果不保留，下一次重新查询
+        query.error = None
+        assert (await group.do("report", "k", query))[0] == "rows"
+        assert query.calls == 2
+    run(scenario())
+
+
+def test_ttl_keeps_result_until_expired():
+    async def scenario():
+        group = Group(ttl=0.05)
+        query = Query()
+        query.gate = asyncio.Event()
+        query.gate.set()
+        first = await group.do("report", "k", query)
+        assert await group.do("report", "k", query) is first
+        assert query.calls == 1 and group.stats()["cached"] == 1
+        await asyncio.sleep(0.1)
+        assert group.stats()["cached"] == 0
+        await group.do("report", "k", query)
+        assert query.calls == 2
+    run(scenario())
+
+
+def test_leader_cancel_does_not_affect_waiters():
+    async def scenario():
+        group = Group()
+        query = Query()
+        query.gate = asyncio.Event()
+        leader = asyncio.create_task(group.do("report", "k", query))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(group.do("report", "k", query))
+        await asyncio.sleep(0)
+        leader.cancel()
+        query.gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert (await follower)[0] == "rows"
+        assert query.calls == 1
+    run(scenario())
+
+
+def test_disabled_runs_every_call():
+    async def scenario():
+        group = Group(enabled=False)
+        query = Query()
+        query.gate = asyncio.Event()
+        query.gate.set()
+        await asyncio.gather(*(group.do("report", "k", query) for _ in range(3)))
+        assert query.calls == 3
+    run(scenario())
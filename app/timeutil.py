@@ -0,0 +1,84 @@
+"""
+工序时间统一解析
+
+工序时间列中混有 datetime 对象和各种格式的字符串，所有调用方都通过 normalize_timestamp 解析：
+- 与原逻辑一致：先按 ISO 解析（'Z' 视为 +00:00），失败再依次尝试 STRPTIME_FORMATS
+- 同一字符串只解析一次（lru_cache）
+- 按字符串"形状"（数字替换为9）记住成功的格式，新字符串优先用已知格式，避免逐个 try
+"""
+import re
+from datetime import datetime, timezone, timedelta
+from functools import lru_cache
+
+# 东八区，与 getUserTodayProcessCount 的日期边界一致
+SHANGHAI_TZ = timezone(timedelta(hours=8))
+
+ISO_FORMAT = "iso"
+STRPTIME_FORMATS = ["%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S",
+                    "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%d/%m/%Y"]
+
+_DIGITS = re.compile(r"\d")
+
+# 字符串形状 -> 成功解析的格式
+_shape_formats = {}
+
+
+def _parse_with(value, fmt):
+    if fmt == ISO_FORMAT:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return datetime.strptime(value, fmt)
+
+
+def _detect(value):
+    for fmt in [ISO_FORMAT] + STRPTIME_FORMATS:
+        try:
+            return fmt, _parse_with(value, fmt)
+        except ValueError:
+            continue
+    return None, None
+
+
+@lru_cache(maxsize=65536)
+def parse_timestamp(value):
+    """
+    解析时间字符串，无法解析返回 None；结果保留原有时区信息（可能是 naive）
+    """
+    shape = _DIGITS.sub("9", value)
+    fmt = _shape_formats.get(shape)
+    if fmt is not None:
+        try:
+            return _parse_with(value, fmt)
+        except ValueError:
+            # 同形状但日期非法等情况，退回完整检测
+            pass
+    fmt, parsed = _detect(value)
+    if fmt is not None:
+        _shape_formats[shape] = fmt
+    return parsed
+
+
+def normalize_timestamp(value):
+    """
+    把数据库中的工序时间统一为 datetime，空值或无法解析返回 None
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return parse_timestamp(str(value))
+
+
+def to_timezone(value, tz=SHANGHAI_TZ):
+    """
+    转换到指定时区，naive 时间视为该时区的本地时间
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=tz)
+    return value.astimezone(tz)
+
+
+def parse_cache_info():
+    return {
+        "parse": parse_timestamp.cache_info()._asdict(),
+        "shapes": len(_shape_formats),
+    }
@@ -0,0 +1,126 @@
+"""
+单条录入的合并提交（可选）
+
+WRITE_QUEUE_ENABLED=1 时，updateProductProcess 的请求先进入有界队列，由一个写入任务按批取出：
+攒够 WRITE_BATCH_MAX 条或等待 WRITE_BATCH_WAIT_MS 毫秒后，在一个事务中依次校验并写入（见 repository._apply_process_group），
+提交后再逐个返回各请求的结果。校验规则和返回结果与逐条提交相同，请求返回成功时数据已提交。
+
+队列已满或写入任务未运行时直接逐条提交。
+"""
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+import repository
+from database import env_int, env_float
+
+ENABLED = os.getenv("WRITE_QUEUE_ENABLED") == "1"
+QUEUE_SIZE = max(1, env_int("WRITE_QUEUE_SIZE", 1000))
+BATCH_MAX = max(1, env_int("WRITE_BATCH_MAX", 64))
+BATCH_WAIT = max(0.0, env_float("WRITE_BATCH_WAIT_MS", 5)) / 1000
+
+logger = logging.getLogger("write_queue")
+
+BATCH_SIZE = metrics.register(metrics.Histogram(
+    "write_queue_batch_size", "合并提交的批次大小", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256)
+))
+QUEUE_WAIT = metrics.register(metrics.Histogram("write_queue_wait_seconds", "请求在写入队列中的等待时间"))
+
+
+class WriteQueue:
+    def __init__(self, maxsize, batch_max, batch_wait):
+        self.maxsize = maxsize
+        self.batch_max = batch_max
+        self.batch_wait = batch_wait
+        self._queue = None
+        self._task = None
+        self.fallbacks = 0
+
+    def start(self):
+        """
+        在事件循环中启动写入任务
+        """
+        if self._task is None:
+            self._queue = asyncio.Queue(self.maxsize)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """
+        停止接收新请求，写完队列中已有的请求后退出
+        """
+        task, self._task = self._task, None
+        if task is None:
+            return
+        await self._queue.put(None)
+        await task
+
+    async def submit(self, data):
+        """
+        录入一条工序，返回结果或抛出与逐条提交相同的 HTTPException
+        """
+        if self._task is None:
+            return await repository.apply_product_process(data)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((data, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.fallbacks += 1
+            return await repository.apply_product_process(data)
+        # 请求被取消时批次仍会写入，shield 防止 future 被取消后结果无处可放
+        result = await asyncio.shield(future)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def _collect(self, first):
+        """
+        取出已排队的请求；不足一批时等待 batch_wait 后再取一次
+        """
+        batch = [first]
+        self._drain(batch)
+        if len(batch) < self.batch_max and self.batch_wait > 0 and batch[-1] is not None:
+            await asyncio.sleep(self.batch_wait)
+            self._drain(batch)
+        if batch[-1] is None:
+            # 停止标记放回，当前批次写完后退出
+            batch.pop()
+            self._queue.put_nowait(None)
+        return batch
+
+    def _drain(self, batch):
+        while len(batch) < self.batch_max and batch[-1] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return
+
+    async def _run(self):
+        while True:
+            first = await self._queue.get()
+            if first is None:
+                return
+            batch = await self._collect(first)
+            now = time.perf_counter()
+            for _, _, queued_at in batch:
+                QUEUE_WAIT.observe(now - queued_at)
+            BATCH_SIZE.observe(len(batch))
+            try:
+                results = await repository.apply_process_group([data for data, _, _ in batch])
+            except Exception as e:
+                logger.exception("合并写入异常", extra={"items": len(batch)})
+                results = [e] * len(batch)
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {
+            "enabled": self._task is not None,
+            "size": self._queue.qsize() if self._queue is not None else 0,
+            "fallbacks": self.fallbacks,
+        }
+
+
+queue = WriteQueue(QUEUE_SIZE, BATCH_MAX, BATCH_WAIT)
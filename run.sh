@@ -4,11 +4,16 @@
 LOG_FILE="/home/user/product_api/api.log"
 echo "启动API服务: $(date)" > $LOG_FILE
 
-# 确保需要的包已安装
-echo "安装所需包..." >> $LOG_FILE
-python3 -m pip install --break-system-packages -r requirements.txt >> $LOG_FILE 2>&1
+# requirements.txt 有变化时才安装依赖（部署时一次），重启不再联网检查
+REQUIREMENTS_STAMP=".requirements.installed"
+if ! sha256sum -c --status "$REQUIREMENTS_STAMP" 2>/dev/null; then
+    echo "安装所需包..." >> $LOG_FILE
+    python3 -m pip install --break-system-packages -r requirements.txt >> $LOG_FILE 2>&1 \
+        && sha256sum requirements.txt > "$REQUIREMENTS_STAMP"
+fi
 
 # 切换到app目录并启动应用
 cd app
 echo "启动应用..." >> $LOG_FILE
-python3 -m uvicorn main:app --host 0.0.0.0 --port 8000 >> $LOG_FILE 2>&1
+# 多进程启动（serve.py），工作进程数默认 CPU 核数；访问日志由应用写入 logs/api.log
+exec python3 serve.py --host 0.0.0.0 --port 8000 >> $LOG_FILE 2>&1